@@ -0,0 +1,451 @@
+"""
+API HTTP (ASGI) da agenda pública, fora do modelo de sessão do Streamlit.
+
+Cada visitante da página pública custa uma sessão Streamlit inteira
+(websocket, session_state, reexecução do script) só para escolher um horário.
+Esta API expõe o mesmo fluxo em JSON para um widget estático / embed, usando
+os mesmos helpers (agenda_nucleo) e o mesmo cache (agenda_cache) da página.
+
+Sem framework: um callable ASGI puro. Rodar com qualquer servidor ASGI:
+
+    uvicorn agenda_api:app --workers 4 --port 8001
+
+Configuração: .streamlit/secrets.toml e/ou variáveis de ambiente (ver
+agenda_nucleo.ler_segredos). Extras desta API:
+    API_CORS_ORIGEM   origem liberada para o widget (padrão "*")
+    API_MAX_DIAS      maior intervalo aceito em /api/disponibilidade (padrão 31)
+
+Rotas:
+    GET  /api/saude
+    GET  /api/tenant/<tenant_id>
+    GET  /api/disponibilidade?tenant=<id>&de=YYYY-MM-DD&ate=YYYY-MM-DD&servicos=A,B&profissional=<id>
+    POST /api/reservar   {"tenant_id", "cliente", "data", "horario", "servicos": [...], "profissional"}
+                         header Idempotency-Key: <uuid> (um por reserva; repetir no retry)
+
+Com as edge functions fora, tenant e dias saem da última cópia boa com
+"desatualizado": true; sem cópia, 503 {"error": "unavailable"}.
+Consultas e reservas passam pelo limite por cliente (IP) e por tenant
+(agenda_nucleo.limitar): 429 {"error": "rate_limited"} com Retry-After.
+Atrás de proxy/balanceador, configurar TRUSTED_PROXIES (e PROXY_HOPS): sem
+isso o X-Forwarded-For é ignorado e o IP é o da conexão.
+"""
+import asyncio
+import json
+import math
+import urllib.parse
+import uuid
+from datetime import date, timedelta
+
+import agenda_metricas
+import agenda_nucleo
+from agenda_disponibilidade import hhmm_para_min, min_para_hhmm
+from agenda_nucleo import (
+    EdgeIndisponivel,
+    LimiteExcedido,
+    limitar,
+    agendamentos_bloqueantes_publico,
+    calcular_sinal,
+    calcular_total_servicos,
+    carregar_tenant_publico,
+    disponibilidade_publico,
+    montar_link_whatsapp,
+    montar_mensagem_pagamento_cliente,
+    normalizar_servicos,
+    nova_chave_idempotencia,
+    origem_requisicao,
+    parse_date_iso,
+    recursos_ativos,
+    reservar_horario_publico,
+    settings_get_buffer,
+    settings_get_capacity,
+    settings_get_deposit,
+    settings_get_durations,
+    settings_get_services,
+    settings_get_slot_calendar,
+)
+
+SEGREDOS = agenda_nucleo.ler_segredos()
+agenda_nucleo.configurar(SEGREDOS)
+# com --workers N, só o primeiro worker pega a porta (ver agenda_metricas)
+agenda_metricas.servir(agenda_nucleo.METRICAS_PORTA, agenda_nucleo.METRICAS_HOST)
+
+API_CORS_ORIGEM = str(SEGREDOS.get("API_CORS_ORIGEM", "*")).strip() or "*"
+API_MAX_DIAS = max(1, int(SEGREDOS.get("API_MAX_DIAS", 31)))
+MAX_CORPO_BYTES = 64 * 1024
+
+# erro do servidor de reserva -> status HTTP
+STATUS_ERRO_RESERVA = {
+    "slot_taken": 409,
+    "resource_not_found": 409,
+    "outside_hours": 409,
+    "tenant_blocked": 403,
+    "tenant_not_found": 404,
+    "invalid_payload": 400,
+    "rate_limited": 429,
+}
+
+
+class ErroApi(Exception):
+    def __init__(self, status: int, erro: str, detalhe: str = ""):
+        super().__init__(erro)
+        self.status = status
+        self.erro = erro
+        self.detalhe = detalhe
+
+
+# ============================================================
+# REGRAS (síncronas: rodam em thread, os helpers usam requests)
+# ============================================================
+def _tenant(tenant_id: str) -> dict:
+    try:
+        tenant = carregar_tenant_publico(tenant_id) if tenant_id else None
+    except EdgeIndisponivel:
+        raise ErroApi(503, "unavailable")
+    if not tenant:
+        raise ErroApi(404, "tenant_not_found")
+    return tenant
+
+
+def _settings(tenant: dict) -> dict:
+    return tenant.get("settings") if isinstance(tenant.get("settings"), dict) else {}
+
+
+def _whatsapp(tenant: dict) -> str:
+    num = (tenant.get("whatsapp_numero") or "").strip()
+    return num if len("".join(c for c in num if c.isdigit())) >= 10 else ""
+
+
+def resumo_tenant(tenant: dict) -> dict:
+    """O que o widget precisa para montar o formulário (sem dados de pagamento)."""
+    settings = _settings(tenant)
+    services_map = settings_get_services(settings)
+    durations = settings_get_durations(settings)
+    deposit_cfg = settings_get_deposit(settings)
+    nome = (tenant.get("nome") or "").strip()
+    if not nome or nome.lower() in ("minha loja", "minha agenda"):
+        nome = "Profissional"
+    return {
+        "id": str(tenant.get("id") or ""),
+        "nome": nome,
+        "pode_operar": bool(tenant.get("pode_operar", False)) and bool(_whatsapp(tenant)),
+        "servicos": [
+            {"nome": s, "valor": float(v), "duracao_min": int(durations.get(s, 0))}
+            for s, v in services_map.items()
+        ],
+        "sinal": {"ativo": bool(deposit_cfg["enabled"]), "valor": float(deposit_cfg["value"])},
+        "profissionais": [{"id": r["id"], "nome": r["nome"]} for r in recursos_ativos(settings)],
+        "capacidade": settings_get_capacity(settings),
+        "desatualizado": bool(tenant.get("desatualizado")),
+    }
+
+
+def horarios_do_dia(tenant: dict, d: date, servicos: list, recurso_id: str | None, origem: str | None = None) -> dict:
+    """
+    {"data", "motivo", "desatualizado", "horarios": [{"horario", "vagas", "profissional"}]}
+    de um dia. Ocupação ilegível (servidor fora, sem cópia) -> 503; passou
+    do limite -> 429.
+    """
+    settings = _settings(tenant)
+    calendario = settings_get_slot_calendar(settings)
+    if not calendario.slots_do_dia(d)[0]:
+        # fechado (folga, feriado, fora da semana): nem busca ocupação nem gasta ficha
+        return {"data": d.isoformat(), "motivo": calendario.motivo(d) or "", "desatualizado": False, "horarios": []}
+    recursos = recursos_ativos(settings)
+    try:
+        bloqueantes = agendamentos_bloqueantes_publico(str(tenant.get("id")), d, origem)
+    except LimiteExcedido as e:
+        raise ErroApi(429, "rate_limited", str(round(e.espera_seg, 1)))
+    try:
+        disp = disponibilidade_publico(
+            str(tenant.get("id")),
+            d,
+            calendario,
+            servicos,
+            settings_get_durations(settings),
+            settings_get_buffer(settings),
+            recursos,
+            settings_get_capacity(settings),
+            bloqueantes=bloqueantes,
+        )
+    except EdgeIndisponivel:
+        raise ErroApi(503, "unavailable", d.isoformat())
+    horarios = []
+    if disp is not None:
+        for m in disp.livres(recurso_id):
+            horarios.append({
+                "horario": min_para_hhmm(m),
+                "vagas": disp.vagas(m, recurso_id),
+                "profissional": recurso_id or (disp.atribuir(m) if len(recursos) > 1 else None) or None,
+            })
+    return {
+        "data": d.isoformat(),
+        "motivo": calendario.motivo(d) or "",
+        "desatualizado": bool(getattr(bloqueantes, "desatualizado", False)),
+        "horarios": horarios,
+    }
+
+
+def limitar_consulta(tenant: dict, origem: str | None):
+    """Uma ficha de "horarios" do cliente por consulta, seja de um dia ou de API_MAX_DIAS."""
+    try:
+        limitar("horarios", str(tenant.get("id")), origem, cota_tenant=False)
+    except LimiteExcedido as e:
+        raise ErroApi(429, "rate_limited", str(round(e.espera_seg, 1)))
+
+
+def _validar_servicos(settings: dict, servicos) -> list:
+    if isinstance(servicos, str):
+        servicos = servicos.split(",")
+    servicos = normalizar_servicos(servicos or [])
+    services_map = settings_get_services(settings)
+    desconhecidos = [s for s in servicos if s not in services_map]
+    if desconhecidos:
+        raise ErroApi(400, "invalid_service", ", ".join(desconhecidos))
+    return servicos
+
+
+def _validar_recurso(settings: dict, recurso_id) -> str | None:
+    recurso_id = str(recurso_id or "").strip() or None
+    if recurso_id and recurso_id not in {r["id"] for r in recursos_ativos(settings)}:
+        raise ErroApi(400, "resource_not_found")
+    return recurso_id
+
+
+def pedido_disponibilidade(params: dict) -> dict:
+    """Valida a consulta; os dias são calculados depois, um por thread."""
+    tenant = _tenant(params.get("tenant", ""))
+    if not resumo_tenant(tenant)["pode_operar"]:
+        raise ErroApi(403, "tenant_blocked")
+    settings = _settings(tenant)
+
+    hoje = date.today()
+    de = parse_date_iso(params.get("de")) or hoje
+    ate = parse_date_iso(params.get("ate")) or de
+    de = max(de, hoje)
+    if ate < de:
+        raise ErroApi(400, "invalid_range")
+    if (ate - de).days + 1 > API_MAX_DIAS:
+        raise ErroApi(400, "range_too_large", f"máximo {API_MAX_DIAS} dias")
+
+    servicos = _validar_servicos(settings, params.get("servicos", ""))
+    recurso_id = _validar_recurso(settings, params.get("profissional"))
+    dias = [de + timedelta(days=i) for i in range((ate - de).days + 1)]
+    return {"tenant": tenant, "servicos": servicos, "recurso_id": recurso_id, "dias": dias}
+
+
+def chave_idempotencia(cabecalho: str | None, corpo: dict) -> str:
+    """
+    Chave mandada pelo widget (header Idempotency-Key ou "idempotency_key" no
+    corpo): precisa ser um uuid. Sem chave, uma nova (vale só para esta chamada).
+    """
+    bruta = str(cabecalho or corpo.get("idempotency_key") or "").strip()
+    if not bruta:
+        return nova_chave_idempotencia()
+    try:
+        return str(uuid.UUID(bruta))
+    except ValueError:
+        raise ErroApi(400, "invalid_idempotency_key")
+
+
+def reservar(corpo: dict, origem: str | None = None, idempotency_key: str | None = None) -> tuple[int, dict]:
+    tenant = _tenant(str(corpo.get("tenant_id") or "").strip())
+    if not tenant.get("pode_operar", False):
+        raise ErroApi(403, "tenant_blocked")
+    whatsapp_num = _whatsapp(tenant)
+    if not whatsapp_num:
+        raise ErroApi(403, "tenant_sem_whatsapp")
+    settings = _settings(tenant)
+
+    cliente = str(corpo.get("cliente") or "").strip()
+    d = parse_date_iso(corpo.get("data"))
+    horario = str(corpo.get("horario") or "").strip()
+    servicos = _validar_servicos(settings, corpo.get("servicos"))
+    recurso_id = _validar_recurso(settings, corpo.get("profissional"))
+    if not cliente or not d or d < date.today() or not horario or not servicos:
+        raise ErroApi(400, "invalid_payload")
+
+    try:
+        horario = min_para_hhmm(hhmm_para_min(horario))
+    except Exception:
+        raise ErroApi(400, "invalid_payload")
+    # mesmo critério da página: só horários oferecidos (expediente + folga livre)
+    livres = {h["horario"] for h in horarios_do_dia(tenant, d, servicos, recurso_id, origem)["horarios"]}
+    if horario not in livres:
+        raise ErroApi(409, "slot_taken")
+
+    services_map = settings_get_services(settings)
+    deposit_cfg = settings_get_deposit(settings)
+    valor_sinal = calcular_sinal(servicos, deposit_cfg)
+
+    out = reservar_horario_publico(
+        str(tenant.get("id")),
+        cliente,
+        d,
+        horario,
+        servicos,
+        valor_sinal,
+        idempotency_key=chave_idempotencia(idempotency_key, corpo),
+        recurso_id=recurso_id,
+        origem=origem,
+    )
+    if not out.get("ok"):
+        erro = str(out.get("error") or "reserva_falhou")
+        detalhe = str(out.get("details") or "") if erro == "rate_limited" else ""
+        raise ErroApi(STATUS_ERRO_RESERVA.get(erro, 502), erro, detalhe)
+
+    ag = out.get("agendamento") if isinstance(out.get("agendamento"), dict) else {}
+    recursos = recursos_ativos(settings)
+    nomes = {r["id"]: r["nome"] for r in recursos}
+    recurso_final = ag.get("recurso_id") or recurso_id
+    mensagem = montar_mensagem_pagamento_cliente(
+        cliente,
+        d,
+        horario,
+        servicos,
+        valor_sinal,
+        pix_chave=(tenant.get("pix_chave") or "").strip(),
+        pix_nome=(tenant.get("pix_nome") or "Profissional").strip(),
+        pix_cidade=(tenant.get("pix_cidade") or "BRASIL").strip(),
+        services_map=services_map,
+        deposit_cfg=deposit_cfg,
+        profissional=nomes.get(recurso_final, "") if len(recursos) > 1 else "",
+    )
+    return 201, {
+        "ok": True,
+        "replay": bool(out.get("replay")),
+        "agendamento": {
+            "id": ag.get("id"),
+            "data": d.isoformat(),
+            "horario": horario,
+            "servicos": servicos,
+            "status": ag.get("status") or "pendente",
+            "profissional": recurso_final or None,
+            "total": calcular_total_servicos(servicos, services_map),
+            "sinal": valor_sinal,
+        },
+        "whatsapp_link": montar_link_whatsapp(whatsapp_num, mensagem),
+    }
+
+
+# ============================================================
+# ASGI
+# ============================================================
+def _cabecalhos(extra: dict | None = None):
+    h = {
+        "content-type": "application/json; charset=utf-8",
+        "cache-control": "no-store",
+        "access-control-allow-origin": API_CORS_ORIGEM,
+        "access-control-allow-methods": "GET, POST, OPTIONS",
+        "access-control-allow-headers": "content-type, idempotency-key",
+        "access-control-max-age": "600",
+    }
+    h.update(extra or {})
+    return [(k.encode("latin-1"), v.encode("latin-1")) for k, v in h.items()]
+
+
+async def _responder(send, status: int, corpo=None, extra: dict | None = None):
+    dados = b"" if corpo is None else json.dumps(corpo, ensure_ascii=False, default=str).encode("utf-8")
+    await send({"type": "http.response.start", "status": status, "headers": _cabecalhos(extra)})
+    await send({"type": "http.response.body", "body": dados})
+
+
+async def _ler_json(receive) -> dict:
+    partes, total = [], 0
+    while True:
+        msg = await receive()
+        if msg["type"] == "http.disconnect":
+            raise ErroApi(400, "disconnected")
+        corpo = msg.get("body", b"")
+        total += len(corpo)
+        if total > MAX_CORPO_BYTES:
+            raise ErroApi(413, "payload_too_large")
+        partes.append(corpo)
+        if not msg.get("more_body"):
+            break
+    try:
+        dados = json.loads(b"".join(partes) or b"{}")
+    except ValueError:
+        raise ErroApi(400, "invalid_json")
+    if not isinstance(dados, dict):
+        raise ErroApi(400, "invalid_json")
+    return dados
+
+
+def _cabecalho(scope, nome: bytes) -> str | None:
+    for k, v in scope.get("headers") or []:
+        if k == nome:
+            return v.decode("latin-1")
+    return None
+
+
+def _origem(scope) -> str:
+    """IP do cliente (agenda_nucleo.origem_requisicao): X-Forwarded-For só via proxy de confiança."""
+    saltos = [v.decode("latin-1") for k, v in scope.get("headers") or [] if k == b"x-forwarded-for"]
+    cliente = scope.get("client")
+    return origem_requisicao(cliente[0] if cliente else None, ", ".join(saltos))
+
+
+async def _rota(scope, receive):
+    metodo = scope["method"]
+    caminho = scope["path"].rstrip("/") or "/"
+    params = dict(urllib.parse.parse_qsl(scope.get("query_string", b"").decode("latin-1")))
+
+    if caminho == "/api/saude" and metodo == "GET":
+        return 200, {"ok": True}
+
+    if caminho.startswith("/api/tenant/") and metodo == "GET":
+        tenant_id = urllib.parse.unquote(caminho[len("/api/tenant/"):])
+        tenant = await asyncio.to_thread(_tenant, tenant_id)
+        return 200, resumo_tenant(tenant)
+
+    if caminho == "/api/disponibilidade" and metodo == "GET":
+        pedido = await asyncio.to_thread(pedido_disponibilidade, params)
+        await asyncio.to_thread(limitar_consulta, pedido["tenant"], _origem(scope))
+        # um dia por thread: as consultas de ocupação saem em paralelo (sem
+        # origem: dia sem cache gasta só a cota do tenant)
+        dias = await asyncio.gather(*(
+            asyncio.to_thread(horarios_do_dia, pedido["tenant"], d, pedido["servicos"], pedido["recurso_id"])
+            for d in pedido["dias"]
+        ))
+        return 200, {
+            "tenant_id": str(pedido["tenant"].get("id")),
+            "servicos": pedido["servicos"],
+            "profissional": pedido["recurso_id"],
+            "dias": dias,
+        }
+
+    if caminho == "/api/reservar" and metodo == "POST":
+        corpo = await _ler_json(receive)
+        return await asyncio.to_thread(reservar, corpo, _origem(scope), _cabecalho(scope, b"idempotency-key"))
+
+    raise ErroApi(404, "not_found")
+
+
+async def app(scope, receive, send):
+    if scope["type"] == "lifespan":
+        while True:
+            msg = await receive()
+            if msg["type"] == "lifespan.startup":
+                await send({"type": "lifespan.startup.complete"})
+            elif msg["type"] == "lifespan.shutdown":
+                await send({"type": "lifespan.shutdown.complete"})
+                return
+    if scope["type"] != "http":
+        return
+
+    if scope["method"] == "OPTIONS":
+        await _responder(send, 204)
+        return
+    extra = None
+    try:
+        status, corpo = await _rota(scope, receive)
+    except ErroApi as e:
+        status, corpo = e.status, {"ok": False, "error": e.erro, "details": e.detalhe}
+        if e.status == 429:
+            try:
+                extra = {"retry-after": str(max(1, math.ceil(float(e.detalhe))))}
+            except ValueError:
+                extra = {"retry-after": "1"}
+    except Exception as e:
+        status, corpo = 500, {"ok": False, "error": "internal", "details": type(e).__name__}
+    await _responder(send, status, corpo, extra)
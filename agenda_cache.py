@@ -0,0 +1,309 @@
+"""
+Cache compartilhado entre processos (vários Streamlit atrás de um balanceador).
+
+Duas camadas:
+  * frente: LRU em memória do processo (mais rápido, some no restart);
+  * fundo: backend plugável — SQLite em WAL num diretório local (padrão,
+    visto por todos os processos da máquina) ou só memória.
+
+Invalidação por namespace (ex.: "tenant:<id>", "agenda:<id>"): cada namespace
+tem um contador de versão num arquivo próprio, trocado por os.replace (inode
+novo a cada incremento). Ler a versão é um os.stat; a chave efetiva inclui a
+versão, então incrementar o contador "apaga" o namespace em todos os processos
+sem precisar avisar ninguém — entradas antigas só deixam de ser encontradas e
+expiram sozinhas.
+
+Valores são guardados como JSON: quem lê sempre recebe uma cópia nova (pode
+mexer no dict à vontade sem sujar o cache).
+"""
+import hashlib
+import json
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+
+import agenda_metricas
+
+MAX_ITENS_MEMORIA = 512
+LIMPEZA_SEG = 300
+
+
+def _agora() -> float:
+    return time.time()
+
+
+class LRU:
+    """LRU simples com expiração por item (thread-safe)."""
+
+    def __init__(self, max_itens: int = MAX_ITENS_MEMORIA):
+        self.max_itens = max(1, int(max_itens))
+        self._itens = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, chave: str):
+        it = self.item(chave)
+        return it[0] if it else None
+
+    def item(self, chave: str):
+        """(texto, expira) ou None se ausente/expirado."""
+        with self._lock:
+            it = self._itens.get(chave)
+            if it is None:
+                return None
+            if it[1] < _agora():
+                del self._itens[chave]
+                return None
+            self._itens.move_to_end(chave)
+            return it
+
+    def set(self, chave: str, texto: str, expira: float):
+        with self._lock:
+            self._itens[chave] = (texto, expira)
+            self._itens.move_to_end(chave)
+            while len(self._itens) > self.max_itens:
+                self._itens.popitem(last=False)
+
+    def limpar(self):
+        with self._lock:
+            self._itens.clear()
+
+
+# ============================================================
+# BACKENDS (camada compartilhada)
+# Interface: get(chave) -> (texto, expira) | None ; set(chave, texto, expira)
+# ============================================================
+class BackendMemoria:
+    """Sem disco: só o processo atual (útil em dev / um processo só)."""
+
+    def __init__(self):
+        self._lru = LRU(MAX_ITENS_MEMORIA * 4)
+
+    def get(self, chave: str):
+        return self._lru.item(chave)
+
+    def set(self, chave: str, texto: str, expira: float):
+        self._lru.set(chave, texto, expira)
+
+
+class BackendSQLite:
+    """Tabela chave/valor num arquivo SQLite em WAL (leitores não bloqueiam o escritor)."""
+
+    def __init__(self, caminho: str):
+        self.caminho = caminho
+        self._local = threading.local()
+        self._ultima_limpeza = 0.0
+        con = self._con()
+        con.execute("pragma journal_mode=wal")
+        con.execute(
+            "create table if not exists cache ("
+            " chave text primary key, valor text not null, expira real not null)"
+        )
+        con.execute("create index if not exists cache_expira on cache (expira)")
+        con.commit()
+
+    def _con(self):
+        con = getattr(self._local, "con", None)
+        if con is None:
+            con = sqlite3.connect(self.caminho, timeout=5, isolation_level=None, check_same_thread=False)
+            con.execute("pragma synchronous=normal")
+            con.execute("pragma busy_timeout=5000")
+            self._local.con = con
+        return con
+
+    def get(self, chave: str):
+        try:
+            row = self._con().execute(
+                "select valor, expira from cache where chave = ? and expira >= ?", (chave, _agora())
+            ).fetchone()
+        except sqlite3.Error:
+            return None
+        return tuple(row) if row else None
+
+    def set(self, chave: str, texto: str, expira: float):
+        try:
+            con = self._con()
+            con.execute(
+                "insert into cache (chave, valor, expira) values (?, ?, ?)"
+                " on conflict(chave) do update set valor = excluded.valor, expira = excluded.expira",
+                (chave, texto, expira),
+            )
+            agora = _agora()
+            if agora - self._ultima_limpeza > LIMPEZA_SEG:
+                self._ultima_limpeza = agora
+                con.execute("delete from cache where expira < ?", (agora,))
+        except sqlite3.Error:
+            pass
+
+
+# ============================================================
+# VERSÕES por namespace (arquivos)
+# ============================================================
+class VersoesArquivo:
+    def __init__(self, diretorio: str):
+        self.diretorio = diretorio
+        os.makedirs(diretorio, exist_ok=True)
+        self._vistos = {}
+        self._lock = threading.Lock()
+
+    def _caminho(self, ns: str) -> str:
+        nome = hashlib.sha1(ns.encode("utf-8")).hexdigest()[:20]
+        return os.path.join(self.diretorio, f"{nome}.v")
+
+    def versao(self, ns: str) -> int:
+        caminho = self._caminho(ns)
+        try:
+            stt = os.stat(caminho)
+        except FileNotFoundError:
+            return 0
+        assinatura = (stt.st_ino, stt.st_mtime_ns, stt.st_size)
+        with self._lock:
+            visto = self._vistos.get(ns)
+            if visto and visto[0] == assinatura:
+                return visto[1]
+        try:
+            with open(caminho, encoding="ascii") as f:
+                v = int(f.read().strip() or 0)
+        except (OSError, ValueError):
+            v = 0
+        with self._lock:
+            self._vistos[ns] = (assinatura, v)
+        return v
+
+    def incrementar(self, ns: str) -> int:
+        caminho = self._caminho(ns)
+        # base no maior entre o arquivo e o relógio: dois processos que
+        # incrementam juntos ainda geram uma versão diferente da anterior
+        novo = max(self.versao(ns) + 1, time.time_ns())
+        fd, tmp = tempfile.mkstemp(dir=self.diretorio, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "w", encoding="ascii") as f:
+                f.write(str(novo))
+            os.replace(tmp, caminho)
+        except OSError:
+            try:
+                os.unlink(tmp)
+            except OSError:
+                pass
+        return novo
+
+
+class VersoesMemoria:
+    def __init__(self):
+        self._v = {}
+        self._lock = threading.Lock()
+
+    def versao(self, ns: str) -> int:
+        return self._v.get(ns, 0)
+
+    def incrementar(self, ns: str) -> int:
+        with self._lock:
+            self._v[ns] = self._v.get(ns, 0) + 1
+            return self._v[ns]
+
+
+# ============================================================
+# FRENTE
+# ============================================================
+class CacheCompartilhado:
+    def __init__(self, backend, versoes, max_itens: int = MAX_ITENS_MEMORIA):
+        self.backend = backend
+        self.versoes = versoes
+        self.frente = LRU(max_itens)
+
+    def _chave(self, ns: str, chave: str) -> str:
+        return f"{ns}|{self.versoes.versao(ns)}|{chave}"
+
+    def get(self, ns: str, chave: str):
+        """Valor (cópia) ou None se ausente/expirado/invalidado."""
+        k = self._chave(ns, chave)
+        texto = self.frente.get(k)
+        if texto is None:
+            it = self.backend.get(k)
+            if it is None:
+                return None
+            texto, expira = it
+            # segura pouco tempo (outro processo pode invalidar), nunca além da validade
+            self.frente.set(k, texto, min(expira, _agora() + 5))
+        return json.loads(texto)
+
+    def set(self, ns: str, chave: str, valor, ttl_seg: float):
+        if ttl_seg <= 0:
+            return
+        k = self._chave(ns, chave)
+        texto = json.dumps(valor, separators=(",", ":"), default=str)
+        expira = _agora() + float(ttl_seg)
+        self.frente.set(k, texto, expira)
+        self.backend.set(k, texto, expira)
+
+    def obter(self, ns: str, chave: str, ttl_seg: float, carregar):
+        """Get-or-load. `carregar()` devolvendo None não é guardado (erro/ausente)."""
+        valor = self.get(ns, chave)
+        agenda_metricas.contar_cache(ns, valor is not None)
+        if valor is not None:
+            return valor
+        valor = carregar()
+        if valor is not None:
+            self.set(ns, chave, valor, ttl_seg)
+            return json.loads(json.dumps(valor, default=str))
+        return None
+
+    def invalidar(self, ns: str):
+        self.versoes.incrementar(ns)
+
+
+class CacheDesligado:
+    """Mesma interface, sem guardar nada."""
+
+    def get(self, ns, chave):
+        return None
+
+    def set(self, ns, chave, valor, ttl_seg):
+        pass
+
+    def obter(self, ns, chave, ttl_seg, carregar):
+        agenda_metricas.contar_cache(ns, False)
+        return carregar()
+
+    def invalidar(self, ns):
+        pass
+
+
+_CACHES = {}
+_CACHES_LOCK = threading.Lock()
+
+
+def cache_compartilhado(backend: str = "disco", diretorio: str | None = None):
+    """
+    Instância única por processo para (backend, diretório).
+    backend: "disco" (SQLite + versões em arquivo), "memoria" ou "off".
+    """
+    backend = (backend or "disco").strip().lower()
+    diretorio = diretorio or os.path.join(tempfile.gettempdir(), "unhas_cache")
+    key = (backend, diretorio)
+    with _CACHES_LOCK:
+        c = _CACHES.get(key)
+        if c is not None:
+            return c
+        if backend == "off":
+            c = CacheDesligado()
+        elif backend == "memoria":
+            c = CacheCompartilhado(BackendMemoria(), VersoesMemoria())
+        else:
+            try:
+                os.makedirs(diretorio, exist_ok=True)
+                c = CacheCompartilhado(
+                    BackendSQLite(os.path.join(diretorio, "cache.sqlite3")),
+                    VersoesArquivo(os.path.join(diretorio, "versoes")),
+                )
+            except (OSError, sqlite3.Error):
+                c = CacheCompartilhado(BackendMemoria(), VersoesMemoria())
+        _CACHES[key] = c
+        return c
+
+
+def hash_token(token: str) -> str:
+    """Chave para cachear algo por token sem gravar o token em disco."""
+    return hashlib.sha256((token or "").encode("utf-8")).hexdigest()
@@ -0,0 +1,107 @@
+"""
+Disjuntor (circuit breaker) por endpoint.
+
+Cada endpoint externo (edge functions / RPCs públicas) tem um disjuntor no
+processo. Conta falhas seguidas — erro de rede, 5xx e também resposta lenta
+(acima de `lento_seg`, mesmo que tenha dado certo) — e, ao chegar em
+`falhas_max`, abre: durante `aberto_seg` toda chamada falha na hora
+(CircuitoAberto), sem esperar timeout. Passado esse tempo fica meio-aberto:
+uma chamada de teste passa; se der certo fecha, se falhar abre de novo.
+
+Só o processo atual conta (cada processo descobre a queda sozinho em poucas
+chamadas); o último valor bom para servir enquanto isso fica no cache
+compartilhado, por conta de quem chama.
+"""
+import threading
+import time
+
+FECHADO = "fechado"
+ABERTO = "aberto"
+MEIO_ABERTO = "meio_aberto"
+
+
+class CircuitoAberto(Exception):
+    """Chamada recusada sem tentar: o endpoint está fora (disjuntor aberto)."""
+
+
+class Disjuntor:
+    def __init__(self, nome: str, falhas_max: int = 3, lento_seg: float = 3.0, aberto_seg: float = 30.0):
+        self.nome = nome
+        self.falhas_max = max(1, int(falhas_max))
+        self.lento_seg = float(lento_seg)
+        self.aberto_seg = float(aberto_seg)
+        self._falhas = 0
+        self._aberto_ate = 0.0
+        self._testando = False
+        self._lock = threading.Lock()
+
+    @property
+    def estado(self) -> str:
+        with self._lock:
+            return self._estado()
+
+    def _estado(self) -> str:
+        if self._falhas < self.falhas_max:
+            return FECHADO
+        return ABERTO if time.monotonic() < self._aberto_ate else MEIO_ABERTO
+
+    def permitir(self) -> bool:
+        """True se a chamada pode ir (no meio-aberto, só uma de teste por vez)."""
+        with self._lock:
+            estado = self._estado()
+            if estado == FECHADO:
+                return True
+            if estado == MEIO_ABERTO and not self._testando:
+                self._testando = True
+                return True
+            return False
+
+    def registrar(self, ok: bool, duracao_seg: float = 0.0):
+        """Resultado de uma chamada permitida; lenta conta como falha."""
+        with self._lock:
+            self._testando = False
+            if ok and duracao_seg <= self.lento_seg:
+                self._falhas = 0
+                return
+            self._falhas += 1
+            if self._falhas >= self.falhas_max:
+                self._aberto_ate = time.monotonic() + self.aberto_seg
+
+    def chamar(self, fn, *args, **kwargs):
+        """
+        Executa fn sob o disjuntor. Exceção de fn conta como falha e sobe;
+        aberto: CircuitoAberto sem chamar fn.
+        """
+        if not self.permitir():
+            raise CircuitoAberto(self.nome)
+        inicio = time.monotonic()
+        try:
+            out = fn(*args, **kwargs)
+        except Exception:
+            self.registrar(False, time.monotonic() - inicio)
+            raise
+        self.registrar(True, time.monotonic() - inicio)
+        return out
+
+
+_DISJUNTORES = {}
+_DISJUNTORES_LOCK = threading.Lock()
+
+
+def disjuntor(nome: str, **config) -> Disjuntor:
+    """Instância única por nome no processo (config vale na criação e é atualizada depois)."""
+    with _DISJUNTORES_LOCK:
+        d = _DISJUNTORES.get(nome)
+        if d is None:
+            d = _DISJUNTORES[nome] = Disjuntor(nome, **config)
+        else:
+            for k, v in config.items():
+                setattr(d, k, max(1, int(v)) if k == "falhas_max" else float(v))
+        return d
+
+
+def estados() -> dict:
+    """{nome: estado} de todos os disjuntores do processo."""
+    with _DISJUNTORES_LOCK:
+        itens = list(_DISJUNTORES.items())
+    return {nome: d.estado for nome, d in itens}
@@ -0,0 +1,539 @@
+"""
+Motor de disponibilidade da agenda (sem Streamlit / sem rede).
+
+Tudo em minutos desde 00:00. Um agendamento ocupa [início, início + duração + intervalo).
+Serviço sem duração cadastrada ocupa só o próprio horário de início (DURACAO_PONTO),
+que é exatamente o comportamento antigo de "horário igual = ocupado".
+"""
+import csv
+import json
+import os
+from array import array
+from bisect import bisect_left, bisect_right, insort
+from datetime import date, timedelta
+from functools import lru_cache
+
+DURACAO_PONTO = 1
+FIM_DO_DIA = 24 * 60
+MAX_DIAS_EXCECAO = 400
+FERIADOS_CSV = os.path.join(os.path.dirname(os.path.abspath(__file__)), "feriados_br.csv")
+
+
+def hhmm_para_min(h) -> int | None:
+    try:
+        hh, mm = str(h).strip().split(":")[:2]
+        hh, mm = int(hh), int(mm)
+    except Exception:
+        return None
+    if 0 <= hh <= 23 and 0 <= mm <= 59:
+        return hh * 60 + mm
+    return None
+
+
+def min_para_hhmm(m: int) -> str:
+    return f"{int(m) // 60:02d}:{int(m) % 60:02d}"
+
+
+def duracao_servicos(servicos, duracoes: dict) -> int:
+    """Soma das durações (min) dos serviços; sem nada cadastrado = DURACAO_PONTO."""
+    total = 0
+    for s in servicos or []:
+        try:
+            total += max(0, int(duracoes.get(str(s).strip(), 0) or 0))
+        except Exception:
+            continue
+    return total if total > 0 else DURACAO_PONTO
+
+
+class IndiceIntervalos:
+    """
+    Intervalos [início, fim) com inícios e fins em listas ordenadas separadas.
+
+    Quantos intervalos cruzam [a, b) = #(início < b) - #(fim <= a): duas buscas
+    binárias, O(log n). Para vários candidatos em ordem crescente, `livres()`
+    faz uma busca binária no primeiro e depois só avança os ponteiros:
+    O(log n + k + m), m = intervalos dentro da janela consultada.
+    """
+
+    __slots__ = ("_inicios", "_fins")
+
+    def __init__(self, intervalos=()):
+        pares = [(int(a), int(b)) for a, b in intervalos if int(b) > int(a)]
+        self._inicios = sorted(a for a, _ in pares)
+        self._fins = sorted(b for _, b in pares)
+
+    def __len__(self):
+        return len(self._inicios)
+
+    def adicionar(self, inicio: int, fim: int):
+        if fim > inicio:
+            insort(self._inicios, int(inicio))
+            insort(self._fins, int(fim))
+
+    def sobrepostos(self, a: int, b: int) -> int:
+        return bisect_left(self._inicios, b) - bisect_right(self._fins, a)
+
+    def ocupacao(self, candidatos, duracao: int):
+        """Para cada candidato (min, ordem crescente): quantos intervalos cruzam [c, c + duracao)."""
+        duracao = max(DURACAO_PONTO, int(duracao))
+        ini, fim = self._inicios, self._fins
+        n = len(ini)
+        out = []
+        i = j = None
+        for c in candidatos:
+            a, b = int(c), int(c) + duracao
+            if i is None:
+                i = bisect_left(ini, b)
+                j = bisect_right(fim, a)
+            else:
+                while i < n and ini[i] < b:
+                    i += 1
+                while j < n and fim[j] <= a:
+                    j += 1
+            out.append(i - j)
+        return out
+
+    def livres(self, candidatos, duracao: int, capacidade: int = 1):
+        """Candidatos (min, ordem crescente) onde [c, c + duracao) cabe sem passar da capacidade."""
+        capacidade = max(1, int(capacidade))
+        candidatos = list(candidatos)
+        return [c for c, q in zip(candidatos, self.ocupacao(candidatos, duracao)) if q < capacidade]
+
+
+def indice_do_dia(agendamentos, duracoes: dict, intervalo_min: int = 0) -> IndiceIntervalos:
+    """
+    Monta o índice a partir das linhas que bloqueiam o dia
+    ({"horario": "HH:MM", "servico": "A + B", ...}). Linhas agregadas
+    trazem "qtd" (quantos agendamentos iguais) e entram qtd vezes.
+    """
+    intervalo_min = max(0, int(intervalo_min or 0))
+    pares = []
+    for r in agendamentos or []:
+        inicio = hhmm_para_min(r.get("horario"))
+        if inicio is None:
+            continue
+        servicos = [p.strip() for p in str(r.get("servico") or "").split("+") if p.strip()]
+        par = (inicio, inicio + duracao_servicos(servicos, duracoes) + intervalo_min)
+        try:
+            qtd = max(1, int(r.get("qtd") or 1))
+        except Exception:
+            qtd = 1
+        pares.extend([par] * qtd)
+    return IndiceIntervalos(pares)
+
+
+def slots_livres(indice: IndiceIntervalos, inicios, limites, duracao: int, intervalo_min: int = 0, capacidade: int = 1):
+    """
+    Inícios (min) do dia onde o atendimento cabe: termina até o fim da faixa
+    de trabalho do slot (limites) e não passa da capacidade no índice.
+    O intervalo após o atendimento conta para colisão, não para o fim da faixa.
+    """
+    duracao = max(DURACAO_PONTO, int(duracao))
+    cabem = [c for c, lim in zip(inicios, limites) if c + duracao <= lim]
+    return indice.livres(cabem, duracao + max(0, int(intervalo_min or 0)), capacidade)
+
+
+# ============================================================
+# CALENDÁRIO DE SLOTS (regras -> array('H') por dia da semana)
+#
+# settings["working_rules"] = {
+#   "enabled": true,
+#   "step": 30,
+#   "days": {"0": [["09:00", "12:00"], ["13:00", "18:00"]], ..., "6": []}
+# }
+# Sem regras ativas, a lista explícita de settings["working_hours"] vira o
+# calendário (sem fim de faixa: limite = FIM_DO_DIA).
+# ============================================================
+class CalendarioSlots:
+    """
+    Slots por dia da semana (inícios e fim da faixa de cada slot, em minutos)
+    + índice de exceções por data (date.toordinal() -> slots do dia; vazio = fechado).
+    """
+
+    __slots__ = ("inicios", "limites", "excecoes", "motivos")
+
+    def __init__(self, inicios, limites, excecoes=None, motivos=None):
+        self.inicios = inicios
+        self.limites = limites
+        self.excecoes = excecoes or {}
+        self.motivos = motivos or {}
+
+    def slots_da_semana(self, weekday: int):
+        return self.inicios[weekday], self.limites[weekday]
+
+    def slots_do_dia(self, d):
+        override = self.excecoes.get(d.toordinal())
+        if override is not None:
+            return override
+        return self.slots_da_semana(d.weekday())
+
+    def motivo(self, d) -> str:
+        """Por que o dia foge da semana padrão ('' se não foge)."""
+        return self.motivos.get(d.toordinal(), "")
+
+
+def faixas_validas(faixas):
+    """[["09:00","12:00"], ...] -> [(540, 720), ...] ordenadas; ignora faixas inválidas."""
+    out = []
+    for f in faixas or []:
+        try:
+            a, b = hhmm_para_min(f[0]), hhmm_para_min(f[1])
+        except Exception:
+            continue
+        if a is None or b is None or b <= a:
+            continue
+        out.append((a, b))
+    return sorted(out)
+
+
+def _slots_de_faixas(faixas, step: int):
+    ini, lim = array("H"), array("H")
+    for a, b in faixas_validas(faixas):
+        t = a
+        while t + step <= b:
+            if not ini or t > ini[-1]:
+                ini.append(t)
+                lim.append(b)
+            t += step
+    return ini, lim
+
+
+def _compilar_regras(regras: dict) -> CalendarioSlots:
+    step = max(5, int(regras.get("step") or 30))
+    days = regras.get("days") or {}
+    inicios, limites = [], []
+    for wd in range(7):
+        ini, lim = _slots_de_faixas(days.get(str(wd)), step)
+        inicios.append(ini)
+        limites.append(lim)
+    return CalendarioSlots(tuple(inicios), tuple(limites))
+
+
+def _compilar_lista(working_hours: dict) -> CalendarioSlots:
+    inicios, limites = [], []
+    for wd in range(7):
+        mins = sorted({m for m in (hhmm_para_min(h) for h in working_hours.get(str(wd), [])) if m is not None})
+        inicios.append(array("H", mins))
+        limites.append(array("H", [FIM_DO_DIA] * len(mins)))
+    return CalendarioSlots(tuple(inicios), tuple(limites))
+
+
+# ============================================================
+# EXCEÇÕES POR DATA (folgas, férias, horário especial, feriados)
+#
+# settings["date_exceptions"] = {
+#   "fechar_feriados": true,
+#   "itens": [
+#     {"de": "2026-12-24", "ate": "2026-12-24", "faixas": []},                  # fechado
+#     {"de": "2027-01-05", "ate": "2027-01-20", "faixas": []},                  # férias
+#     {"de": "2026-11-08", "ate": "2026-11-08", "faixas": [["09:00","13:00"]]}, # domingo extra
+#   ]
+# }
+# Itens mais curtos vencem os mais longos (um dia especial dentro das férias),
+# e qualquer item vence o feriado.
+# ============================================================
+@lru_cache(maxsize=1)
+def feriados_nacionais():
+    """{date.toordinal(): nome} a partir da tabela feriados_br.csv."""
+    out = {}
+    try:
+        with open(FERIADOS_CSV, encoding="utf-8") as f:
+            for row in csv.DictReader(f):
+                try:
+                    out[date.fromisoformat(row["data"]).toordinal()] = row["nome"]
+                except Exception:
+                    continue
+    except OSError:
+        pass
+    return out
+
+
+def _compilar_excecoes(cfg: dict, step: int):
+    excecoes, motivos = {}, {}
+    fechado = (array("H"), array("H"))
+
+    if cfg.get("fechar_feriados"):
+        for ordinal, nome in feriados_nacionais().items():
+            excecoes[ordinal] = fechado
+            motivos[ordinal] = f"Feriado: {nome}"
+
+    itens = []
+    for it in cfg.get("itens") or []:
+        try:
+            de = date.fromisoformat(str(it.get("de")))
+            ate = date.fromisoformat(str(it.get("ate") or it.get("de")))
+        except Exception:
+            continue
+        if ate < de:
+            de, ate = ate, de
+        dias = min((ate - de).days + 1, MAX_DIAS_EXCECAO)
+        itens.append((dias, de, it.get("faixas") or []))
+
+    for dias, de, faixas in sorted(itens, key=lambda x: -x[0]):
+        slots = _slots_de_faixas(faixas, step) if faixas else fechado
+        motivo = "Horário especial" if faixas else ("Férias" if dias > 1 else "Fechado")
+        base = de.toordinal()
+        for k in range(dias):
+            excecoes[base + k] = slots
+            motivos[base + k] = motivo
+    return excecoes, motivos
+
+
+@lru_cache(maxsize=512)
+def _calendario_cache(versao: str) -> CalendarioSlots:
+    cfg = json.loads(versao)
+    regras = cfg.get("working_rules")
+    if isinstance(regras, dict) and regras.get("enabled"):
+        cal = _compilar_regras(regras)
+        step = max(5, int(regras.get("step") or 30))
+    else:
+        cal = _compilar_lista(cfg.get("working_hours") or {})
+        step = 30
+    cal.excecoes, cal.motivos = _compilar_excecoes(cfg.get("date_exceptions") or {}, step)
+    return cal
+
+
+def calendario_slots(
+    working_hours: dict,
+    working_rules: dict | None = None,
+    date_exceptions: dict | None = None,
+) -> CalendarioSlots:
+    """
+    Calendário compilado, reaproveitado enquanto a configuração de horários
+    não mudar (a "versão" é o JSON canônico dessa parte dos settings).
+    """
+    versao = json.dumps(
+        {
+            "working_hours": working_hours or {},
+            "working_rules": working_rules or {},
+            "date_exceptions": date_exceptions or {},
+        },
+        sort_keys=True,
+        separators=(",", ":"),
+    )
+    return _calendario_cache(versao)
+
+
+def proximos_feriados(a_partir, n: int = 5):
+    """[(date, nome), ...] dos próximos n feriados nacionais."""
+    base = a_partir.toordinal()
+    prox = sorted((o, nome) for o, nome in feriados_nacionais().items() if o >= base)[:n]
+    return [(date.fromordinal(o), nome) for o, nome in prox]
+
+
+# ============================================================
+# RECURSOS (profissionais / cadeiras) -> bitmap por recurso no dia
+#
+# settings["resources"] = [{"id": "a1b2c3d4", "nome": "Ana", "ativo": true}, ...]
+# Bit i do mapa de um recurso = slot i do dia livre para a duração pedida.
+# "Qualquer profissional" = OR dos mapas; atribuir um slot = primeiro recurso
+# (na ordem cadastrada) com o bit ligado.
+# Agendamento sem recurso_id (antigo, ou tenant sem recursos) conta para o
+# primeiro recurso ativo: era a agenda única do tenant.
+# Com capacidade > 1 (settings["slot_capacity"]) cada recurso aceita até N
+# atendimentos simultâneos; o bit fica ligado enquanto sobrar vaga, e as
+# vagas restantes por slot ficam em `vagas`.
+# ============================================================
+def primeiro_bit(mapa: int) -> int:
+    """Índice do bit ligado mais baixo (find-first-set); -1 se vazio."""
+    return (mapa & -mapa).bit_length() - 1
+
+
+def bits_para_indices(mapa: int):
+    out = []
+    while mapa:
+        low = mapa & -mapa
+        out.append(low.bit_length() - 1)
+        mapa ^= low
+    return out
+
+
+class DisponibilidadeRecursos:
+    """
+    Mapas de bits do dia, um por recurso, sobre os mesmos slots (`inicios`).
+    `ids` na ordem de atribuição; "" = agenda única (tenant sem recursos).
+    """
+
+    __slots__ = ("inicios", "ids", "mapas", "qualquer", "capacidade", "_vagas", "_pos")
+
+    def __init__(self, inicios, ids, mapas, vagas=None, capacidade: int = 1):
+        self.inicios = inicios
+        self.ids = tuple(ids)
+        self.mapas = tuple(mapas)
+        self.capacidade = max(1, int(capacidade))
+        self._vagas = tuple(vagas) if vagas is not None else tuple({} for _ in self.ids)
+        q = 0
+        for m in self.mapas:
+            q |= m
+        self.qualquer = q
+        self._pos = {rid: k for k, rid in enumerate(self.ids)}
+
+    def mapa(self, recurso_id: str | None = None) -> int:
+        if not recurso_id:
+            return self.qualquer
+        k = self._pos.get(str(recurso_id))
+        return self.mapas[k] if k is not None else 0
+
+    def livres(self, recurso_id: str | None = None):
+        """Inícios livres (min) para o recurso, ou para qualquer um."""
+        return [self.inicios[i] for i in bits_para_indices(self.mapa(recurso_id))]
+
+    def _indice(self, minuto: int) -> int:
+        i = bisect_left(self.inicios, minuto)
+        if i >= len(self.inicios) or self.inicios[i] != minuto:
+            return -1
+        return i
+
+    def vagas(self, minuto: int, recurso_id: str | None = None) -> int:
+        """Vagas restantes no slot: do recurso, ou somadas entre todos."""
+        i = self._indice(minuto)
+        if i < 0:
+            return 0
+        if recurso_id:
+            k = self._pos.get(str(recurso_id))
+            return self._vagas[k].get(i, 0) if k is not None else 0
+        return sum(v.get(i, 0) for v in self._vagas)
+
+    def atribuir(self, minuto: int) -> str | None:
+        """Primeiro recurso livre no slot que começa em `minuto` (None se nenhum)."""
+        i = self._indice(minuto)
+        if i < 0:
+            return None
+        coluna = 0
+        for k, m in enumerate(self.mapas):
+            coluna |= ((m >> i) & 1) << k
+        k = primeiro_bit(coluna)
+        return self.ids[k] if k >= 0 else None
+
+
+def disponibilidade_recursos(
+    agendamentos,
+    recursos_ids,
+    inicios,
+    limites,
+    duracao: int,
+    duracoes: dict,
+    intervalo_min: int = 0,
+    capacidade: int = 1,
+) -> DisponibilidadeRecursos:
+    """
+    Um índice de intervalos por recurso (agendamentos agrupados por recurso_id)
+    e, para cada um, o mapa dos slots onde o atendimento cabe sem passar da
+    capacidade + as vagas que sobram em cada um desses slots.
+    """
+    ids = [str(r) for r in recursos_ids if r] or [""]
+    padrao = ids[0]
+    por_recurso = {rid: [] for rid in ids}
+    for r in agendamentos or []:
+        rid = str(r.get("recurso_id") or padrao)
+        if rid in por_recurso:
+            por_recurso[rid].append(r)
+
+    duracao = max(DURACAO_PONTO, int(duracao))
+    intervalo_min = max(0, int(intervalo_min or 0))
+    capacidade = max(1, int(capacidade or 1))
+    cabem = [(i, c) for i, (c, lim) in enumerate(zip(inicios, limites)) if c + duracao <= lim]
+    candidatos = [c for _, c in cabem]
+
+    mapas, vagas = [], []
+    for rid in ids:
+        indice = indice_do_dia(por_recurso[rid], duracoes, intervalo_min)
+        m = 0
+        restantes = {}
+        for (i, _), q in zip(cabem, indice.ocupacao(candidatos, duracao + intervalo_min)):
+            if q < capacidade:
+                m |= 1 << i
+                restantes[i] = capacidade - q
+        mapas.append(m)
+        vagas.append(restantes)
+    return DisponibilidadeRecursos(inicios, ids, mapas, vagas, capacidade)
+
+
+# ============================================================
+# RECORRÊNCIA (clientes fixos)
+#
+# Uma linha de agendamentos_recorrentes = uma regra:
+#   {"id": 7, "cliente": "Ana", "servico": "Pé + Mão", "horario": "09:00",
+#    "recurso_id": null, "freq": "semanal" | "quinzenal" | "mensal",
+#    "inicio": "2026-10-20", "fim": null, "excecoes": ["2026-12-22"], "ativo": true}
+# Nada de ocorrência gravada: `ocorre_em` responde em O(1) para uma data e
+# `expandir` gera só as ocorrências da janela consultada, no mesmo formato
+# das linhas de agendamento (entram direto em indice_do_dia).
+# "mensal" repete no mesmo dia do mês; em mês mais curto, no último dia.
+# ============================================================
+FREQUENCIAS = {"semanal": 7, "quinzenal": 14, "mensal": 0}
+
+
+def _data(v):
+    if isinstance(v, date):
+        return v
+    try:
+        return date.fromisoformat(str(v)[:10])
+    except Exception:
+        return None
+
+
+def _ultimo_dia_do_mes(d) -> int:
+    prox = date(d.year + (d.month == 12), d.month % 12 + 1, 1)
+    return (prox - timedelta(days=1)).day
+
+
+def ocorre_em(regra: dict, d) -> bool:
+    if not regra.get("ativo", True):
+        return False
+    inicio, fim = _data(regra.get("inicio")), _data(regra.get("fim"))
+    if inicio is None or d < inicio or (fim is not None and d > fim):
+        return False
+    if d.isoformat() in (regra.get("excecoes") or ()):
+        return False
+    passo = FREQUENCIAS.get(regra.get("freq"), 7)
+    if passo:
+        return (d - inicio).days % passo == 0
+    return d.day == min(inicio.day, _ultimo_dia_do_mes(d))
+
+
+def ocorrencias(regra: dict, de, ate):
+    """Datas da regra em [de, ate], sem percorrer dia a dia."""
+    inicio, fim = _data(regra.get("inicio")), _data(regra.get("fim"))
+    if inicio is None or not regra.get("ativo", True):
+        return
+    de = max(de, inicio)
+    if fim is not None:
+        ate = min(ate, fim)
+    if ate < de:
+        return
+    pular = set(regra.get("excecoes") or ())
+    passo = FREQUENCIAS.get(regra.get("freq"), 7)
+    if passo:
+        d = de + timedelta(days=(-(de - inicio).days) % passo)
+        while d <= ate:
+            if d.isoformat() not in pular:
+                yield d
+            d += timedelta(days=passo)
+    else:
+        ano, mes = de.year, de.month
+        while date(ano, mes, 1) <= ate:
+            primeiro = date(ano, mes, 1)
+            d = primeiro.replace(day=min(inicio.day, _ultimo_dia_do_mes(primeiro)))
+            if de <= d <= ate and d.isoformat() not in pular:
+                yield d
+            ano, mes = ano + (mes == 12), mes % 12 + 1
+
+
+def expandir_recorrentes(regras, de, ate):
+    """Ocorrências das regras em [de, ate] como linhas de agendamento."""
+    out = []
+    for r in regras or []:
+        for d in ocorrencias(r, de, ate):
+            out.append({
+                "recorrente_id": r.get("id"),
+                "cliente": r.get("cliente"),
+                "data": d.isoformat(),
+                "horario": r.get("horario"),
+                "servico": r.get("servico"),
+                "recurso_id": r.get("recurso_id"),
+                "valor": r.get("valor") or 0,
+                "status": "recorrente",
+            })
+    out.sort(key=lambda x: (x["data"], str(x["horario"])))
+    return out
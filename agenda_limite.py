@@ -0,0 +1,142 @@
+"""
+Limite de uso (token bucket) das ações públicas.
+
+Cada balde tem `capacidade` fichas e ganha `taxa_seg` fichas por segundo até
+encher; cada ação tira uma. Sem ficha, a ação é recusada e quem chamou recebe
+quanto tempo falta para a próxima.
+
+Backends (mesma ideia do agenda_cache):
+  * "disco": SQLite em WAL no diretório do cache, visto por todos os processos
+    da máquina (vários workers contam no mesmo balde). Ler e gravar o balde
+    acontece numa transação `begin immediate`, então dois processos não
+    gastam a mesma ficha;
+  * "memoria": só o processo atual;
+  * "off": nunca limita.
+"""
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+
+LIMPEZA_SEG = 300
+
+
+def _agora() -> float:
+    return time.time()
+
+
+def _retirar(fichas: float, ts: float, agora: float, capacidade: float, taxa_seg: float):
+    """(fichas depois, espera_seg): espera 0 = ficha retirada."""
+    fichas = min(capacidade, fichas + max(0.0, agora - ts) * taxa_seg)
+    if fichas >= 1.0:
+        return fichas - 1.0, 0.0
+    return fichas, (1.0 - fichas) / taxa_seg
+
+
+class LimitadorMemoria:
+    def __init__(self):
+        self._baldes = {}
+        self._lock = threading.Lock()
+        self._ultima_limpeza = 0.0
+
+    def retirar(self, chave: str, capacidade: float, taxa_seg: float) -> float:
+        agora = _agora()
+        with self._lock:
+            fichas, ts = self._baldes.get(chave, (capacidade, agora))
+            fichas, espera = _retirar(fichas, ts, agora, capacidade, taxa_seg)
+            self._baldes[chave] = (fichas, agora)
+            if agora - self._ultima_limpeza > LIMPEZA_SEG:
+                self._ultima_limpeza = agora
+                # sem uso há LIMPEZA_SEG: some (volta cheio, como um balde novo)
+                for k in [k for k, (_, t) in self._baldes.items() if agora - t > LIMPEZA_SEG]:
+                    del self._baldes[k]
+        return espera
+
+
+class LimitadorSQLite:
+    """Baldes numa tabela SQLite em WAL (um arquivo por máquina)."""
+
+    def __init__(self, caminho: str):
+        self.caminho = caminho
+        self._local = threading.local()
+        self._ultima_limpeza = 0.0
+        con = self._con()
+        con.execute("pragma journal_mode=wal")
+        con.execute(
+            "create table if not exists baldes ("
+            " chave text primary key, fichas real not null, ts real not null, cheio_em real not null)"
+        )
+        con.execute("create index if not exists baldes_cheio_em on baldes (cheio_em)")
+
+    def _con(self):
+        con = getattr(self._local, "con", None)
+        if con is None:
+            con = sqlite3.connect(self.caminho, timeout=5, isolation_level=None, check_same_thread=False)
+            con.execute("pragma synchronous=normal")
+            con.execute("pragma busy_timeout=5000")
+            self._local.con = con
+        return con
+
+    def retirar(self, chave: str, capacidade: float, taxa_seg: float) -> float:
+        try:
+            con = self._con()
+            agora = _agora()
+            con.execute("begin immediate")
+            try:
+                row = con.execute("select fichas, ts from baldes where chave = ?", (chave,)).fetchone()
+                fichas, ts = row if row else (capacidade, agora)
+                fichas, espera = _retirar(fichas, ts, agora, capacidade, taxa_seg)
+                con.execute(
+                    "insert into baldes (chave, fichas, ts, cheio_em) values (?, ?, ?, ?)"
+                    " on conflict(chave) do update set"
+                    " fichas = excluded.fichas, ts = excluded.ts, cheio_em = excluded.cheio_em",
+                    (chave, fichas, agora, agora + (capacidade - fichas) / taxa_seg),
+                )
+                if agora - self._ultima_limpeza > LIMPEZA_SEG:
+                    self._ultima_limpeza = agora
+                    # balde que já estaria cheio é igual a balde nenhum
+                    con.execute("delete from baldes where cheio_em < ?", (agora,))
+                con.execute("commit")
+            except BaseException:
+                con.execute("rollback")
+                raise
+            return espera
+        except sqlite3.Error:
+            # disco com problema não pode derrubar a página: não limita
+            return 0.0
+
+
+class LimitadorDesligado:
+    def retirar(self, chave, capacidade, taxa_seg):
+        return 0.0
+
+
+_LIMITADORES = {}
+_LIMITADORES_LOCK = threading.Lock()
+
+
+def limitador(backend: str = "disco", diretorio: str | None = None):
+    """
+    Instância única por processo para (backend, diretório).
+    backend: "disco" (SQLite no diretório do cache), "memoria" ou "off".
+    """
+    backend = (backend or "disco").strip().lower()
+    diretorio = diretorio or os.path.join(tempfile.gettempdir(), "unhas_cache")
+    key = (backend, diretorio)
+    with _LIMITADORES_LOCK:
+        lim = _LIMITADORES.get(key)
+        if lim is not None:
+            return lim
+        if backend == "off":
+            lim = LimitadorDesligado()
+        elif backend == "memoria":
+            lim = LimitadorMemoria()
+        else:
+            try:
+                os.makedirs(diretorio, exist_ok=True)
+                lim = LimitadorSQLite(os.path.join(diretorio, "limites.sqlite3"))
+            except (OSError, sqlite3.Error):
+                lim = LimitadorMemoria()
+        _LIMITADORES[key] = lim
+        return lim
@@ -0,0 +1,103 @@
+"""
+Tempo por execução do script (painel ?debug=1 do admin).
+
+O app chama `iniciar()` no começo de cada execução; daí em diante os helpers
+de rede (decorados com `medido`) e os blocos de tela (`medir` / `registrar`)
+somam chamadas e tempo num coletor só daquela execução. Quantas vezes cada
+helper rodou é o que denuncia N+1 (um helper de rede chamado por linha).
+
+O coletor fica num ContextVar: cada sessão roda o script na sua própria
+thread, então sessões não se misturam; carregar_em_paralelo copia o
+contexto para as threads do pool. Execução só de fragment cai no coletor da
+última execução completa da thread (ou em nenhum).
+
+Chamadas de rede medidas também vão para as métricas do processo
+(agenda_metricas), com ou sem coletor ativo (API, scripts).
+"""
+import contextvars
+import functools
+import threading
+import time
+from contextlib import contextmanager
+
+import agenda_metricas
+
+_ATUAL = contextvars.ContextVar("agenda_medicao", default=None)
+
+
+class Medicao:
+    def __init__(self):
+        self.inicio = time.perf_counter()
+        self._itens = {}
+        self._lock = threading.Lock()
+
+    def registrar(self, nome: str, segundos: float):
+        with self._lock:
+            it = self._itens.setdefault(nome, [0, 0.0, 0.0])
+            it[0] += 1
+            it[1] += segundos
+            it[2] = max(it[2], segundos)
+
+    def decorrido_seg(self) -> float:
+        return time.perf_counter() - self.inicio
+
+    def resumo(self) -> list:
+        """[{"nome", "chamadas", "total_ms", "max_ms"}], do mais demorado para o menos."""
+        with self._lock:
+            itens = list(self._itens.items())
+        linhas = [
+            {"nome": nome, "chamadas": n, "total_ms": round(total * 1000, 1), "max_ms": round(maximo * 1000, 1)}
+            for nome, (n, total, maximo) in itens
+        ]
+        return sorted(linhas, key=lambda r: r["total_ms"], reverse=True)
+
+
+def iniciar() -> Medicao:
+    """Coletor novo para a execução atual (contexto atual)."""
+    m = Medicao()
+    _ATUAL.set(m)
+    return m
+
+
+def atual():
+    return _ATUAL.get()
+
+
+@contextmanager
+def medir(nome: str):
+    m = _ATUAL.get()
+    t0 = time.perf_counter()
+    erro = False
+    try:
+        yield
+    except Exception:
+        erro = True
+        raise
+    finally:
+        segundos = time.perf_counter() - t0
+        if m is not None:
+            m.registrar(nome, segundos)
+        agenda_metricas.observar_rede(nome, segundos, erro)
+
+
+def registrar(nome: str, inicio: float):
+    """Fecha um trecho aberto com inicio = time.perf_counter() (blocos longos de tela)."""
+    m = _ATUAL.get()
+    if m is not None:
+        m.registrar(nome, time.perf_counter() - inicio)
+
+
+def medido(tipo: str):
+    """Decorador: mede cada chamada como "<tipo>:<nome da função>"."""
+
+    def deco(fn):
+        nome = f"{tipo}:{fn.__name__}"
+
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            with medir(nome):
+                return fn(*args, **kwargs)
+
+        return wrapper
+
+    return deco
@@ -0,0 +1,210 @@
+"""
+Métricas do processo no formato texto do Prometheus (sem dependência extra).
+
+Cada processo (Streamlit ou agenda_api) soma as suas; `servir(porta)` abre um
+endpoint HTTP local (/metrics) numa thread do processo. Com vários workers,
+cada um precisa da sua porta (METRICAS_PORTA por processo): porta ocupada
+não derruba nada, só não exporta.
+
+Séries:
+  agenda_rede_segundos{tipo,alvo}         latência das chamadas de rede
+                                          (edge, supabase, auth, storage)
+  agenda_rede_erros_total{tipo,alvo}      chamadas que terminaram em exceção
+  agenda_reservas_total{resultado}        criada, slot_taken, tenant_blocked, ...
+  agenda_cache_total{cache,resultado}     hit/miss por namespace (tenant, agenda, ...)
+  agenda_execucao_segundos{rota}          execução do script por tela
+  agenda_sessoes_ativas                   sessões com execução nos últimos SESSAO_ATIVA_SEG
+  agenda_disjuntor_aberto{endpoint}       1 = disjuntor aberto ou em teste
+"""
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import agenda_disjuntor
+
+BUCKETS_SEG = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+TIPOS_REDE = ("edge", "supabase", "auth", "storage")
+SESSAO_ATIVA_SEG = 300
+
+
+def _rotulos(nomes: tuple, valores: tuple, extra: str = "") -> str:
+    partes = []
+    for n, v in zip(nomes, valores):
+        v = str(v).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+        partes.append(f'{n}="{v}"')
+    if extra:
+        partes.append(extra)
+    return "{" + ",".join(partes) + "}" if partes else ""
+
+
+def _num(v: float) -> str:
+    return repr(float(v)) if v != int(v) else str(int(v))
+
+
+class Contador:
+    def __init__(self, nome: str, ajuda: str, rotulos: tuple = ()):
+        self.nome, self.ajuda, self.rotulos = nome, ajuda, rotulos
+        self._valores = {}
+        self._lock = threading.Lock()
+
+    def inc(self, *valores, n: float = 1.0):
+        with self._lock:
+            self._valores[valores] = self._valores.get(valores, 0.0) + n
+
+    def texto(self) -> list:
+        with self._lock:
+            itens = sorted(self._valores.items())
+        linhas = [f"# HELP {self.nome} {self.ajuda}", f"# TYPE {self.nome} counter"]
+        linhas += [f"{self.nome}{_rotulos(self.rotulos, k)} {_num(v)}" for k, v in itens]
+        return linhas
+
+
+class Histograma:
+    def __init__(self, nome: str, ajuda: str, rotulos: tuple = (), buckets: tuple = BUCKETS_SEG):
+        self.nome, self.ajuda, self.rotulos, self.buckets = nome, ajuda, rotulos, buckets
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observar(self, valor: float, *valores):
+        with self._lock:
+            s = self._series.get(valores)
+            if s is None:
+                s = self._series[valores] = [[0] * len(self.buckets), 0, 0.0]
+            for i, limite in enumerate(self.buckets):
+                if valor <= limite:
+                    s[0][i] += 1
+            s[1] += 1
+            s[2] += valor
+
+    def texto(self) -> list:
+        with self._lock:
+            itens = sorted((k, (list(c), n, soma)) for k, (c, n, soma) in self._series.items())
+        linhas = [f"# HELP {self.nome} {self.ajuda}", f"# TYPE {self.nome} histogram"]
+        for k, (contagens, n, soma) in itens:
+            for limite, c in zip(self.buckets, contagens):
+                le = 'le="%s"' % limite
+                linhas.append(f"{self.nome}_bucket{_rotulos(self.rotulos, k, le)} {c}")
+            le = 'le="+Inf"'
+            linhas.append(f"{self.nome}_bucket{_rotulos(self.rotulos, k, le)} {n}")
+            linhas.append(f"{self.nome}_sum{_rotulos(self.rotulos, k)} {_num(soma)}")
+            linhas.append(f"{self.nome}_count{_rotulos(self.rotulos, k)} {n}")
+        return linhas
+
+
+REDE = Histograma("agenda_rede_segundos", "Latência das chamadas de rede.", ("tipo", "alvo"))
+REDE_ERROS = Contador("agenda_rede_erros_total", "Chamadas de rede que terminaram em exceção.", ("tipo", "alvo"))
+RESERVAS = Contador("agenda_reservas_total", "Reservas pela página/API por resultado.", ("resultado",))
+CACHE = Contador("agenda_cache_total", "Leituras do cache compartilhado (hit/miss).", ("cache", "resultado"))
+EXECUCAO = Histograma(
+    "agenda_execucao_segundos",
+    "Duração de cada execução do script por tela.",
+    ("rota",),
+    (0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0),
+)
+
+_SESSOES = {}
+_SESSOES_LOCK = threading.Lock()
+
+
+# ============================================================
+# REGISTRO (chamado pelos módulos)
+# ============================================================
+def observar_rede(nome: str, segundos: float, erro: bool = False):
+    """nome = "<tipo>:<alvo>" (o mesmo do agenda_medicao); outros tipos são ignorados."""
+    tipo, _, alvo = nome.partition(":")
+    if tipo not in TIPOS_REDE:
+        return
+    REDE.observar(segundos, tipo, alvo)
+    if erro:
+        REDE_ERROS.inc(tipo, alvo)
+
+
+def contar_reserva(out: dict):
+    if out.get("ok"):
+        RESERVAS.inc("replay" if out.get("replay") else "criada")
+    else:
+        RESERVAS.inc(str(out.get("error") or "erro"))
+
+
+def contar_cache(ns: str, acertou: bool):
+    CACHE.inc(ns.split(":", 1)[0], "hit" if acertou else "miss")
+
+
+def observar_execucao(rota: str, segundos: float):
+    EXECUCAO.observar(segundos, rota)
+
+
+def sessao_ativa(sessao_id: str):
+    agora = time.monotonic()
+    with _SESSOES_LOCK:
+        _SESSOES[sessao_id] = agora
+        if len(_SESSOES) > 1000:
+            for k in [k for k, t in _SESSOES.items() if agora - t > SESSAO_ATIVA_SEG]:
+                del _SESSOES[k]
+
+
+def _sessoes_ativas() -> int:
+    agora = time.monotonic()
+    with _SESSOES_LOCK:
+        return sum(1 for t in _SESSOES.values() if agora - t <= SESSAO_ATIVA_SEG)
+
+
+# ============================================================
+# EXPOSIÇÃO
+# ============================================================
+def texto() -> str:
+    linhas = []
+    for m in (REDE, REDE_ERROS, RESERVAS, CACHE, EXECUCAO):
+        linhas += m.texto()
+    linhas += [
+        "# HELP agenda_sessoes_ativas Sessões com execução recente.",
+        "# TYPE agenda_sessoes_ativas gauge",
+        f"agenda_sessoes_ativas {_sessoes_ativas()}",
+        "# HELP agenda_disjuntor_aberto Disjuntor do endpoint aberto ou em teste (1) ou fechado (0).",
+        "# TYPE agenda_disjuntor_aberto gauge",
+    ]
+    for nome, estado in sorted(agenda_disjuntor.estados().items()):
+        aberto = 0 if estado == agenda_disjuntor.FECHADO else 1
+        linhas.append(f"agenda_disjuntor_aberto{_rotulos(('endpoint',), (nome,))} {aberto}")
+    return "\n".join(linhas) + "\n"
+
+
+class _Handler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split("?", 1)[0] not in ("/metrics", "/"):
+            self.send_error(404)
+            return
+        corpo = texto().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(corpo)))
+        self.end_headers()
+        self.wfile.write(corpo)
+
+    def log_message(self, *args):
+        pass
+
+
+_SERVIDOR = None
+_SERVIDOR_LOCK = threading.Lock()
+
+
+def servir(porta: int, host: str = "127.0.0.1") -> bool:
+    """
+    Sobe /metrics uma vez por processo (chamadas seguintes não fazem nada).
+    False se não subiu (porta ocupada: não tenta de novo neste processo).
+    """
+    global _SERVIDOR
+    if not porta:
+        return False
+    with _SERVIDOR_LOCK:
+        if _SERVIDOR is not None:
+            return _SERVIDOR is not False
+        try:
+            _SERVIDOR = ThreadingHTTPServer((host, int(porta)), _Handler)
+        except OSError:
+            _SERVIDOR = False
+            return False
+        _SERVIDOR.daemon_threads = True
+        threading.Thread(target=_SERVIDOR.serve_forever, name="agenda-metricas", daemon=True).start()
+        return True
@@ -0,0 +1,1060 @@
+"""
+Núcleo da agenda pública, sem Streamlit.
+
+Leitura do tenant, horários livres, reserva e mensagem de WhatsApp usados pela
+página pública do app (app_unhas_web.py) e pela API HTTP (agenda_api.py). As
+duas portas passam pelos mesmos helpers e pelo mesmo cache (agenda_cache).
+
+Configuração: `configurar(segredos)` com o mesmo dicionário do secrets do
+Streamlit (o app passa st.secrets; a API usa `ler_segredos()`).
+"""
+import contextvars
+import ipaddress
+import os
+import threading
+import time
+import urllib.parse
+import uuid
+from concurrent.futures import ThreadPoolExecutor, wait
+from datetime import date, datetime, timedelta, timezone
+
+import requests
+
+import agenda_metricas
+from agenda_cache import CacheDesligado, cache_compartilhado
+from agenda_disjuntor import CircuitoAberto, disjuntor
+from agenda_disponibilidade import (
+    calendario_slots,
+    disponibilidade_recursos,
+    duracao_servicos,
+    faixas_validas,
+    min_para_hhmm,
+)
+from agenda_limite import limitador
+from agenda_medicao import medir
+
+
+# ============================================================
+# CONFIG (preenchida por configurar)
+# ============================================================
+SUPABASE_URL = ""
+SUPABASE_ANON_KEY = ""
+URL_RESERVAR = ""
+URL_HORARIOS = ""
+URL_TENANT_PUBLIC = ""
+URL_CATALOGO = ""
+CATALOGO_POR_PAGINA = 12
+TEMPO_EXPIRACAO_MIN = 60
+RESERVA_TENTATIVAS = 3
+CACHE_BACKEND = "disco"
+CACHE_DIR = ""
+CACHE_TENANT_SEG = 120
+CACHE_AGENDA_SEG = 20
+CACHE_ESTAVEL_SEG = 86400
+EDGE_TIMEOUT_SEG = 5.0
+DISJUNTOR_FALHAS = 3
+DISJUNTOR_LENTO_SEG = 3.0
+DISJUNTOR_ABERTO_SEG = 30.0
+LIMITE_BACKEND = "disco"
+# ação -> (por cliente, por tenant), em ações por minuto (0 = sem limite)
+LIMITES = {"horarios": (60, 300), "reserva": (5, 60), "espera": (3, 30)}
+# proxies cujo X-Forwarded-For vale (ip_network) e quantos saltos eles acrescentam
+TRUSTED_PROXIES = ()
+PROXY_HOPS = 1
+METRICAS_PORTA = 0
+METRICAS_HOST = "127.0.0.1"
+
+
+def configurar(segredos):
+    """Lê as chaves usadas aqui de um mapeamento (st.secrets, dict do toml, ...)."""
+    global SUPABASE_URL, SUPABASE_ANON_KEY, URL_RESERVAR, URL_HORARIOS, URL_TENANT_PUBLIC
+    global URL_CATALOGO, CATALOGO_POR_PAGINA
+    global TEMPO_EXPIRACAO_MIN, RESERVA_TENTATIVAS, CACHE_BACKEND, CACHE_DIR, CACHE_TENANT_SEG, CACHE_AGENDA_SEG
+    global CACHE_ESTAVEL_SEG, EDGE_TIMEOUT_SEG, DISJUNTOR_FALHAS, DISJUNTOR_LENTO_SEG, DISJUNTOR_ABERTO_SEG
+    global LIMITE_BACKEND, LIMITES, TRUSTED_PROXIES, PROXY_HOPS, METRICAS_PORTA, METRICAS_HOST
+    SUPABASE_URL = str(segredos.get("SUPABASE_URL", "")).strip()
+    SUPABASE_ANON_KEY = str(segredos.get("SUPABASE_ANON_KEY", "")).strip()
+    URL_RESERVAR = str(segredos.get("URL_RESERVAR", "")).strip()
+    URL_HORARIOS = str(segredos.get("URL_HORARIOS", "")).strip()
+    URL_TENANT_PUBLIC = str(segredos.get("URL_TENANT_PUBLIC", "")).strip()
+    # catálogo público: edge function ou (padrão) a RPC catalogo_publico
+    URL_CATALOGO = str(segredos.get("URL_CATALOGO", "")).strip() or (
+        f"{SUPABASE_URL}/rest/v1/rpc/catalogo_publico" if SUPABASE_URL else ""
+    )
+    CATALOGO_POR_PAGINA = max(1, min(100, int(segredos.get("CATALOGO_POR_PAGINA", 12))))
+    TEMPO_EXPIRACAO_MIN = int(segredos.get("TEMPO_EXPIRACAO_MIN", 60))
+    RESERVA_TENTATIVAS = max(1, int(segredos.get("RESERVA_TENTATIVAS", 3)))
+    CACHE_BACKEND = str(segredos.get("CACHE_BACKEND", "disco")).strip()
+    CACHE_DIR = str(segredos.get("CACHE_DIR", "")).strip()
+    CACHE_TENANT_SEG = int(segredos.get("CACHE_TENANT_SEG", 120))
+    CACHE_AGENDA_SEG = int(segredos.get("CACHE_AGENDA_SEG", 20))
+    # edge functions públicas: timeout curto + disjuntor por endpoint; com a
+    # edge fora, serve a última resposta boa (até CACHE_ESTAVEL_SEG) marcada
+    # como desatualizada
+    CACHE_ESTAVEL_SEG = int(segredos.get("CACHE_ESTAVEL_SEG", 86400))
+    EDGE_TIMEOUT_SEG = max(1.0, float(segredos.get("EDGE_TIMEOUT_SEG", 5)))
+    DISJUNTOR_FALHAS = max(1, int(segredos.get("DISJUNTOR_FALHAS", 3)))
+    DISJUNTOR_LENTO_SEG = float(segredos.get("DISJUNTOR_LENTO_SEG", 3))
+    DISJUNTOR_ABERTO_SEG = float(segredos.get("DISJUNTOR_ABERTO_SEG", 30))
+    # limite das ações públicas: disco (todos os workers) por padrão, memória se
+    # o cache estiver desligado; só LIMITE_BACKEND = "off" desliga o limite
+    LIMITE_BACKEND = str(segredos.get("LIMITE_BACKEND", "")).strip().lower() or (
+        "memoria" if CACHE_BACKEND.lower() == "off" else "disco"
+    )
+    LIMITES = {
+        "horarios": (
+            max(0, int(segredos.get("LIMITE_HORARIOS_CLIENTE", 60))),
+            max(0, int(segredos.get("LIMITE_HORARIOS_TENANT", 300))),
+        ),
+        "reserva": (
+            max(0, int(segredos.get("LIMITE_RESERVA_CLIENTE", 5))),
+            max(0, int(segredos.get("LIMITE_RESERVA_TENANT", 60))),
+        ),
+        "espera": (
+            max(0, int(segredos.get("LIMITE_ESPERA_CLIENTE", 3))),
+            max(0, int(segredos.get("LIMITE_ESPERA_TENANT", 30))),
+        ),
+    }
+    # IP do cliente para o limite: X-Forwarded-For só quando quem conectou é um
+    # desses proxies (lista ou "10.0.0.0/8, 127.0.0.1"); sem eles, o IP da conexão
+    TRUSTED_PROXIES = _redes(segredos.get("TRUSTED_PROXIES", ""))
+    PROXY_HOPS = max(1, int(segredos.get("PROXY_HOPS", 1)))
+    # /metrics local (agenda_metricas.servir); 0 = desligado. Um valor por processo.
+    METRICAS_PORTA = max(0, int(segredos.get("METRICAS_PORTA", 0)))
+    METRICAS_HOST = str(segredos.get("METRICAS_HOST", "127.0.0.1")).strip() or "127.0.0.1"
+
+
+def ler_segredos(caminho: str | None = None) -> dict:
+    """
+    Segredos fora do Streamlit: .streamlit/secrets.toml (pasta atual, depois
+    ~/.streamlit) com variáveis de ambiente de mesmo nome por cima.
+    """
+    import tomllib
+
+    dados = {}
+    caminhos = [caminho] if caminho else [
+        os.path.join(os.getcwd(), ".streamlit", "secrets.toml"),
+        os.path.join(os.path.expanduser("~"), ".streamlit", "secrets.toml"),
+    ]
+    for c in caminhos:
+        if c and os.path.exists(c):
+            with open(c, "rb") as fh:
+                dados = tomllib.load(fh)
+            break
+    for k in list(dados.keys()) + [
+        "SUPABASE_URL", "SUPABASE_ANON_KEY", "URL_RESERVAR", "URL_HORARIOS", "URL_TENANT_PUBLIC",
+        "URL_CATALOGO", "CATALOGO_POR_PAGINA", "TEMPO_EXPIRACAO_MIN", "RESERVA_TENTATIVAS", "CACHE_BACKEND", "CACHE_DIR",
+        "CACHE_TENANT_SEG", "CACHE_AGENDA_SEG", "CACHE_ESTAVEL_SEG", "EDGE_TIMEOUT_SEG", "DISJUNTOR_FALHAS",
+        "DISJUNTOR_LENTO_SEG", "DISJUNTOR_ABERTO_SEG", "LIMITE_BACKEND", "LIMITE_HORARIOS_CLIENTE",
+        "LIMITE_HORARIOS_TENANT", "LIMITE_RESERVA_CLIENTE", "LIMITE_RESERVA_TENANT", "LIMITE_ESPERA_CLIENTE",
+        "LIMITE_ESPERA_TENANT", "TRUSTED_PROXIES", "PROXY_HOPS", "METRICAS_PORTA", "METRICAS_HOST",
+    ]:
+        if os.environ.get(k):
+            dados[k] = os.environ[k]
+    return dados
+
+
+def cache():
+    """Instância do processo (uma por backend/diretório, ver agenda_cache)."""
+    return cache_compartilhado(CACHE_BACKEND, CACHE_DIR or None)
+
+
+def invalidar_tenant(tenant_id: str):
+    """Payload público + settings + páginas do catálogo do tenant (em todos os processos)."""
+    cache().invalidar(f"tenant:{tenant_id}")
+
+
+def invalidar_agenda(tenant_id: str):
+    """Ocupação dos dias do tenant (página pública)."""
+    cache().invalidar(f"agenda:{tenant_id}")
+
+
+# ============================================================
+# EDGE FUNCTIONS (disjuntor + última resposta boa)
+# ============================================================
+class EdgeIndisponivel(Exception):
+    """Edge function fora (rede, 5xx, lenta demais ou disjuntor aberto) e sem cópia para servir."""
+
+
+def _post_edge(nome: str, url: str, payload: dict):
+    """
+    POST numa edge function pelo disjuntor `nome`. 200 -> JSON; 4xx (ou URL
+    vazia) -> None; rede/timeout/5xx/disjuntor aberto -> EdgeIndisponivel.
+    """
+    if not url:
+        return None
+    d = disjuntor(
+        nome,
+        falhas_max=DISJUNTOR_FALHAS,
+        lento_seg=DISJUNTOR_LENTO_SEG,
+        aberto_seg=DISJUNTOR_ABERTO_SEG,
+    )
+
+    def _chamar():
+        with medir(f"edge:{nome}"):
+            resp = requests.post(url, headers=fn_headers(), json=payload, timeout=(3, EDGE_TIMEOUT_SEG))
+        if resp.status_code >= 500:
+            raise EdgeIndisponivel(f"{nome}: HTTP {resp.status_code}")
+        return resp
+
+    try:
+        resp = d.chamar(_chamar)
+    except (CircuitoAberto, requests.RequestException) as e:
+        raise EdgeIndisponivel(nome) from e
+    if resp.status_code != 200:
+        return None
+    try:
+        return resp.json()
+    except ValueError:
+        return None
+
+
+def _guardar_estavel(tenant_id: str, chave: str, valor):
+    """Última resposta boa; fica fora de tenant:/agenda: (invalidar não apaga)."""
+    cache().set(f"estavel:{tenant_id}", chave, valor, CACHE_ESTAVEL_SEG)
+
+
+def _ler_estavel(tenant_id: str, chave: str):
+    return cache().get(f"estavel:{tenant_id}", chave)
+
+
+# ============================================================
+# LIMITE DE USO (ações públicas)
+# ============================================================
+class LimiteExcedido(Exception):
+    """Cliente (ou tenant) passou do limite da ação; espera_seg até liberar."""
+
+    def __init__(self, acao: str, espera_seg: float):
+        super().__init__(acao)
+        self.acao = acao
+        self.espera_seg = espera_seg
+
+
+def _redes(valor) -> tuple:
+    if isinstance(valor, str):
+        valor = valor.split(",")
+    redes = []
+    for v in valor or []:
+        try:
+            redes.append(ipaddress.ip_network(str(v).strip(), strict=False))
+        except ValueError:
+            continue
+    return tuple(redes)
+
+
+def _ip(valor):
+    try:
+        return ipaddress.ip_address(str(valor or "").strip())
+    except ValueError:
+        return None
+
+
+def origem_requisicao(peer: str | None, x_forwarded_for: str | None = None) -> str:
+    """
+    Cliente para o limite por cliente: "ip:<ip>" ("" sem IP). O
+    X-Forwarded-For só é lido quando quem conectou (peer) está em
+    TRUSTED_PROXIES: aí o cliente é o PROXY_HOPS-ésimo salto a partir da
+    direita. Vindo direto, o cabeçalho é do próprio cliente e é ignorado
+    (senão cada requisição com um valor novo ganharia um balde novo).
+    """
+    ip = _ip(peer)
+    if ip is not None and x_forwarded_for and any(ip in rede for rede in TRUSTED_PROXIES):
+        saltos = [s.strip() for s in x_forwarded_for.split(",") if s.strip()]
+        if saltos:
+            ip = _ip(saltos[max(0, len(saltos) - PROXY_HOPS)]) or ip
+    return f"ip:{ip}" if ip is not None else ""
+
+
+def limitar(acao: str, tenant_id: str, origem: str | None = None, cota_tenant: bool = True):
+    """
+    Gasta uma ficha de `acao` do cliente (tenant + origem: IP ou sessão) e
+    do tenant; sem ficha, LimiteExcedido. O balde do cliente vem primeiro:
+    quem já está bloqueado não gasta a cota do tenant. cota_tenant=False
+    gasta só a do cliente (quem chama cobra o tenant por outro caminho).
+    """
+    lim = limitador(LIMITE_BACKEND, CACHE_DIR or None)
+    por_cliente, por_tenant = LIMITES.get(acao, (0, 0))
+    baldes = [(f"{acao}:{tenant_id}", por_tenant)] if cota_tenant else []
+    if origem:
+        baldes.insert(0, (f"{acao}:{tenant_id}:{origem}", por_cliente))
+    for chave, por_minuto in baldes:
+        if por_minuto <= 0:
+            continue
+        espera = lim.retirar(chave, float(por_minuto), por_minuto / 60.0)
+        if espera > 0:
+            raise LimiteExcedido(acao, espera)
+
+
+# ============================================================
+# CARGA EM PARALELO (I/O de rede: requests / supabase)
+# Pool único do processo: o script do Streamlit reexecuta a cada interação,
+# então ele não pode criar o próprio pool.
+# ============================================================
+MAX_THREADS_IO = 16
+
+_POOL = None
+_POOL_LOCK = threading.Lock()
+
+
+def _pool():
+    global _POOL
+    with _POOL_LOCK:
+        if _POOL is None:
+            _POOL = ThreadPoolExecutor(max_workers=MAX_THREADS_IO, thread_name_prefix="agenda-io")
+        return _POOL
+
+
+def carregar_em_paralelo(tarefas: dict, orcamento_seg: float) -> dict:
+    """
+    Roda as funções sem argumento de `tarefas` ({nome: fn}) ao mesmo tempo e
+    espera no máximo `orcamento_seg` no total. Devolve {nome: resultado} só das
+    que terminaram a tempo; as atrasadas continuam (e aquecem o cache), mas
+    ficam de fora. Exceção de uma tarefa é relançada aqui, como na chamada direta.
+    As funções não podem usar st.* (rodam fora da thread do script).
+    Rodam no contexto de quem chamou (a medição da execução segue junto).
+    """
+    futuros = {nome: _pool().submit(contextvars.copy_context().run, fn) for nome, fn in tarefas.items()}
+    wait(list(futuros.values()), timeout=max(0.0, float(orcamento_seg)))
+    out = {}
+    for nome, f in futuros.items():
+        if f.done():
+            out[nome] = f.result()
+    return out
+
+
+def em_segundo_plano(fn, *args):
+    """Dispara sem esperar (pré-carga de cache); erros ficam no futuro e são ignorados."""
+    return _pool().submit(fn, *args)
+
+
+# ============================================================
+# DEFAULTS (serviços + horários)
+# ============================================================
+DEFAULT_SERVICES = {
+    "Corte de cabelo": 50.0,
+    "Barba": 30.0,
+    "Manicure": 40.0,
+    "Pedicure": 50.0,
+    "Tatuagem (pequena)": 150.0,
+}
+
+DEFAULT_WORKING_HOURS = {
+    "0": ["09:00", "10:00", "15:00"],
+    "1": ["09:00", "10:00", "15:00"],
+    "2": ["09:00", "10:00", "15:00"],
+    "3": ["09:00", "10:00", "15:00"],
+    "4": ["09:00", "10:00", "15:00"],
+    "5": ["09:00", "10:00", "15:00"],
+    "6": [],
+}
+
+VALOR_SINAL_FIXO = 20.0
+
+STATUS_ALL = ["pendente", "pago", "finalizado", "cancelado"]
+
+
+def norm_status(s: str) -> str:
+    s = (s or "").strip().lower()
+    return s if s in STATUS_ALL else (s or "pendente")
+
+
+# ============================================================
+# HELPERS
+# ============================================================
+def parse_dt(dt_str: str):
+    if not dt_str:
+        return None
+    try:
+        dt_str = dt_str.replace("Z", "+00:00")
+        return datetime.fromisoformat(dt_str)
+    except Exception:
+        return None
+
+
+def parse_date_iso(d):
+    if not d:
+        return None
+    try:
+        return date.fromisoformat(str(d))
+    except Exception:
+        return None
+
+
+def agora_utc():
+    return datetime.now(timezone.utc)
+
+
+def fmt_brl(v: float) -> str:
+    s = f"{float(v):,.2f}"
+    s = s.replace(",", "X").replace(".", ",").replace("X", ".")
+    return f"R$ {s}"
+
+
+def normalizar_servicos(servicos):
+    return [s.strip() for s in servicos if s and str(s).strip()]
+
+
+def servicos_para_texto(servicos):
+    return " + ".join(normalizar_servicos(servicos))
+
+
+def calcular_total_servicos(servicos, services_map):
+    total = 0.0
+    for s in normalizar_servicos(servicos):
+        total += float(services_map.get(s, 0.0))
+    return float(total)
+
+
+def calcular_sinal(_servicos, deposit_cfg: dict | None = None):
+    """
+    Se deposit_cfg["enabled"] == False => sinal = 0
+    Caso contrário usa deposit_cfg["value"] ou VALOR_SINAL_FIXO.
+    """
+    deposit_cfg = deposit_cfg or {"enabled": True, "value": float(VALOR_SINAL_FIXO)}
+    if not bool(deposit_cfg.get("enabled", True)):
+        return 0.0
+    try:
+        return float(deposit_cfg.get("value", VALOR_SINAL_FIXO))
+    except Exception:
+        return float(VALOR_SINAL_FIXO)
+
+
+def validar_hhmm(h: str) -> bool:
+    try:
+        hh, mm = h.split(":")
+        hh = int(hh)
+        mm = int(mm)
+        return 0 <= hh <= 23 and 0 <= mm <= 59
+    except Exception:
+        return False
+
+
+def unique_sorted_times(times):
+    clean = []
+    seen = set()
+    for t in times:
+        t = str(t).strip()
+        if not t:
+            continue
+        if not validar_hhmm(t):
+            continue
+        if t not in seen:
+            seen.add(t)
+            clean.append(t)
+    return sorted(clean)
+
+
+def fn_headers():
+    return {
+        "Content-Type": "application/json",
+        "apikey": SUPABASE_ANON_KEY,
+        "Authorization": f"Bearer {SUPABASE_ANON_KEY}",
+    }
+
+
+# ============================================================
+# SETTINGS (leitura; o admin grava em app_unhas_web.py)
+# ============================================================
+def settings_get_services(settings: dict):
+    s = settings.get("services")
+    if isinstance(s, dict) and s:
+        out = {}
+        for k, v in s.items():
+            try:
+                out[str(k)] = float(v)
+            except Exception:
+                continue
+        return out if out else DEFAULT_SERVICES.copy()
+    return DEFAULT_SERVICES.copy()
+
+
+def settings_get_working_hours(settings: dict):
+    wh = settings.get("working_hours")
+    if isinstance(wh, dict):
+        out = {}
+        for k, v in wh.items():
+            if isinstance(v, list):
+                out[str(k)] = unique_sorted_times(v)
+            else:
+                out[str(k)] = []
+        for i in range(7):
+            out.setdefault(str(i), DEFAULT_WORKING_HOURS.get(str(i), []))
+        return out
+    return DEFAULT_WORKING_HOURS.copy()
+
+
+# ----------------------------
+# HORÁRIO POR INTERVALOS (regras)
+# settings["working_rules"] = {
+#   "enabled": true, "step": 30,
+#   "days": {"0": [["09:00","12:00"], ["13:00","18:00"]], ..., "6": []}
+# }
+# Quando ativo, substitui a lista de horários de working_hours.
+# ----------------------------
+def settings_get_working_rules(settings: dict):
+    r = settings.get("working_rules")
+    if not isinstance(r, dict):
+        return {"enabled": False, "step": 30, "days": {str(i): [] for i in range(7)}}
+    try:
+        step = int(r.get("step") or 30)
+    except Exception:
+        step = 30
+    days_in = r.get("days") if isinstance(r.get("days"), dict) else {}
+    days = {}
+    for i in range(7):
+        days[str(i)] = [[min_para_hhmm(a), min_para_hhmm(b)] for a, b in faixas_validas(days_in.get(str(i)))]
+    return {"enabled": bool(r.get("enabled", False)), "step": max(5, step), "days": days}
+
+
+# ----------------------------
+# EXCEÇÕES POR DATA (folgas, férias, horário especial, feriados)
+# settings["date_exceptions"] = {
+#   "fechar_feriados": false,
+#   "itens": [{"de": "YYYY-MM-DD", "ate": "YYYY-MM-DD", "faixas": [["09:00","13:00"]]}]
+# }
+# faixas vazias = fechado nesse período.
+# ----------------------------
+def settings_get_date_exceptions(settings: dict):
+    e = settings.get("date_exceptions")
+    if not isinstance(e, dict):
+        return {"fechar_feriados": False, "itens": []}
+    itens = []
+    for it in e.get("itens") or []:
+        if not isinstance(it, dict):
+            continue
+        de = parse_date_iso(it.get("de"))
+        ate = parse_date_iso(it.get("ate")) or de
+        if not de:
+            continue
+        if ate < de:
+            de, ate = ate, de
+        faixas = [[min_para_hhmm(a), min_para_hhmm(b)] for a, b in faixas_validas(it.get("faixas"))]
+        itens.append({"de": de.isoformat(), "ate": ate.isoformat(), "faixas": faixas})
+    return {"fechar_feriados": bool(e.get("fechar_feriados", False)), "itens": itens}
+
+
+def settings_get_slot_calendar(settings: dict):
+    """Slots do tenant compilados (array('H') por dia + exceções por data), em cache por versão dos horários."""
+    return calendario_slots(
+        settings_get_working_hours(settings),
+        settings_get_working_rules(settings),
+        settings_get_date_exceptions(settings),
+    )
+
+
+# ----------------------------
+# DURAÇÃO dos serviços (min) + intervalo entre atendimentos
+# settings["service_durations"] = {"Tatuagem (pequena)": 180, ...}
+# settings["buffer_min"] = 10
+# Serviço sem duração ocupa só o horário de início (comportamento antigo).
+# ----------------------------
+def settings_get_durations(settings: dict):
+    d = settings.get("service_durations")
+    out = {}
+    if isinstance(d, dict):
+        for k, v in d.items():
+            try:
+                m = int(v)
+            except Exception:
+                continue
+            if m > 0:
+                out[str(k)] = m
+    return out
+
+
+def settings_get_buffer(settings: dict) -> int:
+    try:
+        return max(0, int(settings.get("buffer_min", 0) or 0))
+    except Exception:
+        return 0
+
+
+# ----------------------------
+# CAPACIDADE por horário (aulas em grupo, várias cadeiras na mesma agenda)
+# settings["slot_capacity"] = 3   -> até 3 clientes ao mesmo tempo
+# Com profissionais cadastrados, vale por profissional.
+# ----------------------------
+def settings_get_capacity(settings: dict) -> int:
+    try:
+        return max(1, int(settings.get("slot_capacity", 1) or 1))
+    except Exception:
+        return 1
+
+
+# ----------------------------
+# PROFISSIONAIS / RECURSOS (cadeiras, salas)
+# settings["resources"] = [{"id": "a1b2c3d4", "nome": "Ana", "ativo": true}, ...]
+# Lista vazia = agenda única (comportamento antigo). A ordem da lista é a ordem
+# de atribuição quando o cliente escolhe "Qualquer profissional".
+# ----------------------------
+def settings_get_resources(settings: dict):
+    r = settings.get("resources")
+    out = []
+    vistos = set()
+    if isinstance(r, list):
+        for it in r:
+            if not isinstance(it, dict):
+                continue
+            rid = str(it.get("id") or "").strip()
+            nome = str(it.get("nome") or "").strip()
+            if not rid or not nome or rid in vistos:
+                continue
+            vistos.add(rid)
+            out.append({"id": rid, "nome": nome, "ativo": bool(it.get("ativo", True))})
+    return out
+
+
+def recursos_ativos(settings: dict):
+    return [r for r in settings_get_resources(settings) if r["ativo"]]
+
+
+def settings_get_deposit(settings: dict):
+    d = settings.get("deposit")
+    if isinstance(d, dict):
+        enabled = bool(d.get("enabled", True))
+        try:
+            value = float(d.get("value", VALOR_SINAL_FIXO))
+        except Exception:
+            value = float(VALOR_SINAL_FIXO)
+        if value < 0:
+            value = 0.0
+        return {"enabled": enabled, "value": value}
+    return {"enabled": True, "value": float(VALOR_SINAL_FIXO)}
+
+
+# ----------------------------
+# CATÁLOGO por tenant
+# settings["catalog"] = {"enabled": true}; os itens ficam na tabela
+# catalogo_itens (id, posicao, tipo "image|pdf", path, url, legenda,
+# variantes, largura, altura) e são lidos paginados só onde o catálogo aparece.
+# ----------------------------
+def settings_get_catalog(settings: dict):
+    c = settings.get("catalog")
+    if isinstance(c, dict):
+        return {"enabled": bool(c.get("enabled", True))}
+    return {"enabled": True}
+
+
+# ============================================================
+# TENANT + CATÁLOGO (público)
+# ============================================================
+def _buscar_tenant_publico(tenant_id: str):
+    payload = _post_edge("tenant_publico", URL_TENANT_PUBLIC, {"tenant_id": str(tenant_id)})
+    if isinstance(payload, dict) and isinstance(payload.get("tenant"), dict):
+        _guardar_estavel(tenant_id, "publico", payload["tenant"])
+        return payload["tenant"]
+    return None
+
+
+def carregar_tenant_publico(tenant_id: str):
+    """
+    Payload público do tenant (None se o link não vale). Com a edge fora,
+    devolve a última cópia boa com "desatualizado": True; sem cópia,
+    EdgeIndisponivel.
+    """
+    try:
+        return cache().obter(
+            f"tenant:{tenant_id}", "publico", CACHE_TENANT_SEG, lambda: _buscar_tenant_publico(tenant_id)
+        )
+    except EdgeIndisponivel:
+        tenant = _ler_estavel(tenant_id, "publico")
+        if not isinstance(tenant, dict):
+            raise
+        return {**tenant, "desatualizado": True}
+
+
+def item_catalogo(row: dict):
+    """Linha de catalogo_itens limpa para exibir (None se faltar path/url)."""
+    if not isinstance(row, dict):
+        return None
+    url = str(row.get("url") or "").strip()
+    path = str(row.get("path") or "").strip()
+    if not (url and path):
+        return None
+    tipo = str(row.get("tipo") or "image").lower().strip()
+    return {
+        "id": row.get("id"),
+        "posicao": row.get("posicao"),
+        "tipo": tipo if tipo in ("image", "pdf") else "image",
+        "path": path,
+        "url": url,
+        "legenda": str(row.get("legenda") or "").strip(),
+        "variantes": row.get("variantes") if isinstance(row.get("variantes"), dict) else {},
+        "largura": row.get("largura"),
+        "altura": row.get("altura"),
+    }
+
+
+def _buscar_catalogo_publico(tenant_id: str, de: int, limite: int):
+    try:
+        payload = _post_edge(
+            "catalogo", URL_CATALOGO, {"tenant_id": str(tenant_id), "de": int(de), "limite": int(limite)}
+        )
+        if not isinstance(payload, dict) or not payload.get("ok"):
+            return None
+        return {"itens": payload.get("itens") or [], "total": int(payload.get("total") or 0)}
+    except Exception:
+        return None
+
+
+def catalogo_publico(tenant_id: str, pagina: int = 0, por_pagina: int | None = None) -> dict:
+    """
+    Uma página do catálogo (ordem de posicao): {"itens": [...], "total": N}.
+    Vazio se o catálogo estiver desligado ou em erro. Cacheado junto com o
+    tenant (invalidar_tenant limpa as páginas).
+    """
+    por_pagina = int(por_pagina or CATALOGO_POR_PAGINA)
+    de = max(0, int(pagina)) * por_pagina
+    out = cache().obter(
+        f"tenant:{tenant_id}",
+        f"catalogo:{de}:{por_pagina}",
+        CACHE_TENANT_SEG,
+        lambda: _buscar_catalogo_publico(tenant_id, de, por_pagina),
+    )
+    if not isinstance(out, dict):
+        return {"itens": [], "total": 0}
+    itens = [it for it in (item_catalogo(r) for r in out.get("itens") or []) if it]
+    return {"itens": itens, "total": int(out.get("total") or 0)}
+
+
+# ============================================================
+# PUBLIC: HORÁRIOS OCUPADOS + RESERVA
+# ============================================================
+def _buscar_ocupacao_dia(tenant_id: str, data_escolhida: date, origem: str | None = None):
+    # só busca de verdade (cache vazio) gasta ficha: recarregar o mesmo dia é de graça
+    limitar("horarios", tenant_id, origem)
+    payload = _post_edge(
+        "horarios", URL_HORARIOS, {"tenant_id": str(tenant_id), "data": data_escolhida.isoformat()}
+    )
+    if payload is None:
+        return None
+    rows = payload.get("rows", []) if isinstance(payload, dict) else []
+    _guardar_estavel(tenant_id, f"agenda:{data_escolhida.isoformat()}", rows)
+    return rows
+
+
+class Ocupacao(list):
+    """Linhas bloqueantes do dia; desatualizado=True se vieram da última cópia boa."""
+
+    desatualizado = False
+
+
+def agendamentos_bloqueantes_publico(tenant_id: str, data_escolhida: date, origem: str | None = None):
+    """
+    Linhas do dia que ocupam agenda (horario, servico, status, created_at):
+    cancelado não ocupa, pago/finalizado ocupam, pendente ocupa até expirar.
+    Linhas agregadas (RPC ocupacao_dia: horario, servico, recurso_id, qtd) já
+    vêm filtradas pelo servidor e entram como estão.
+    Devolve Ocupacao, ou None se a ocupação não pôde ser lida (edge fora e
+    sem cópia): nunca "dia vazio" por erro, que deixaria reservar por cima.
+    origem = IP/sessão do cliente (limite por cliente); passou do limite:
+    última cópia boa, ou LimiteExcedido se não houver.
+    """
+    try:
+        desatualizado = False
+        try:
+            # cacheia as linhas cruas: a expiração dos pendentes é recalculada a cada leitura
+            rows = cache().obter(
+                f"agenda:{tenant_id}",
+                data_escolhida.isoformat(),
+                CACHE_AGENDA_SEG,
+                lambda: _buscar_ocupacao_dia(tenant_id, data_escolhida, origem),
+            )
+        except (EdgeIndisponivel, LimiteExcedido) as e:
+            rows = _ler_estavel(tenant_id, f"agenda:{data_escolhida.isoformat()}")
+            desatualizado = True
+            if rows is None and isinstance(e, LimiteExcedido):
+                raise
+        if rows is None:
+            return None
+
+        bloqueantes = Ocupacao()
+        bloqueantes.desatualizado = desatualizado
+        now = agora_utc()
+
+        for r in rows:
+            if "qtd" in r:
+                bloqueantes.append(r)
+                continue
+
+            status = norm_status(r.get("status"))
+
+            # cancelado NÃO ocupa
+            if status == "cancelado":
+                continue
+
+            if status in ("pago", "finalizado"):
+                bloqueantes.append(r)
+                continue
+
+            if status == "pendente":
+                if TEMPO_EXPIRACAO_MIN <= 0:
+                    bloqueantes.append(r)
+                else:
+                    created_at = parse_dt(r.get("created_at", ""))
+                    if created_at is None:
+                        bloqueantes.append(r)
+                    else:
+                        if created_at.tzinfo is None:
+                            created_at = created_at.replace(tzinfo=timezone.utc)
+                        if (now - created_at) <= timedelta(minutes=TEMPO_EXPIRACAO_MIN):
+                            bloqueantes.append(r)
+
+        return bloqueantes
+    except LimiteExcedido:
+        raise
+    except Exception:
+        return None
+
+
+def horarios_ocupados_publico(tenant_id: str, data_escolhida: date, origem: str | None = None):
+    """{horario: quantos agendamentos começam nele} (só os que bloqueiam); None se indisponível."""
+    bloqueantes = agendamentos_bloqueantes_publico(tenant_id, data_escolhida, origem)
+    if bloqueantes is None:
+        return None
+    ocupacao = {}
+    for r in bloqueantes:
+        h = r.get("horario")
+        try:
+            qtd = max(1, int(r.get("qtd") or 1))
+        except Exception:
+            qtd = 1
+        ocupacao[h] = ocupacao.get(h, 0) + qtd
+    return ocupacao
+
+
+# disponibilidade_publico sem bloqueantes de quem chama: busca lá dentro
+_NAO_BUSCADO = object()
+
+
+def disponibilidade_publico(
+    tenant_id: str,
+    data_escolhida: date,
+    calendario,
+    servicos: list,
+    durations: dict,
+    buffer_min: int = 0,
+    recursos: list | None = None,
+    capacidade: int = 1,
+    bloqueantes=_NAO_BUSCADO,
+):
+    """
+    Mapas de slots livres do dia por profissional (DisponibilidadeRecursos):
+    onde cabe um atendimento com a duração dos serviços escolhidos, dentro da
+    faixa de trabalho e sem lotar (capacidade) aquele profissional.
+    bloqueantes = linhas do dia já buscadas (carga paralela, API); sem o
+    argumento, busca aqui. None = a busca de quem chamou falhou: não busca de
+    novo (seria outra chamada à edge justo quando ela está falhando).
+    Retorna None se o dia não tem expediente; EdgeIndisponivel se a ocupação
+    não pôde ser lida.
+    """
+    inicios, limites = calendario.slots_do_dia(data_escolhida)
+    if not inicios:
+        return None
+    if bloqueantes is _NAO_BUSCADO:
+        bloqueantes = agendamentos_bloqueantes_publico(tenant_id, data_escolhida)
+    if bloqueantes is None:
+        raise EdgeIndisponivel("horarios")
+    return disponibilidade_recursos(
+        bloqueantes,
+        [r["id"] for r in (recursos or [])],
+        inicios,
+        limites,
+        duracao_servicos(servicos, durations),
+        durations,
+        buffer_min,
+        capacidade,
+    )
+
+
+def horarios_livres_publico(
+    tenant_id: str,
+    data_escolhida: date,
+    calendario,
+    servicos: list,
+    durations: dict,
+    buffer_min: int = 0,
+    recursos: list | None = None,
+    recurso_id: str | None = None,
+    capacidade: int = 1,
+):
+    """Horários (HH:MM) livres do profissional escolhido (ou de qualquer um)."""
+    disp = disponibilidade_publico(
+        tenant_id, data_escolhida, calendario, servicos, durations, buffer_min, recursos, capacidade
+    )
+    if disp is None:
+        return []
+    return [min_para_hhmm(m) for m in disp.livres(recurso_id)]
+
+
+def precarregar_ocupacao(tenant_id: str, datas: list):
+    """
+    Busca em segundo plano a ocupação das datas que o cliente deve olhar em
+    seguida; o resultado fica no cache compartilhado (sem cache, não faz nada).
+    Especulativa: não gasta ficha do cliente, só a do tenant (cota esgotada =
+    não pré-carrega).
+    """
+    if isinstance(cache(), CacheDesligado):
+        return
+    for d in datas:
+        em_segundo_plano(agendamentos_bloqueantes_publico, tenant_id, d)
+
+
+def nova_chave_idempotencia() -> str:
+    """
+    Chave de idempotência de uma tentativa de reserva (uuid4). Quem chama gera
+    uma por intenção do cliente e repete a mesma só nos retries dela; o
+    servidor devolve a resposta original enquanto a reserva continuar
+    pendente/paga. Aleatória de propósito: derivada do conteúdo, dois clientes
+    com o mesmo nome e horário colidiriam e qualquer um poderia calcular a
+    chave de outro.
+    """
+    return str(uuid.uuid4())
+
+
+def reservar_horario_publico(
+    tenant_id: str,
+    cliente: str,
+    data_escolhida: date,
+    horario: str,
+    servicos: list,
+    valor_sinal: float,
+    idempotency_key: str | None = None,
+    recurso_id: str | None = None,
+    origem: str | None = None,
+) -> dict:
+    """
+    Chama URL_RESERVAR (reserva atômica). Sempre devolve um dict:
+    {"ok": True, "agendamento": {...}} ou {"ok": False, "error": ..., "details": ...}.
+    Erros do servidor vêm como estão (slot_taken, tenant_blocked,
+    resource_not_found, outside_hours, ...); falhas daqui são "edge_http_<status>", "network"
+    e "rate_limited" (details = segundos até liberar).
+    recurso_id = profissional escolhido pelo cliente; None = o servidor
+    atribui o primeiro profissional livre no horário (ou agenda única).
+    origem = IP/sessão do cliente, para o limite por cliente.
+    idempotency_key = uuid4 da intenção (nova_chave_idempotencia), o mesmo
+    quando o cliente repete a mesma reserva.
+    """
+    try:
+        limitar("reserva", tenant_id, origem)
+    except LimiteExcedido as e:
+        out = {"ok": False, "error": "rate_limited", "details": round(e.espera_seg, 1)}
+    else:
+        out = _post_reserva(
+            tenant_id, cliente, data_escolhida, horario, servicos, valor_sinal, idempotency_key, recurso_id
+        )
+    agenda_metricas.contar_reserva(out)
+    return out
+
+
+def _post_reserva(
+    tenant_id: str,
+    cliente: str,
+    data_escolhida: date,
+    horario: str,
+    servicos: list,
+    valor_sinal: float,
+    idempotency_key: str | None,
+    recurso_id: str | None,
+) -> dict:
+    # sem chave de quem chama: vale só para os retries desta chamada
+    idempotency_key = idempotency_key or nova_chave_idempotencia()
+    payload = {
+        "tenant_id": str(tenant_id),
+        "cliente": cliente.strip(),
+        "data": data_escolhida.isoformat(),
+        "horario": str(horario),
+        "servico": servicos_para_texto(servicos),
+        "valor": float(valor_sinal),
+        "idempotency_key": idempotency_key,
+        "recurso_id": recurso_id or None,
+    }
+    headers = dict(fn_headers(), **{"Idempotency-Key": idempotency_key})
+
+    try:
+        # timeout/queda de conexão/5xx de gateway: repete com a MESMA chave
+        for tentativa in range(RESERVA_TENTATIVAS):
+            try:
+                with medir("edge:reservar"):
+                    resp = requests.post(URL_RESERVAR, headers=headers, json=payload, timeout=12)
+            except (requests.Timeout, requests.ConnectionError):
+                if tentativa == RESERVA_TENTATIVAS - 1:
+                    raise
+                time.sleep(0.5 * (2 ** tentativa))
+                continue
+            if resp.status_code in (502, 503, 504) and tentativa < RESERVA_TENTATIVAS - 1:
+                time.sleep(0.5 * (2 ** tentativa))
+                continue
+            break
+
+        if resp.status_code != 200:
+            return {"ok": False, "error": f"edge_http_{resp.status_code}", "details": resp.text}
+
+        out = resp.json()
+        # deu certo ou o horário já foi pego: a ocupação em cache está velha
+        invalidar_agenda(tenant_id)
+        if not isinstance(out, dict):
+            return {"ok": False, "error": "edge_payload_invalid", "details": out}
+        if out.get("ok") is False:
+            return out
+        return dict(out, ok=True)
+    except Exception as e:
+        return {"ok": False, "error": "network", "details": str(e)}
+
+
+# ============================================================
+# WHATSAPP
+# ============================================================
+def montar_link_whatsapp(whatsapp_numero: str, texto: str):
+    num = "".join([c for c in str(whatsapp_numero or "") if c.isdigit()])
+    if num and not num.startswith("55"):
+        if len(num) in (10, 11):
+            num = "55" + num
+    text_encoded = urllib.parse.quote(texto, safe="")
+    return f"https://wa.me/{num}?text={text_encoded}"
+
+
+def montar_mensagem_pagamento_cliente(
+    nome,
+    data_atendimento: date,
+    horario,
+    servicos: list,
+    valor_sinal: float,
+    pix_chave: str,
+    pix_nome: str,
+    pix_cidade: str,
+    services_map: dict,
+    deposit_cfg: dict | None = None,
+    profissional: str = "",
+):
+    deposit_cfg = deposit_cfg or {"enabled": True, "value": float(valor_sinal)}
+    deposit_on = bool(deposit_cfg.get("enabled", True)) and float(valor_sinal or 0) > 0
+
+    servs = normalizar_servicos(servicos)
+    total = calcular_total_servicos(servs, services_map)
+    lista = "\n".join([f"• {s} ({fmt_brl(services_map.get(s, 0.0))})" for s in servs]) if servs else "-"
+    msg = (
+        "Olá! Quero agendar um atendimento.\n\n"
+        f"👤 Cliente: {nome}\n"
+        f"📅 Data: {data_atendimento.strftime('%d/%m/%Y')}\n"
+        f"⏰ Horário: {horario}\n"
+    )
+    if profissional:
+        msg += f"💅 Profissional: {profissional}\n"
+    msg += (
+        "🧾 Serviço(s):\n"
+        f"{lista}\n\n"
+        f"💰 Total: {fmt_brl(total)}\n"
+    )
+    if deposit_on:
+        msg += (
+            f"✅ Sinal: {fmt_brl(valor_sinal)}\n\n"
+            "Pix para pagamento do sinal:\n"
+            f"🔑 Chave Pix: {pix_chave}\n"
+            f"👤 Nome: {pix_nome}\n"
+            f"🏙️ Cidade: {pix_cidade}\n\n"
+            "📌 Após pagar, envie o comprovante aqui para eu confirmar como PAGO. 🙏"
+        )
+    else:
+        msg += "\n📌 Me confirme por aqui que eu valido o agendamento. 🙏"
+    return msg
@@ -0,0 +1,379 @@
+"""
+Realtime (Supabase) para o painel admin.
+
+Um feed por tenant, compartilhado por todas as sessões do processo: uma thread
+mantém o websocket do Supabase Realtime (protocolo Phoenix) inscrito nas
+mudanças de `agendamentos` filtradas por tenant_id e guarda os eventos num
+buffer circular com número de sequência. Cada sessão lembra o último número
+que viu e só lê o que chegou depois (vários leitores, nenhum "rouba" evento).
+
+Feed sem sessão lendo há OCIOSO_SEG para sozinho (thread e websocket
+fecham); a próxima sessão cria outro. Token recusado pelo servidor (expirado,
+inválido): o feed fica inativo — o painel volta ao fingerprint — e só tenta
+de novo quando uma sessão entrega um token diferente.
+
+Para desenvolvimento/testes existe um servidor local que fala o mesmo
+subconjunto do protocolo: `python agenda_realtime.py --servidor-local`;
+`python agenda_realtime.py --teste` roda o feed contra ele.
+"""
+import itertools
+import json
+import threading
+import time
+from collections import deque
+
+from websockets.exceptions import ConnectionClosed
+from websockets.sync.client import connect
+
+HEARTBEAT_SEG = 25
+MAX_EVENTOS = 200
+BACKOFF_MAX_SEG = 30
+OCIOSO_SEG = 600
+
+
+class TokenRecusado(Exception):
+    """Servidor recusou o access_token (join ou canal encerrado por token)."""
+
+
+def _erro_de_token(payload: dict) -> bool:
+    texto = json.dumps(payload).lower()
+    return any(p in texto for p in ("token", "jwt", "unauthorized"))
+
+
+def realtime_url(supabase_url: str, apikey: str) -> str:
+    base = (supabase_url or "").rstrip("/")
+    if base.startswith("https://"):
+        base = "wss://" + base[len("https://"):]
+    elif base.startswith("http://"):
+        base = "ws://" + base[len("http://"):]
+    return f"{base}/realtime/v1/websocket?apikey={apikey}&vsn=1.0.0"
+
+
+class FeedAgendamentos:
+    """Assinatura de postgres_changes em agendamentos de um tenant (thread própria)."""
+
+    def __init__(self, url: str, tenant_id: str, access_token: str):
+        self.url = url
+        self.tenant_id = str(tenant_id)
+        self.topic = f"realtime:agendamentos:{self.tenant_id}"
+        self._token = access_token
+        self._token_dirty = False
+        self._refs = itertools.count(1)
+        self._lock = threading.Lock()
+        self._eventos = deque(maxlen=MAX_EVENTOS)
+        self._seq = 0
+        self._parar = threading.Event()
+        self._token_novo = threading.Event()
+        self.ativo = False
+        self.token_recusado = False
+        self.ultimo_erro = ""
+        self.ultimo_uso = time.monotonic()
+        self._thread = threading.Thread(
+            target=self._loop, name=f"realtime-{self.tenant_id}", daemon=True
+        )
+
+    # ---------- API para as sessões ----------
+    def iniciar(self):
+        if not self._thread.is_alive():
+            self._thread.start()
+        return self
+
+    def parar(self):
+        self._parar.set()
+        self._token_novo.set()
+
+    @property
+    def parado(self) -> bool:
+        return self._parar.is_set()
+
+    def usar(self):
+        """Uma sessão está lendo o feed (adia a parada por ociosidade)."""
+        self.ultimo_uso = time.monotonic()
+
+    def ocioso(self) -> bool:
+        return time.monotonic() - self.ultimo_uso > OCIOSO_SEG
+
+    def atualizar_token(self, access_token: str):
+        if access_token and access_token != self._token:
+            self._token = access_token
+            self._token_dirty = True
+            self._token_novo.set()
+
+    @property
+    def ultimo_seq(self) -> int:
+        with self._lock:
+            return self._seq
+
+    def eventos_desde(self, seq: int):
+        """Retorna (eventos com número > seq, último número)."""
+        with self._lock:
+            novos = [e for n, e in self._eventos if n > seq]
+            return novos, self._seq
+
+    # ---------- thread ----------
+    def _msg(self, topic: str, event: str, payload: dict) -> str:
+        ref = str(next(self._refs))
+        return json.dumps({"topic": topic, "event": event, "payload": payload, "ref": ref, "join_ref": "1"})
+
+    def _join_payload(self) -> dict:
+        return {
+            "config": {
+                "broadcast": {"self": False},
+                "presence": {"key": ""},
+                "postgres_changes": [
+                    {
+                        "event": "*",
+                        "schema": "public",
+                        "table": "agendamentos",
+                        "filter": f"tenant_id=eq.{self.tenant_id}",
+                    }
+                ],
+            },
+            "access_token": self._token,
+        }
+
+    def _guardar(self, data: dict):
+        with self._lock:
+            self._seq += 1
+            self._eventos.append((self._seq, data))
+
+    def _sessao(self, ws):
+        ws.send(self._msg(self.topic, "phx_join", self._join_payload()))
+        proximo_hb = time.monotonic() + HEARTBEAT_SEG
+        while not self._parar.is_set():
+            if self.ocioso():
+                self.parar()
+                return
+            if self._token_dirty:
+                self._token_dirty = False
+                ws.send(self._msg(self.topic, "access_token", {"access_token": self._token}))
+
+            try:
+                raw = ws.recv(timeout=min(1.0, max(0.1, proximo_hb - time.monotonic())))
+            except TimeoutError:
+                raw = None
+
+            if time.monotonic() >= proximo_hb:
+                ws.send(self._msg("phoenix", "heartbeat", {}))
+                proximo_hb = time.monotonic() + HEARTBEAT_SEG
+
+            if raw is None:
+                continue
+
+            msg = json.loads(raw)
+            event = msg.get("event")
+            payload = msg.get("payload") or {}
+            if msg.get("topic") != self.topic:
+                continue
+            if event == "phx_reply":
+                if payload.get("status") == "ok":
+                    self.ativo = True
+                    self.token_recusado = False
+                elif _erro_de_token(payload):
+                    raise TokenRecusado(f"join recusado: {payload}")
+                else:
+                    raise RuntimeError(f"join recusado: {payload}")
+            elif event == "postgres_changes":
+                data = payload.get("data") or {}
+                if data:
+                    self._guardar(data)
+            elif event in ("phx_error", "phx_close", "system") and payload.get("status") == "error":
+                if _erro_de_token(payload):
+                    raise TokenRecusado(f"canal encerrado: {payload}")
+                raise RuntimeError(f"canal encerrado: {payload}")
+
+    def _loop(self):
+        espera = 1
+        while not self._parar.is_set():
+            if self.ocioso():
+                self.parar()
+                break
+            # token que chegar durante a sessão conta como "novo" se ela for recusada
+            self._token_novo.clear()
+            try:
+                with connect(self.url, open_timeout=10, close_timeout=2) as ws:
+                    espera = 1
+                    self._sessao(ws)
+            except TokenRecusado as e:
+                # repetir com o mesmo token não adianta: espera uma sessão trazer outro
+                self.ultimo_erro = str(e)
+                self.ativo = False
+                self.token_recusado = True
+                self._token_dirty = False
+                while not self._token_novo.wait(min(OCIOSO_SEG, 60)):
+                    if self.ocioso():
+                        self.parar()
+                        break
+                continue
+            except Exception as e:
+                self.ultimo_erro = str(e)
+            self.ativo = False
+            self._parar.wait(espera)
+            espera = min(espera * 2, BACKOFF_MAX_SEG)
+        self.ativo = False
+
+
+_FEEDS = {}
+_FEEDS_LOCK = threading.Lock()
+
+
+def feed_do_tenant(url: str, tenant_id: str, access_token: str) -> FeedAgendamentos:
+    """
+    Feed compartilhado do tenant (cria e inicia na primeira chamada). Cada
+    chamada conta como uso; feeds de outros tenants sem uso há OCIOSO_SEG
+    são parados e saem da lista aqui também.
+    """
+    key = (url, str(tenant_id))
+    with _FEEDS_LOCK:
+        for k, f in list(_FEEDS.items()):
+            if k != key and (f.parado or f.ocioso()):
+                f.parar()
+                del _FEEDS[k]
+        feed = _FEEDS.get(key)
+        if feed is None or feed.parado:
+            feed = FeedAgendamentos(url, tenant_id, access_token)
+            _FEEDS[key] = feed
+        feed.usar()
+        feed.atualizar_token(access_token)
+    return feed.iniciar()
+
+
+# ============================================================
+# SERVIDOR LOCAL (substituto do Supabase Realtime p/ dev e testes)
+# ============================================================
+class ServidorRealtimeLocal:
+    """
+    Fala só o necessário do protocolo: phx_join (responde ok), heartbeat e
+    access_token. `publicar()` empurra um postgres_change para quem estiver
+    inscrito no tenant. Tokens em `tokens_recusados` levam join com erro
+    (como um JWT expirado no Supabase).
+    """
+
+    def __init__(self, host: str = "127.0.0.1", port: int = 0):
+        from websockets.sync.server import serve
+
+        self.tokens_recusados = set()
+        self._inscritos = {}
+        self._lock = threading.Lock()
+        self._server = serve(self._handler, host, port)
+        self.port = self._server.socket.getsockname()[1]
+        self.url = f"ws://{host}:{self.port}/realtime/v1/websocket?apikey=local&vsn=1.0.0"
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+
+    def iniciar(self):
+        self._thread.start()
+        return self
+
+    def parar(self):
+        self._server.shutdown()
+
+    def _handler(self, ws):
+        topics = set()
+        try:
+            for raw in ws:
+                msg = json.loads(raw)
+                topic, event, ref = msg.get("topic"), msg.get("event"), msg.get("ref")
+                token = (msg.get("payload") or {}).get("access_token")
+                if event == "phx_join" and token in self.tokens_recusados:
+                    ws.send(json.dumps({
+                        "topic": topic,
+                        "event": "phx_reply",
+                        "payload": {"status": "error", "response": {"reason": "Invalid token"}},
+                        "ref": ref,
+                    }))
+                    continue
+                if event == "phx_join":
+                    topics.add(topic)
+                    with self._lock:
+                        self._inscritos.setdefault(topic, set()).add(ws)
+                if event in ("phx_join", "heartbeat", "access_token"):
+                    ws.send(json.dumps({
+                        "topic": topic,
+                        "event": "phx_reply",
+                        "payload": {"status": "ok", "response": {}},
+                        "ref": ref,
+                    }))
+        except ConnectionClosed:
+            pass
+        finally:
+            with self._lock:
+                for t in topics:
+                    self._inscritos.get(t, set()).discard(ws)
+
+    def publicar(self, tenant_id: str, tipo: str, record: dict, old_record: dict | None = None):
+        topic = f"realtime:agendamentos:{tenant_id}"
+        data = {
+            "type": tipo,
+            "schema": "public",
+            "table": "agendamentos",
+            "record": record,
+            "old_record": old_record or {},
+            "commit_timestamp": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+        }
+        msg = json.dumps({"topic": topic, "event": "postgres_changes", "payload": {"data": data}, "ref": None})
+        with self._lock:
+            alvos = list(self._inscritos.get(topic, ()))
+        for ws in alvos:
+            try:
+                ws.send(msg)
+            except Exception:
+                pass
+        return len(alvos)
+
+
+def _esperar(cond, seg: float = 5.0) -> bool:
+    fim = time.monotonic() + seg
+    while time.monotonic() < fim:
+        if cond():
+            return True
+        time.sleep(0.05)
+    return False
+
+
+def autoteste():
+    """Feed contra o servidor local: eventos chegam, token recusado, parada por ociosidade."""
+    global OCIOSO_SEG
+    srv = ServidorRealtimeLocal().iniciar()
+    try:
+        feed = feed_do_tenant(srv.url, "t-teste", "tok-1")
+        assert _esperar(lambda: feed.ativo), f"feed não conectou: {feed.ultimo_erro}"
+        assert srv.publicar("t-teste", "INSERT", {"id": 1}) == 1
+        assert srv.publicar("t-teste", "UPDATE", {"id": 1, "status": "pago"}) == 1
+        assert _esperar(lambda: feed.ultimo_seq == 2), "eventos não chegaram ao feed"
+        eventos, seq = feed.eventos_desde(0)
+        assert [e["type"] for e in eventos] == ["INSERT", "UPDATE"] and seq == 2
+        assert feed.eventos_desde(seq) == ([], 2), "leitor viu evento repetido"
+
+        # token recusado: fica inativo e não reconecta até vir outro token
+        srv.tokens_recusados.add("tok-ruim")
+        ruim = feed_do_tenant(srv.url, "t-token", "tok-ruim")
+        assert _esperar(lambda: ruim.token_recusado), "recusa do token não detectada"
+        assert not ruim.ativo
+        feed_do_tenant(srv.url, "t-token", "tok-bom")
+        assert _esperar(lambda: ruim.ativo and not ruim.token_recusado), "não reconectou com token novo"
+
+        # ociosidade: ninguém usa -> thread para e o feed sai da lista
+        OCIOSO_SEG = 0.2
+        time.sleep(0.3)
+        assert _esperar(lambda: feed.parado and ruim.parado), "feed ocioso não parou"
+        outro = feed_do_tenant(srv.url, "t-outro", "tok-1")
+        assert ("t-teste" not in {k[1] for k in _FEEDS}) and outro is not feed
+        outro.parar()
+    finally:
+        srv.parar()
+    print("ok")
+
+
+if __name__ == "__main__":
+    import sys
+
+    if "--teste" in sys.argv:
+        autoteste()
+    elif "--servidor-local" in sys.argv:
+        srv = ServidorRealtimeLocal(port=int(sys.argv[-1]) if sys.argv[-1].isdigit() else 8765).iniciar()
+        print(f"Realtime local em {srv.url}")
+        try:
+            while True:
+                time.sleep(3600)
+        except KeyboardInterrupt:
+            srv.parar()
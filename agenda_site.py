@@ -0,0 +1,364 @@
+"""
+Microsite estático de agendamento por tenant (link da bio).
+
+Gera site/<tenant_id>/index.html com nome, serviços e preços, catálogo,
+Pix e WhatsApp já renderizados; só a consulta de horários e a reserva saem
+do navegador, direto para a API (agenda_api.py). Pico de acesso vindo do
+Instagram vira arquivo estático servido pelo nginx/CDN, sem Python.
+
+O arquivo só é regravado quando o conteúdo muda (troca atômica), então dá
+para chamar a cada alteração de settings (o painel faz isso quando SITE_DIR
+está configurado) ou em loop:
+
+    python agenda_site.py --saida site --api https://api.exemplo.com <tenant_id> ...
+    python agenda_site.py --saida site --api https://api.exemplo.com --intervalo 60 <tenant_id> ...
+
+Cache no servidor web (ex.: nginx):
+    location /assets/ { add_header Cache-Control "public, max-age=31536000, immutable"; }
+    location /        { add_header Cache-Control "public, max-age=60, stale-while-revalidate=600"; }
+O JS tem hash no nome (assets/agenda.<hash>.js); o HTML é pequeno e curto.
+"""
+import argparse
+import hashlib
+import html
+import json
+import os
+import sys
+import tempfile
+import time
+
+import agenda_nucleo
+from agenda_nucleo import (
+    calcular_sinal,
+    carregar_tenant_publico,
+    catalogo_publico,
+    fmt_brl,
+    recursos_ativos,
+    settings_get_capacity,
+    settings_get_catalog,
+    settings_get_deposit,
+    settings_get_durations,
+    settings_get_services,
+)
+
+JS_AGENDA = r"""
+(function () {
+  var dados = JSON.parse(document.getElementById("dados-agenda").textContent);
+  var api = dados.api.replace(/\/$/, "");
+  var $ = function (id) { return document.getElementById(id); };
+  var escolhido = null;
+
+  function hojeIso() {
+    var d = new Date(); d.setMinutes(d.getMinutes() - d.getTimezoneOffset());
+    return d.toISOString().slice(0, 10);
+  }
+  function servicos() {
+    return Array.prototype.slice.call(document.querySelectorAll("input[name=servico]:checked"))
+      .map(function (el) { return el.value; });
+  }
+  function brl(v) {
+    return "R$ " + Number(v).toFixed(2).replace(".", ",").replace(/\B(?=(\d{3})+(?!\d))/g, ".");
+  }
+  function aviso(txt, tipo) {
+    var el = $("aviso"); el.textContent = txt || ""; el.className = "aviso " + (tipo || "");
+  }
+  function resumo() {
+    var total = 0;
+    servicos().forEach(function (s) { total += (dados.precos[s] || 0); });
+    $("total").textContent = servicos().length ? "Total: " + brl(total) : "";
+  }
+
+  var pedido = 0;
+  function carregar() {
+    escolhido = null; $("reservar").disabled = true; resumo();
+    var lista = $("horarios"); lista.innerHTML = "";
+    if (!servicos().length || !$("data").value) { aviso("Escolha o serviço e o dia."); return; }
+    var meu = ++pedido;
+    aviso("Buscando horários...");
+    var q = "tenant=" + encodeURIComponent(dados.tenant_id) + "&de=" + $("data").value +
+      "&ate=" + $("data").value + "&servicos=" + encodeURIComponent(servicos().join(","));
+    if ($("profissional") && $("profissional").value) q += "&profissional=" + encodeURIComponent($("profissional").value);
+    fetch(api + "/api/disponibilidade?" + q).then(function (r) { return r.json(); }).then(function (out) {
+      if (meu !== pedido) return;
+      if (!out.dias) { aviso("Agenda indisponível no momento.", "erro"); return; }
+      var dia = out.dias[0];
+      if (!dia.horarios.length) {
+        aviso(dia.motivo ? "Sem atendimento nesse dia (" + dia.motivo + ")." : "Sem horários disponíveis nesse dia. Escolha outra data.");
+        return;
+      }
+      aviso("");
+      dia.horarios.forEach(function (h) {
+        var b = document.createElement("button");
+        b.type = "button"; b.className = "slot";
+        b.textContent = h.horario + (dados.capacidade > 1 ? " • " + h.vagas + (h.vagas === 1 ? " vaga" : " vagas") : "");
+        b.onclick = function () {
+          Array.prototype.forEach.call(lista.children, function (c) { c.classList.remove("on"); });
+          b.classList.add("on"); escolhido = h.horario; $("reservar").disabled = false;
+          var nome = dados.profissionais[h.profissional];
+          aviso(nome ? "Atendimento com " + nome + "." : "");
+        };
+        lista.appendChild(b);
+      });
+    }).catch(function () { if (meu === pedido) aviso("Falha de rede. Tente de novo.", "erro"); });
+  }
+
+  // uma chave (uuid4) por reserva que o cliente tenta; a mesma só ao repetir o mesmo pedido
+  var intencao = null;
+  function novaChave() {
+    if (window.crypto && crypto.randomUUID) return crypto.randomUUID();
+    var b = crypto.getRandomValues(new Uint8Array(16));
+    b[6] = (b[6] & 15) | 64; b[8] = (b[8] & 63) | 128;
+    var h = Array.prototype.map.call(b, function (x) { return (x + 256).toString(16).slice(1); }).join("");
+    return h.slice(0, 8) + "-" + h.slice(8, 12) + "-" + h.slice(12, 16) + "-" + h.slice(16, 20) + "-" + h.slice(20);
+  }
+  function chaveDaIntencao(corpo) {
+    if (!intencao || intencao.corpo !== corpo) intencao = { corpo: corpo, chave: novaChave() };
+    return intencao.chave;
+  }
+
+  function reservar() {
+    var nome = $("nome").value.trim();
+    if (!nome || !escolhido) { aviso("Preencha seu nome e escolha um horário.", "erro"); return; }
+    $("reservar").disabled = true;
+    var corpo = JSON.stringify({
+      tenant_id: dados.tenant_id, cliente: nome, data: $("data").value, horario: escolhido,
+      servicos: servicos(), profissional: $("profissional") ? $("profissional").value : null
+    });
+    fetch(api + "/api/reservar", {
+      method: "POST", headers: { "content-type": "application/json", "idempotency-key": chaveDaIntencao(corpo) },
+      body: corpo
+    }).then(function (r) { return r.json(); }).then(function (out) {
+      if (out.ok) {
+        intencao = null;
+        $("whatsapp").href = out.whatsapp_link; $("confirmacao").hidden = false;
+        aviso("Reserva criada como PENDENTE. Envie a mensagem no WhatsApp para confirmar.", "ok");
+      } else if (out.error === "slot_taken") {
+        aviso("Esse horário acabou de ser reservado. Escolha outro.", "erro"); carregar();
+      } else if (out.error === "outside_hours") {
+        aviso("Esse horário saiu do expediente. Escolha outro.", "erro"); carregar();
+      } else {
+        aviso("Não foi possível reservar (" + out.error + ").", "erro"); $("reservar").disabled = false;
+      }
+    }).catch(function () { aviso("Falha de rede. Tente de novo.", "erro"); $("reservar").disabled = false; });
+  }
+
+  $("data").min = hojeIso(); $("data").value = hojeIso();
+  $("data").onchange = carregar;
+  if ($("profissional")) $("profissional").onchange = carregar;
+  Array.prototype.forEach.call(document.querySelectorAll("input[name=servico]"), function (el) { el.onchange = carregar; });
+  $("reservar").onclick = reservar;
+  carregar();
+})();
+"""
+
+CSS = """
+body{margin:0;font-family:system-ui,-apple-system,Segoe UI,Roboto,sans-serif;background:#0b1220;color:#e5e7eb}
+main{max-width:560px;margin:0 auto;padding:24px 16px 64px}
+h1{font-size:1.6rem;margin:.2rem 0}h2{font-size:1.1rem;margin:1.6rem 0 .6rem}
+.sub{color:#94a3b8;margin:0 0 1rem}
+label{display:block;margin:.7rem 0 .3rem;color:#cbd5e1}
+input[type=text],input[type=date],select{width:100%;box-sizing:border-box;padding:.65rem;border-radius:10px;border:1px solid #334155;background:#111827;color:#e5e7eb}
+.servico{display:flex;justify-content:space-between;gap:.5rem;padding:.55rem .7rem;border:1px solid #1f2937;border-radius:10px;margin:.35rem 0}
+.servico span{color:#94a3b8}
+.slots{display:flex;flex-wrap:wrap;gap:.4rem;margin:.6rem 0}
+.slot{padding:.5rem .8rem;border-radius:999px;border:1px solid #334155;background:#111827;color:#e5e7eb;cursor:pointer}
+.slot.on{border-color:#38bdf8;background:rgba(56,189,248,.15)}
+.botao{display:block;width:100%;padding:.8rem;margin-top:1rem;border:0;border-radius:12px;background:#38bdf8;color:#0b1220;font-weight:700;text-align:center;text-decoration:none;cursor:pointer}
+.botao:disabled{opacity:.45;cursor:default}
+.aviso{min-height:1.2em;color:#94a3b8}.aviso.erro{color:#fca5a5}.aviso.ok{color:#86efac}
+.catalogo{display:grid;grid-template-columns:repeat(auto-fill,minmax(140px,1fr));gap:.5rem}
+.catalogo figure{margin:0}.catalogo img{width:100%;aspect-ratio:1;object-fit:cover;border-radius:10px}
+.catalogo figcaption{font-size:.85rem;color:#94a3b8}
+.pix{border:1px dashed #334155;border-radius:12px;padding:.8rem;color:#cbd5e1}
+"""
+
+
+def _js_nome() -> str:
+    return f"agenda.{hashlib.sha256(JS_AGENDA.encode('utf-8')).hexdigest()[:12]}.js"
+
+
+def _gravar_se_mudou(caminho: str, conteudo: str) -> bool:
+    """Troca atômica só quando o conteúdo muda (mtime/ETag do servidor ficam estáveis)."""
+    try:
+        with open(caminho, encoding="utf-8") as f:
+            if f.read() == conteudo:
+                return False
+    except FileNotFoundError:
+        pass
+    pasta = os.path.dirname(caminho)
+    os.makedirs(pasta, exist_ok=True)
+    fd, tmp = tempfile.mkstemp(dir=pasta, suffix=".tmp")
+    try:
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            f.write(conteudo)
+        os.chmod(tmp, 0o644)
+        os.replace(tmp, caminho)
+    except OSError:
+        try:
+            os.unlink(tmp)
+        except OSError:
+            pass
+        raise
+    return True
+
+
+def escrever_assets(saida: str) -> str:
+    """Grava o JS compartilhado (nome com hash) e devolve o caminho relativo."""
+    nome = _js_nome()
+    _gravar_se_mudou(os.path.join(saida, "assets", nome), JS_AGENDA)
+    return f"assets/{nome}"
+
+
+def renderizar_html(tenant: dict, api_base: str, js_rel: str, catalogo: list | None = None) -> str:
+    """catalogo = itens de catalogo_itens já carregados (ver _catalogo_inteiro)."""
+    settings = tenant.get("settings") if isinstance(tenant.get("settings"), dict) else {}
+    services_map = settings_get_services(settings)
+    durations = settings_get_durations(settings)
+    deposit_cfg = settings_get_deposit(settings)
+    catalog = settings_get_catalog(settings)
+    recursos = recursos_ativos(settings)
+    valor_sinal = calcular_sinal([], deposit_cfg)
+
+    nome = (tenant.get("nome") or "").strip()
+    if not nome or nome.lower() in ("minha loja", "minha agenda"):
+        nome = "Profissional"
+    whatsapp = "".join(c for c in str(tenant.get("whatsapp_numero") or "") if c.isdigit())
+    pode = bool(tenant.get("pode_operar", False)) and len(whatsapp) >= 10
+    e = html.escape
+
+    dados = {
+        "api": api_base,
+        "tenant_id": str(tenant.get("id") or ""),
+        "precos": {s: float(v) for s, v in services_map.items()},
+        "profissionais": {r["id"]: r["nome"] for r in recursos},
+        "capacidade": settings_get_capacity(settings),
+    }
+    # "</" dentro do JSON fecharia a tag <script>
+    dados_json = json.dumps(dados, ensure_ascii=False, sort_keys=True).replace("</", "<\\/")
+
+    partes = [
+        "<!doctype html>",
+        '<html lang="pt-BR"><head><meta charset="utf-8">',
+        '<meta name="viewport" content="width=device-width,initial-scale=1">',
+        f"<title>{e(nome)} • Agendamento</title>",
+        f'<meta property="og:title" content="{e(nome)} • Agendamento">',
+        f"<style>{CSS}</style></head><body><main>",
+        f"<h1>{e(nome)}</h1>",
+        '<p class="sub">Escolha o serviço, o dia e o horário disponível.</p>',
+    ]
+
+    if not pode:
+        partes.append('<p class="aviso erro">🔒 Agenda indisponível no momento.</p>')
+    else:
+        partes.append("<h2>📅 Agendamento</h2>")
+        partes.append('<label for="nome">Seu nome</label><input id="nome" type="text" autocomplete="name">')
+        partes.append("<label>Serviço (pode escolher mais de um)</label>")
+        for s, v in services_map.items():
+            dur = durations.get(s, 0)
+            extra = f" • {dur} min" if dur else ""
+            partes.append(
+                f'<label class="servico"><span><input type="checkbox" name="servico" value="{e(s)}"> {e(s)}</span>'
+                f"<span>{e(fmt_brl(v))}{e(extra)}</span></label>"
+            )
+        if len(recursos) > 1:
+            partes.append('<label for="profissional">Profissional</label><select id="profissional">')
+            partes.append('<option value="">Qualquer profissional</option>')
+            for r in recursos:
+                partes.append(f'<option value="{e(r["id"])}">{e(r["nome"])}</option>')
+            partes.append("</select>")
+        partes.append('<label for="data">Data do atendimento</label><input id="data" type="date">')
+        partes.append('<p id="total" class="sub"></p>')
+        partes.append('<div id="horarios" class="slots"></div><p id="aviso" class="aviso"></p>')
+        partes.append('<button id="reservar" class="botao" disabled>✅ Reservar horário</button>')
+        partes.append(
+            '<div id="confirmacao" hidden><a id="whatsapp" class="botao" href="#" target="_blank" '
+            'rel="noopener">📲 Abrir WhatsApp</a></div>'
+        )
+
+        if deposit_cfg["enabled"] and valor_sinal > 0:
+            pix_chave = (tenant.get("pix_chave") or "").strip()
+            pix_nome = (tenant.get("pix_nome") or "Profissional").strip()
+            pix_cidade = (tenant.get("pix_cidade") or "BRASIL").strip()
+            partes.append("<h2>💰 Sinal</h2>")
+            partes.append(
+                f'<div class="pix">Sinal de <b>{e(fmt_brl(valor_sinal))}</b> via Pix para confirmar.<br>'
+                f"🔑 {e(pix_chave)}<br>👤 {e(pix_nome)} • 🏙️ {e(pix_cidade)}</div>"
+            )
+
+    if catalog["enabled"] and catalogo:
+        partes.append('<h2>📒 Catálogo</h2><div class="catalogo">')
+        for it in catalogo:
+            cap = f"<figcaption>{e(it['legenda'])}</figcaption>" if it["legenda"] else ""
+            if it["tipo"] == "pdf":
+                partes.append(f'<figure><a href="{e(it["url"])}" target="_blank" rel="noopener">📄 PDF</a>{cap}</figure>')
+            else:
+                dim = ""
+                if it.get("largura") and it.get("altura"):
+                    dim = f' width="{int(it["largura"])}" height="{int(it["altura"])}"'
+                partes.append(f'<figure><img src="{e(it["url"])}" alt="{e(it["legenda"])}"{dim} loading="lazy">{cap}</figure>')
+        partes.append("</div>")
+
+    if pode:
+        partes.append(f'<script type="application/json" id="dados-agenda">{dados_json}</script>')
+        partes.append(f'<script src="../{e(js_rel)}" defer></script>')
+    partes.append("</main></body></html>")
+    return "\n".join(partes) + "\n"
+
+
+def _catalogo_inteiro(tenant_id: str, max_itens: int = 200) -> list:
+    """A página estática não pagina: junta as páginas do catálogo (até max_itens)."""
+    itens, pagina = [], 0
+    while len(itens) < max_itens:
+        pag = catalogo_publico(tenant_id, pagina)
+        itens.extend(pag["itens"])
+        pagina += 1
+        if not pag["itens"] or len(itens) >= pag["total"]:
+            break
+    return itens[:max_itens]
+
+
+def publicar_tenant(tenant_id: str, saida: str, api_base: str) -> bool | None:
+    """
+    (Re)gera site/<tenant_id>/index.html. True = gravou, False = nada mudou,
+    None = tenant não encontrado (arquivo existente fica como está).
+    Servidor fora (cópia desatualizada ou EdgeIndisponivel): não regrava.
+    """
+    tenant = carregar_tenant_publico(tenant_id)
+    if not tenant:
+        return None
+    if tenant.get("desatualizado"):
+        return False
+    js_rel = escrever_assets(saida)
+    settings = tenant.get("settings") if isinstance(tenant.get("settings"), dict) else {}
+    catalogo = _catalogo_inteiro(tenant_id) if settings_get_catalog(settings)["enabled"] else []
+    pagina = renderizar_html(tenant, api_base, js_rel, catalogo)
+    return _gravar_se_mudou(os.path.join(saida, str(tenant_id), "index.html"), pagina)
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="Gera o microsite estático de agendamento por tenant.")
+    ap.add_argument("tenants", nargs="+", help="ids dos tenants")
+    ap.add_argument("--saida", default="site", help="pasta servida pelo servidor web")
+    ap.add_argument("--api", required=True, help="URL base da agenda_api (ex.: https://api.exemplo.com)")
+    ap.add_argument("--intervalo", type=int, default=0, help="segundos entre verificações (0 = uma vez)")
+    args = ap.parse_args(argv)
+
+    agenda_nucleo.configurar(agenda_nucleo.ler_segredos())
+    while True:
+        for tid in args.tenants:
+            try:
+                r = publicar_tenant(tid, args.saida, args.api)
+            except agenda_nucleo.EdgeIndisponivel:
+                print(f"{tid}: servidor indisponível, fica a página atual", file=sys.stderr)
+                continue
+            if r is None:
+                print(f"{tid}: tenant não encontrado", file=sys.stderr)
+            elif r:
+                print(f"{tid}: atualizado")
+        if args.intervalo <= 0:
+            return 0
+        time.sleep(args.intervalo)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,17 +1,81 @@
 import streamlit as st
 import pandas as pd
 from datetime import date, datetime, timedelta, timezone
-import urllib.parse
 import requests
 import fitz  # PyMuPDF
 from PIL import Image
 import io
 import re
 import unicodedata
+import time
+import uuid
+from types import SimpleNamespace
 from supabase import create_client
 from streamlit_js_eval import get_page_location
 
+from agenda_realtime import feed_do_tenant, realtime_url
+from agenda_cache import hash_token
+import agenda_medicao
+import agenda_metricas
+from agenda_medicao import medido
+from agenda_disponibilidade import (
+    expandir_recorrentes,
+    proximos_feriados,
+    hhmm_para_min,
+    min_para_hhmm,
+)
+import agenda_nucleo
+from agenda_site import publicar_tenant
+from agenda_nucleo import (
+    STATUS_ALL,
+    VALOR_SINAL_FIXO,
+    cache,
+    invalidar_agenda,
+    invalidar_tenant,
+    norm_status,
+    parse_dt,
+    parse_date_iso,
+    fmt_brl,
+    normalizar_servicos,
+    servicos_para_texto,
+    calcular_total_servicos,
+    calcular_sinal,
+    validar_hhmm,
+    unique_sorted_times,
+    fn_headers,
+    settings_get_services,
+    settings_get_working_hours,
+    settings_get_working_rules,
+    settings_get_date_exceptions,
+    settings_get_slot_calendar,
+    settings_get_durations,
+    settings_get_buffer,
+    settings_get_capacity,
+    settings_get_resources,
+    recursos_ativos,
+    settings_get_deposit,
+    settings_get_catalog,
+    EdgeIndisponivel,
+    LimiteExcedido,
+    limitar,
+    origem_requisicao,
+    carregar_tenant_publico,
+    catalogo_publico,
+    item_catalogo,
+    agendamentos_bloqueantes_publico,
+    disponibilidade_publico,
+    precarregar_ocupacao,
+    reservar_horario_publico,
+    nova_chave_idempotencia,
+    carregar_em_paralelo,
+    montar_link_whatsapp,
+    montar_mensagem_pagamento_cliente,
+)
+
 # 👇 Só depois começa o resto do app
+# tempo desta execução (helpers de rede + blocos de tela), ver painel_debug
+agenda_medicao.iniciar()
+
 if "page" not in st.session_state:
     st.session_state["page"] = "login"
 
@@ -56,9 +120,10 @@ def handle_recovery_token():
 # ============================================================
 # TIMEZONE Brasil (UTC-3)
 # ============================================================
+LOCAL_TZ_NOME = "America/Sao_Paulo"
 try:
     from zoneinfo import ZoneInfo
-    LOCAL_TZ = ZoneInfo("America/Sao_Paulo")
+    LOCAL_TZ = ZoneInfo(LOCAL_TZ_NOME)
 except Exception:
     LOCAL_TZ = timezone(timedelta(hours=-3))
 
@@ -264,15 +329,48 @@ st.markdown("""
 SUPABASE_URL = st.secrets["SUPABASE_URL"]
 SUPABASE_ANON_KEY = st.secrets["SUPABASE_ANON_KEY"]
 
+# Reserva atômica: edge function ou direto a RPC {SUPABASE_URL}/rest/v1/rpc/reservar_horario
 URL_RESERVAR = st.secrets.get("URL_RESERVAR", "").strip()
+# Ocupação do dia: edge function ou a RPC agregada {SUPABASE_URL}/rest/v1/rpc/ocupacao_dia
 URL_HORARIOS = st.secrets.get("URL_HORARIOS", "").strip()
 URL_TENANT_PUBLIC = st.secrets.get("URL_TENANT_PUBLIC", "").strip()
+# Lista de espera (opcional): edge function ou a RPC {SUPABASE_URL}/rest/v1/rpc/entrar_lista_espera
+URL_LISTA_ESPERA = st.secrets.get("URL_LISTA_ESPERA", "").strip()
 URL_CREATE_TENANT = st.secrets.get("URL_CREATE_TENANT", "").strip()
 URL_ASSINAR_PLANO = st.secrets.get("URL_ASSINAR_PLANO", "").strip()
 
 TRIAL_DIAS = int(st.secrets.get("TRIAL_DIAS", 7))
-TEMPO_EXPIRACAO_MIN = int(st.secrets.get("TEMPO_EXPIRACAO_MIN", 60))
+# TEMPO_EXPIRACAO_MIN (pendente ocupa o horário por N min) e RESERVA_TENTATIVAS
+# (tentativas ao chamar URL_RESERVAR) são lidos por agenda_nucleo.configurar.
+# De quantos em quantos segundos o painel consome a fila de vagas liberadas (lista de espera)
+ESPERA_INTERVALO_SEG = max(5, int(st.secrets.get("ESPERA_INTERVALO_SEG", 60)))
+# Tempo máximo (segundos) esperando as cargas paralelas do painel antes de desenhar
+ADMIN_ORCAMENTO_SEG = max(1.0, float(st.secrets.get("ADMIN_ORCAMENTO_SEG", 8)))
+# Idem para a página pública (tenant + ocupação do dia buscados juntos)
+PUBLICO_ORCAMENTO_SEG = max(1.0, float(st.secrets.get("PUBLICO_ORCAMENTO_SEG", 6)))
+# Ao trocar a data na página pública, pré-carrega a ocupação dos N dias seguintes. 0 = desligado.
+PUBLICO_PRECARGA_DIAS = max(0, int(st.secrets.get("PUBLICO_PRECARGA_DIAS", 3)))
+# Painel: a RPC admin_bootstrap traz até N agendamentos; se a agenda tiver mais,
+# a lista completa é buscada à parte. 0 = não usa a RPC (uma consulta por parte).
+ADMIN_BOOTSTRAP_LIMITE = max(0, int(st.secrets.get("ADMIN_BOOTSTRAP_LIMITE", 500)))
+# Quantos dias à frente a tabela do admin mostra clientes fixos no período "Tudo"
+RECORRENCIA_JANELA_DIAS = max(1, int(st.secrets.get("RECORRENCIA_JANELA_DIAS", 60)))
+# Intervalo (segundos) da checagem automática de novos agendamentos no painel. 0 = desligado.
+AUTO_REFRESH_SEG = int(st.secrets.get("AUTO_REFRESH_SEG", 30))
+# Realtime (push de mudanças em agendamentos). Com ele ligado cada checagem é só
+# memória, então AUTO_REFRESH_SEG pode ser bem menor. REALTIME_URL sobrescreve o
+# websocket do Supabase (ex.: servidor local de agenda_realtime.py).
+REALTIME_ATIVO = str(st.secrets.get("REALTIME_ATIVO", "0")).strip().lower() in ("1", "true", "sim")
+REALTIME_URL = st.secrets.get("REALTIME_URL", "").strip()
 PUBLIC_APP_BASE_URL = st.secrets.get("PUBLIC_APP_BASE_URL", "").strip()
+# Cache entre processos: CACHE_BACKEND = "disco" (SQLite em CACHE_DIR, visto
+# por todos os processos da máquina), "memoria" (só este processo) ou "off";
+# CACHE_TENANT_SEG / CACHE_AGENDA_SEG são lidos por agenda_nucleo.configurar.
+CACHE_AUTH_SEG = int(st.secrets.get("CACHE_AUTH_SEG", 60))
+# Microsite estático (agenda_site.py): pasta servida pelo servidor web + URL da
+# agenda_api. Com os dois, salvar settings/WhatsApp regenera a página do tenant.
+SITE_DIR = st.secrets.get("SITE_DIR", "").strip()
+SITE_API_URL = st.secrets.get("SITE_API_URL", "").strip()
 
 SAAS_PIX_CHAVE = st.secrets.get("SAAS_PIX_CHAVE", "").strip()
 SAAS_PIX_NOME = st.secrets.get("SAAS_PIX_NOME", "Suporte").strip()
@@ -283,44 +381,34 @@ SAAS_SUPORTE_WHATSAPP = st.secrets.get("SAAS_SUPORTE_WHATSAPP", "").strip()
 # Bucket do catálogo (Supabase Storage)
 CATALOGO_BUCKET = st.secrets.get("CATALOGO_BUCKET", "catalogos").strip() or "catalogos"
 
-# ============================================================
-# DEFAULTS (serviços + horários)
-# ============================================================
-DEFAULT_SERVICES = {
-    "Corte de cabelo": 50.0,
-    "Barba": 30.0,
-    "Manicure": 40.0,
-    "Pedicure": 50.0,
-    "Tatuagem (pequena)": 150.0,
-}
+# núcleo público (tenant, horários, reserva) lê o mesmo secrets
+agenda_nucleo.configurar(st.secrets)
 
-DEFAULT_WORKING_HOURS = {
-    "0": ["09:00", "10:00", "15:00"],
-    "1": ["09:00", "10:00", "15:00"],
-    "2": ["09:00", "10:00", "15:00"],
-    "3": ["09:00", "10:00", "15:00"],
-    "4": ["09:00", "10:00", "15:00"],
-    "5": ["09:00", "10:00", "15:00"],
-    "6": [],
-}
+# métricas do processo em METRICAS_PORTA (sobe uma vez; reruns não fazem nada)
+agenda_metricas.servir(agenda_nucleo.METRICAS_PORTA, agenda_nucleo.METRICAS_HOST)
+if "sessao_id" not in st.session_state:
+    st.session_state.sessao_id = uuid.uuid4().hex
+agenda_metricas.sessao_ativa(st.session_state.sessao_id)
 
-VALOR_SINAL_FIXO = 20.0
+# ============================================================
+# DEFAULTS (serviços + horários: DEFAULT_* em agenda_nucleo)
+# ============================================================
+# Passos possíveis (min) do horário por intervalos
+PASSOS_SLOT = [10, 15, 20, 30, 45, 60, 90, 120]
 
 # ============================================================
 # STATUS (Admin + Público)
 # ============================================================
-STATUS_ALL = ["pendente", "pago", "finalizado", "cancelado"]
 STATUS_LABELS = {
     "pendente": "🟡 pendente",
     "pago": "🔵 pago",
     "finalizado": "🟢 finalizado",
     "cancelado": "🔴 cancelado",
+    "recorrente": "🔁 cliente fixo",
 }
-STATUS_SORT = {"pendente": 0, "pago": 1, "finalizado": 2, "cancelado": 3}
-
-def norm_status(s: str) -> str:
-    s = (s or "").strip().lower()
-    return s if s in STATUS_ALL else (s or "pendente")
+STATUS_SORT = {"pendente": 0, "pago": 1, "finalizado": 2, "cancelado": 3, "recorrente": 1}
+# ocorrência de agendamento recorrente (só exibição; não é gravada)
+STATUS_RECORRENTE = "recorrente"
 
 # ============================================================
 # SUPABASE CLIENTS
@@ -342,23 +430,6 @@ def sb_user(access_token: str):
 # ============================================================
 # HELPERS
 # ============================================================
-def parse_dt(dt_str: str):
-    if not dt_str:
-        return None
-    try:
-        dt_str = dt_str.replace("Z", "+00:00")
-        return datetime.fromisoformat(dt_str)
-    except Exception:
-        return None
-
-def parse_date_iso(d):
-    if not d:
-        return None
-    try:
-        return date.fromisoformat(str(d))
-    except Exception:
-        return None
-
 def dias_restantes(paid_until) -> int:
     if not paid_until:
         return 0
@@ -373,9 +444,6 @@ def dias_restantes(paid_until) -> int:
         return 0
     return (paid - date.today()).days
 
-def agora_utc():
-    return datetime.now(timezone.utc)
-
 def agora_local():
     return datetime.now(LOCAL_TZ)
 
@@ -387,75 +455,15 @@ def agendamento_dt_local(data_str: str, horario_str: str):
     except Exception:
         return None
 
-def fmt_brl(v: float) -> str:
-    s = f"{float(v):,.2f}"
-    s = s.replace(",", "X").replace(".", ",").replace("X", ".")
-    return f"R$ {s}"
-
-def normalizar_servicos(servicos):
-    return [s.strip() for s in servicos if s and str(s).strip()]
-
-def servicos_para_texto(servicos):
-    return " + ".join(normalizar_servicos(servicos))
-
 def texto_para_lista_servicos(texto: str):
     if not texto:
         return []
     parts = [p.strip() for p in texto.split("+")]
     return [p for p in parts if p]
 
-def calcular_total_servicos(servicos, services_map):
-    total = 0.0
-    for s in normalizar_servicos(servicos):
-        total += float(services_map.get(s, 0.0))
-    return float(total)
-
-def calcular_sinal(_servicos, deposit_cfg: dict | None = None):
-    """
-    Se deposit_cfg["enabled"] == False => sinal = 0
-    Caso contrário usa deposit_cfg["value"] ou VALOR_SINAL_FIXO.
-    """
-    deposit_cfg = deposit_cfg or {"enabled": True, "value": float(VALOR_SINAL_FIXO)}
-    if not bool(deposit_cfg.get("enabled", True)):
-        return 0.0
-    try:
-        return float(deposit_cfg.get("value", VALOR_SINAL_FIXO))
-    except Exception:
-        return float(VALOR_SINAL_FIXO)
-
-def validar_hhmm(h: str) -> bool:
-    try:
-        hh, mm = h.split(":")
-        hh = int(hh)
-        mm = int(mm)
-        return 0 <= hh <= 23 and 0 <= mm <= 59
-    except Exception:
-        return False
-
-def unique_sorted_times(times):
-    clean = []
-    seen = set()
-    for t in times:
-        t = str(t).strip()
-        if not t:
-            continue
-        if not validar_hhmm(t):
-            continue
-        if t not in seen:
-            seen.add(t)
-            clean.append(t)
-    return sorted(clean)
-
 # ============================================================
 # EDGE FUNCTIONS HELPERS
 # ============================================================
-def fn_headers():
-    return {
-        "Content-Type": "application/json",
-        "apikey": SUPABASE_ANON_KEY,
-        "Authorization": f"Bearer {SUPABASE_ANON_KEY}",
-    }
-
 def assert_edge_config(must_have_create: bool = False, must_have_assinar: bool = False):
     missing = []
     if not URL_TENANT_PUBLIC:
@@ -583,16 +591,24 @@ if "show_catalog" not in st.session_state:
     st.session_state.show_catalog = False
 if "show_deposit" not in st.session_state:
     st.session_state.show_deposit = False
+if "show_exceptions" not in st.session_state:
+    st.session_state.show_exceptions = False
+if "show_resources" not in st.session_state:
+    st.session_state.show_resources = False
+if "show_recurring" not in st.session_state:
+    st.session_state.show_recurring = False
 if "payment_url" not in st.session_state:
     st.session_state.payment_url = None
 
 # ============================================================
 # AUTH (ADMIN)
 # ============================================================
+@medido("auth")
 def auth_signup(email: str, password: str):
     sb = sb_anon()
     return sb.auth.sign_up({"email": email, "password": password})
 
+@medido("auth")
 def auth_login(email: str, password: str):
     sb = sb_anon()
     return sb.auth.sign_in_with_password({"email": email, "password": password})
@@ -601,14 +617,24 @@ def auth_logout():
     st.session_state.access_token = None
     st.rerun()
 
-def get_auth_user(access_token: str):
+@medido("auth")
+def _buscar_auth_user(access_token: str):
     sb = sb_user(access_token)
     try:
         out = sb.auth.get_user(access_token)
-        return out.user if out else None
+        u = out.user if out else None
+        return {"id": str(u.id), "email": u.email or ""} if u else None
     except Exception:
         return None
 
+def get_auth_user(access_token: str):
+    """Usuário do token (id, email). Cacheado por hash do token, nunca o token em si."""
+    if not access_token:
+        return None
+    u = cache().obter("auth", hash_token(access_token), CACHE_AUTH_SEG, lambda: _buscar_auth_user(access_token))
+    return SimpleNamespace(**u) if u else None
+
+@medido("auth")
 def auth_send_reset_email(email: str):
     sb = sb_anon()
     return sb.auth.reset_password_email(
@@ -618,6 +644,7 @@ def auth_send_reset_email(email: str):
         }
     )
 
+@medido("auth")
 def auth_update_password(access_token: str, new_password: str):
     sb = sb_user(access_token)
     return sb.auth.update_user({"password": new_password})
@@ -626,12 +653,15 @@ def auth_update_password(access_token: str, new_password: str):
 # PROFILE (ADMIN)
 # ============================================================
 def carregar_profile(access_token: str):
+    u = get_auth_user(access_token)
+    if not u:
+        return None
+    return cache().obter(f"perfil:{u.id}", "perfil", agenda_nucleo.CACHE_TENANT_SEG, lambda: _buscar_profile(access_token, u))
+
+@medido("supabase")
+def _buscar_profile(access_token: str, u):
     sb = sb_user(access_token)
     try:
-        u = sb.auth.get_user(access_token).user
-        if not u:
-            return None
-
         uid = u.id
         email = u.email or ""
 
@@ -681,44 +711,114 @@ def carregar_profile(access_token: str):
         st.code(str(e))
         return None
 
-def salvar_profile(access_token: str, dados: dict):
+@medido("supabase")
+def salvar_perfil_admin(access_token: str, tenant_id: str, dados: dict):
+    """
+    Profile + WhatsApp do tenant numa transação (RPC salvar_perfil).
+    `dados` só com os campos a mudar. Retorna (ok, msg).
+    """
     sb = sb_user(access_token)
-    uid = sb.auth.get_user(access_token).user.id
-    return sb.table("profiles").update(dados).eq("id", uid).execute()
+    try:
+        out = sb.rpc("salvar_perfil", {"tenant_id": str(tenant_id), "dados": dados}).execute().data
+    except Exception as e:
+        return False, str(e)
+    if not isinstance(out, dict) or not out.get("ok"):
+        return False, str((out or {}).get("error") if isinstance(out, dict) else out)
 
-def atualizar_tenant_whatsapp(sb_or_token, uid: str, tenant_id: str, whatsapp: str):
-    sb = sb_or_token if hasattr(sb_or_token, "table") else sb_user(sb_or_token)
-    w = (whatsapp or "").strip()
-    return (
-        sb.table("tenants")
-        .update({"whatsapp_numero": w, "whatsapp": w})
-        .eq("id", str(tenant_id))
-        .eq("owner_user_id", uid)
-        .execute()
-    )
+    profile = out.get("profile") or {}
+    if profile.get("id"):
+        cache().set(f"perfil:{profile['id']}", "perfil", profile, agenda_nucleo.CACHE_TENANT_SEG)
+    if "whatsapp" in dados:
+        invalidar_tenant(tenant_id)
+        atualizar_site(tenant_id)
+    return True, ""
 
 # ============================================================
 # TENANT SETTINGS (JSON em tenants.settings)
 # ============================================================
-def get_tenant_settings_admin(access_token: str, tenant_id: str):
+def atualizar_site(tenant_id: str):
+    """Regrava o microsite estático do tenant (só se o conteúdo mudou)."""
+    if not (SITE_DIR and SITE_API_URL):
+        return
+    try:
+        publicar_tenant(str(tenant_id), SITE_DIR, SITE_API_URL)
+    except Exception:
+        pass
+
+class SettingsTenant(dict):
+    """tenants.settings + a versão lida (base do patch em save_tenant_settings_admin)."""
+    versao = None
+
+MSG_SETTINGS_CONFLITO = "Essas configurações foram alteradas em outra aba ou aparelho. Recarregue a página e tente de novo."
+
+@medido("supabase")
+def _buscar_tenant_settings_admin(access_token: str, tenant_id: str):
     sb = sb_user(access_token)
     try:
-        resp = sb.table("tenants").select("settings").eq("id", tenant_id).single().execute()
+        resp = sb.table("tenants").select("settings,settings_versao").eq("id", tenant_id).single().execute()
         data = resp.data or {}
         s = data.get("settings")
-        if isinstance(s, dict):
-            return s
-        return {}
+        return {"settings": s if isinstance(s, dict) else {}, "versao": int(data.get("settings_versao") or 0)}
     except Exception:
-        return {}
+        return None
 
-def save_tenant_settings_admin(access_token: str, tenant_id: str, settings: dict):
+def guardar_settings_cache(tenant_id: str, settings: dict, versao):
+    cache().set(
+        f"tenant:{tenant_id}",
+        "settings",
+        {"settings": settings, "versao": versao},
+        agenda_nucleo.CACHE_TENANT_SEG,
+    )
+
+def get_tenant_settings_admin(access_token: str, tenant_id: str):
+    # a chave é só o tenant: o tenant_id do admin vem de carregar_tenant_admin (RLS do dono)
+    lido = cache().obter(
+        f"tenant:{tenant_id}",
+        "settings",
+        agenda_nucleo.CACHE_TENANT_SEG,
+        lambda: _buscar_tenant_settings_admin(access_token, tenant_id),
+    )
+    lido = lido if isinstance(lido, dict) else {}
+    out = SettingsTenant(lido.get("settings") or {})
+    out.versao = lido.get("versao")
+    return out
+
+@medido("supabase")
+def save_tenant_settings_admin(access_token: str, tenant_id: str, patch: dict, base: dict | None = None):
+    """
+    Grava só as chaves de `patch` (valor None remove a chave) via RPC
+    atualizar_settings. `base` = settings lidos por get_tenant_settings_admin:
+    a versão deles faz o banco recusar o patch se outra aba mudou alguma dessas
+    chaves depois da leitura. Em sucesso `base` vira o estado novo (pode salvar
+    de novo no mesmo painel). Retorna (ok, msg).
+    """
+    if not patch:
+        return True, ""
     sb = sb_user(access_token)
+    versao = getattr(base, "versao", None)
     try:
-        sb.table("tenants").update({"settings": settings}).eq("id", tenant_id).execute()
-        return True, ""
+        out = sb.rpc(
+            "atualizar_settings",
+            {"tenant_id": str(tenant_id), "patch": patch, "versao": versao},
+        ).execute().data
     except Exception as e:
         return False, str(e)
+    if not isinstance(out, dict) or not out.get("ok"):
+        erro = out.get("error") if isinstance(out, dict) else out
+        if erro == "conflict":
+            invalidar_tenant(tenant_id)
+            return False, MSG_SETTINGS_CONFLITO
+        return False, str(erro)
+
+    novos = out.get("settings") if isinstance(out.get("settings"), dict) else {}
+    invalidar_tenant(tenant_id)
+    guardar_settings_cache(tenant_id, novos, out.get("versao"))
+    atualizar_site(tenant_id)
+    if isinstance(base, SettingsTenant):
+        base.clear()
+        base.update(novos)
+        base.versao = out.get("versao")
+    return True, ""
 
 # ============================================================
 # ONBOARDING (primeira configuração após criar conta)
@@ -730,9 +830,7 @@ def settings_is_onboarding_done(settings: dict) -> bool:
         return False
 
 def mark_onboarding_done(access_token: str, tenant_id: str, settings: dict):
-    settings = dict(settings or {})
-    settings["onboarding_done"] = True
-    ok, err = save_tenant_settings_admin(access_token, tenant_id, settings)
+    ok, err = save_tenant_settings_admin(access_token, tenant_id, {"onboarding_done": True}, settings)
     return ok, err
 
 def tela_onboarding(access_token: str, tenant: dict):
@@ -741,8 +839,6 @@ def tela_onboarding(access_token: str, tenant: dict):
     Mostra apenas quando settings['onboarding_done'] != True.
     """
     tenant_id = str(tenant.get("id"))
-    user = get_auth_user(access_token)
-    uid = str(getattr(user, "id", "")) if user else ""
 
     settings = get_tenant_settings_admin(access_token, tenant_id) or {}
     if settings_is_onboarding_done(settings):
@@ -766,13 +862,8 @@ def tela_onboarding(access_token: str, tenant: dict):
         c1, c2 = st.columns([1, 1])
         with c1:
             if st.button("Continuar ➜", type="primary", use_container_width=True):
-                ok = True
-                if uid:
-                    try:
-                        atualizar_tenant_whatsapp(access_token, uid, tenant_id, w)
-                    except Exception:
-                        ok = False
-                # mesmo se falhar, deixa seguir (usuário pode ajustar depois)
+                # profile + tenant juntos; mesmo se falhar, deixa seguir (usuário pode ajustar depois)
+                salvar_perfil_admin(access_token, tenant_id, {"whatsapp": w.strip()})
                 st.session_state["onboarding_step"] = 2
                 st.rerun()
         with c2:
@@ -808,12 +899,10 @@ def tela_onboarding(access_token: str, tenant: dict):
                 if not nome:
                     st.error("Digite o nome do serviço.")
                 else:
-                    settings = dict(settings or {})
-                    sdict = dict(settings.get("services") or {})
+                    sdict = dict((settings or {}).get("services") or {})
                     sdict[nome] = float(s_preco or 0.0)
-                    settings["services"] = sdict
 
-                    ok, err = save_tenant_settings_admin(access_token, tenant_id, settings)
+                    ok, err = save_tenant_settings_admin(access_token, tenant_id, {"services": sdict}, settings)
                     if ok:
                         st.success("✅ Serviço adicionado.")
                         st.rerun()
@@ -855,9 +944,12 @@ def tela_onboarding(access_token: str, tenant: dict):
         st.caption("Você pode alterar isso depois nas configurações.")
 
         if st.button("Salvar e continuar ➜", type="primary", use_container_width=True):
-            settings = dict(settings or {})
-            settings["deposit"] = {"enabled": bool(enabled_new), "value": float(value_new)}
-            ok, err = save_tenant_settings_admin(access_token, tenant_id, settings)
+            ok, err = save_tenant_settings_admin(
+                access_token,
+                tenant_id,
+                {"deposit": {"enabled": bool(enabled_new), "value": float(value_new)}},
+                settings,
+            )
             if ok:
                 st.session_state["onboarding_step"] = 4
                 st.rerun()
@@ -904,78 +996,41 @@ def tela_onboarding(access_token: str, tenant: dict):
         st.stop()
 
 
-def settings_get_services(settings: dict):
-    s = settings.get("services")
-    if isinstance(s, dict) and s:
-        out = {}
-        for k, v in s.items():
-            try:
-                out[str(k)] = float(v)
-            except Exception:
-                continue
-        return out if out else DEFAULT_SERVICES.copy()
-    return DEFAULT_SERVICES.copy()
-
-def settings_get_working_hours(settings: dict):
-    wh = settings.get("working_hours")
-    if isinstance(wh, dict):
-        out = {}
-        for k, v in wh.items():
-            if isinstance(v, list):
-                out[str(k)] = unique_sorted_times(v)
-            else:
-                out[str(k)] = []
-        for i in range(7):
-            out.setdefault(str(i), DEFAULT_WORKING_HOURS.get(str(i), []))
-        return out
-    return DEFAULT_WORKING_HOURS.copy()
-
 # ----------------------------
-# CATÁLOGO por tenant (settings)
-# settings["catalog"] = {
-#   "enabled": true,
-#   "items": [{"type":"image|pdf","path":"...","url":"...","caption":""}, ...]
-# }
+# SETTINGS: a leitura (settings_get_*) fica em agenda_nucleo, usada também
+# pela API; aqui ficam só os helpers de edição do painel.
 # ----------------------------
-def settings_get_catalog(settings: dict):
-    c = settings.get("catalog")
-    if isinstance(c, dict):
-        enabled = bool(c.get("enabled", True))
-        items = c.get("items")
-        if isinstance(items, list):
-            clean = []
-            for it in items:
-                if not isinstance(it, dict):
-                    continue
-                typ = str(it.get("type") or "image").lower().strip()
-                if typ not in ("image", "pdf"):
-                    typ = "image"
-                url = str(it.get("url") or "").strip()
-                path = str(it.get("path") or "").strip()
-                caption = str(it.get("caption") or "").strip()
-                if url and path:
-                    clean.append({"type": typ, "url": url, "path": path, "caption": caption})
-            return {"enabled": enabled, "items": clean}
-        return {"enabled": enabled, "items": []}
-    return {"enabled": True, "items": []}
-
-def settings_set_catalog(settings: dict, enabled: bool, items: list):
-    settings["catalog"] = {"enabled": bool(enabled), "items": items}
+def parse_faixas(txt: str):
+    """'09:00-12:00, 13:00-18:00' -> ([["09:00","12:00"], ...], [inválidas])"""
+    faixas, invalidas = [], []
+    for parte in (txt or "").split(","):
+        parte = parte.strip()
+        if not parte:
+            continue
+        ab = [x.strip() for x in parte.replace("–", "-").split("-")]
+        if len(ab) != 2 or not validar_hhmm(ab[0]) or not validar_hhmm(ab[1]) or hhmm_para_min(ab[1]) <= hhmm_para_min(ab[0]):
+            invalidas.append(parte)
+            continue
+        faixas.append([min_para_hhmm(hhmm_para_min(ab[0])), min_para_hhmm(hhmm_para_min(ab[1]))])
+    return faixas, invalidas
+
+def fmt_duracao(minutos: int) -> str:
+    h, m = divmod(int(minutos or 0), 60)
+    if h and m:
+        return f"{h}h{m:02d}"
+    if h:
+        return f"{h}h"
+    return f"{m} min"
+
+# id novo para settings["resources"] (ver settings_get_resources)
+def novo_recurso_id() -> str:
+    return uuid.uuid4().hex[:8]
+
+# settings["catalog"]: só o liga/desliga (itens em catalogo_itens); leitura em agenda_nucleo.settings_get_catalog
+def settings_set_catalog(settings: dict, enabled: bool):
+    settings["catalog"] = {"enabled": bool(enabled)}
     return settings
 
-def settings_get_deposit(settings: dict):
-    d = settings.get("deposit")
-    if isinstance(d, dict):
-        enabled = bool(d.get("enabled", True))
-        try:
-            value = float(d.get("value", VALOR_SINAL_FIXO))
-        except Exception:
-            value = float(VALOR_SINAL_FIXO)
-        if value < 0:
-            value = 0.0
-        return {"enabled": enabled, "value": value}
-    return {"enabled": True, "value": float(VALOR_SINAL_FIXO)}
-
 def settings_set_deposit(settings: dict, enabled: bool, value: float):
     try:
         v = float(value)
@@ -1025,6 +1080,7 @@ def sanitize_filename(name: str) -> str:
     base = base.strip("._-")
     return base or "arquivo"
 
+@medido("storage")
 def upload_catalog_file(access_token: str, tenant_id: str, uploaded_file):
     """
     Upload direto no Supabase Storage via HTTP (RLS com auth.uid()).
@@ -1056,12 +1112,20 @@ def upload_catalog_file(access_token: str, tenant_id: str, uploaded_file):
                 return False, f"HTTP {resp.status_code}: {resp.text}", {}
 
         public_url = f"{SUPABASE_URL}/storage/v1/object/public/{CATALOGO_BUCKET}/{path}"
-        item = {"type": item_type, "path": path, "url": public_url, "caption": ""}
+        item = {"tipo": item_type, "path": path, "url": public_url, "legenda": ""}
+        if item_type == "image":
+            # dimensões ajudam a página a reservar o espaço da imagem (sem pulo no layout)
+            try:
+                with Image.open(io.BytesIO(file_bytes)) as img:
+                    item["largura"], item["altura"] = img.size
+            except Exception:
+                pass
         return True, "", item
 
     except Exception as e:
         return False, str(e), {}
 
+@medido("storage")
 def delete_catalog_item(access_token: str, path: str):
     try:
         if not path:
@@ -1097,30 +1161,165 @@ def delete_catalog_all(access_token: str, items: list):
     return removed, errs
 
 # ============================================================
-# TENANT LOAD (público / admin)
+# CATÁLOGO (tabela catalogo_itens, ordem por posicao)
 # ============================================================
-def carregar_tenant_publico(tenant_id: str):
-    assert_edge_config()
+def catalogo_alterado(tenant_id: str):
+    # páginas do catálogo ficam no cache do tenant
+    invalidar_tenant(tenant_id)
+    atualizar_site(tenant_id)
+
+@medido("supabase")
+def listar_catalogo_admin(access_token: str, tenant_id: str, pagina: int = 0, por_pagina: int | None = None):
+    """Uma página do catálogo do dono. Retorna (itens, total); ([], 0) em erro."""
+    por_pagina = int(por_pagina or agenda_nucleo.CATALOGO_POR_PAGINA)
+    de = max(0, int(pagina)) * por_pagina
+    sb = sb_user(access_token)
     try:
-        resp = requests.post(
-            URL_TENANT_PUBLIC,
-            headers=fn_headers(),
-            json={"tenant_id": str(tenant_id)},
-            timeout=12,
+        resp = (
+            sb.table("catalogo_itens")
+            .select("id,posicao,tipo,path,url,legenda,variantes,largura,altura", count="exact")
+            .eq("tenant_id", str(tenant_id))
+            .order("posicao")
+            .order("id")
+            .range(de, de + por_pagina - 1)
+            .execute()
         )
-        if resp.status_code != 200:
-            return None
-        payload = resp.json()
-        if isinstance(payload, dict) and isinstance(payload.get("tenant"), dict):
-            return payload["tenant"]
-        return None
+        itens = [it for it in (item_catalogo(r) for r in resp.data or []) if it]
+        return itens, int(resp.count or 0)
+    except Exception:
+        return [], 0
+
+@medido("supabase")
+def listar_paths_catalogo_admin(access_token: str, tenant_id: str):
+    sb = sb_user(access_token)
+    try:
+        resp = sb.table("catalogo_itens").select("id,path").eq("tenant_id", str(tenant_id)).execute()
+        return resp.data or []
+    except Exception:
+        return []
+
+@medido("supabase")
+def inserir_catalogo_admin(access_token: str, tenant_id: str, itens: list):
+    """Novos itens entram no fim (posição pelo trigger do banco). Retorna (ok, msg)."""
+    if not itens:
+        return True, ""
+    sb = sb_user(access_token)
+    try:
+        sb.table("catalogo_itens").insert([dict(it, tenant_id=str(tenant_id)) for it in itens]).execute()
+        catalogo_alterado(tenant_id)
+        return True, ""
+    except Exception as e:
+        return False, str(e)
+
+@medido("supabase")
+def atualizar_legendas_catalogo_admin(access_token: str, tenant_id: str, legendas: dict):
+    """legendas = {item_id: texto}, só as que mudaram. Retorna (ok, msg)."""
+    if not legendas:
+        return True, ""
+    sb = sb_user(access_token)
+    try:
+        for item_id, legenda in legendas.items():
+            (
+                sb.table("catalogo_itens")
+                .update({"legenda": legenda})
+                .eq("tenant_id", str(tenant_id))
+                .eq("id", int(item_id))
+                .execute()
+            )
+        catalogo_alterado(tenant_id)
+        return True, ""
+    except Exception as e:
+        return False, str(e)
+
+@medido("supabase")
+def mover_catalogo_admin(access_token: str, tenant_id: str, item_id: int, direcao: int):
+    """Troca a posição com o vizinho (direcao -1 = sobe, 1 = desce). Retorna (ok, msg)."""
+    sb = sb_user(access_token)
+    try:
+        out = sb.rpc("mover_item_catalogo", {"item_id": int(item_id), "direcao": int(direcao)}).execute().data
+    except Exception as e:
+        return False, str(e)
+    if not isinstance(out, dict) or not out.get("ok"):
+        return False, str((out or {}).get("error") if isinstance(out, dict) else out)
+    if out.get("movido"):
+        catalogo_alterado(tenant_id)
+    return True, ""
+
+@medido("supabase")
+def excluir_catalogo_admin(access_token: str, tenant_id: str, ids: list | None = None):
+    """Remove as linhas (ids=None: todas). O arquivo no Storage sai antes, por quem chama."""
+    sb = sb_user(access_token)
+    try:
+        q = sb.table("catalogo_itens").delete().eq("tenant_id", str(tenant_id))
+        if ids is not None:
+            q = q.in_("id", [int(i) for i in ids])
+        q.execute()
+        catalogo_alterado(tenant_id)
+        return True, ""
+    except Exception as e:
+        return False, str(e)
+
+# ============================================================
+# ADMIN BOOTSTRAP (uma RPC por execução)
+# ============================================================
+@medido("supabase")
+def _buscar_bootstrap_admin(access_token: str):
+    sb = sb_user(access_token)
+    try:
+        out = sb.rpc("admin_bootstrap", {"fuso": LOCAL_TZ_NOME, "limite": ADMIN_BOOTSTRAP_LIMITE}).execute().data
     except Exception:
         return None
+    if isinstance(out, dict) and out.get("ok") and isinstance(out.get("user"), dict):
+        return out
+    return None
+
+def carregar_bootstrap_admin(access_token: str):
+    """
+    Usuário, tenant, settings, profile, agenda e a virada pago -> finalizado numa
+    ida só (RPC admin_bootstrap). Espalha o resultado pelos caches que os
+    helpers de sempre já leem (auth, settings, profile, agenda da sessão), então
+    get_auth_user / get_tenant_settings_admin / carregar_profile /
+    carregar_agendamentos_cache não vão ao servidor nesta execução.
+    Retorna o payload ou None (RPC ausente/erro: cada helper busca sozinho).
+    """
+    st.session_state.pop("admin_boot_agenda", None)
+    if ADMIN_BOOTSTRAP_LIMITE <= 0:
+        return None
+    boot = _buscar_bootstrap_admin(access_token)
+    if boot is None:
+        return None
+
+    user = boot["user"]
+    c = cache()
+    c.set("auth", hash_token(access_token), user, CACHE_AUTH_SEG)
+    if isinstance(boot.get("profile"), dict):
+        c.set(f"perfil:{user['id']}", "perfil", boot["profile"], agenda_nucleo.CACHE_TENANT_SEG)
+
+    tenant = boot.get("tenant")
+    if isinstance(tenant, dict):
+        tenant_id = str(tenant.get("id"))
+        settings = boot.get("settings") if isinstance(boot.get("settings"), dict) else {}
+        guardar_settings_cache(tenant_id, settings, boot.get("settings_versao"))
+        kpis = boot.get("kpis") or {}
+        linhas = boot.get("agendamentos") or []
+        total = int(kpis.get("total") or 0)
+        # consumido uma vez por carregar_agendamentos_cache (reexecuções do fragmento buscam sozinhas)
+        st.session_state.admin_boot_agenda = {
+            "tenant_id": tenant_id,
+            "fp": (total, str(kpis.get("ultimo_criado") or "")),
+            "linhas": linhas if len(linhas) >= total else None,
+            "regras": boot.get("recorrentes") or [],
+        }
+    return boot
 
+# ============================================================
+# TENANT LOAD (público / admin)
+# ============================================================
+@medido("supabase")
 def carregar_tenant_admin(access_token: str):
     sb = sb_user(access_token)
     try:
-        uid = sb.auth.get_user(access_token).user.id
+        uid = get_auth_user(access_token).id
         resp = (
             sb.table("tenants")
             .select("id,nome,ativo,paid_until,billing_status,whatsapp_numero,pix_chave,pix_nome,pix_cidade,whatsapp,owner_user_id")
@@ -1132,6 +1331,7 @@ def carregar_tenant_admin(access_token: str):
     except Exception:
         return None
 
+@medido("edge")
 def criar_tenant_se_nao_existir(access_token: str):
     user = get_auth_user(access_token)
     if not user:
@@ -1156,52 +1356,42 @@ def criar_tenant_se_nao_existir(access_token: str):
 # ============================================================
 # PUBLIC: HORÁRIOS OCUPADOS + RESERVA
 # ============================================================
-def horarios_ocupados_publico(tenant_id: str, data_escolhida: date):
-    assert_edge_config()
+def origem_cliente() -> str:
+    """
+    Quem está usando a página, para o limite por cliente: IP
+    (agenda_nucleo.origem_requisicao: X-Forwarded-For só via TRUSTED_PROXIES)
+    ou, sem IP, a sessão.
+    """
     try:
-        resp = requests.post(
-            URL_HORARIOS,
-            headers=fn_headers(),
-            json={"tenant_id": str(tenant_id), "data": data_escolhida.isoformat()},
-            timeout=12,
-        )
-        if resp.status_code != 200:
-            return set()
-
-        payload = resp.json()
-        rows = payload.get("rows", []) if isinstance(payload, dict) else []
-
-        ocupados = set()
-        now = agora_utc()
+        peer = getattr(st.context, "ip_address", None)
+        xff = st.context.headers.get("X-Forwarded-For")
+    except Exception:
+        peer, xff = None, None
+    # ip_address vem None em conexão de localhost (ex.: nginx na mesma máquina)
+    origem = origem_requisicao(peer or "127.0.0.1", xff)
+    if origem and (peer or origem != "ip:127.0.0.1"):
+        return origem
+    if "pub_origem" not in st.session_state:
+        st.session_state.pub_origem = uuid.uuid4().hex
+    return f"sessao:{st.session_state.pub_origem}"
 
-        for r in rows:
-            horario = r.get("horario")
-            status = norm_status(r.get("status"))
 
-            # cancelado NÃO ocupa
-            if status == "cancelado":
-                continue
+def chave_idempotencia_reserva(intencao: str) -> str:
+    """
+    uuid4 da reserva que o cliente está tentando fazer (mesmos dados = mesma
+    chave, para o retry/duplo clique cair no replay); dados diferentes ou
+    reserva concluída = chave nova.
+    """
+    atual = st.session_state.get("reserva_idem")
+    if not atual or atual[0] != intencao:
+        atual = (intencao, nova_chave_idempotencia())
+        st.session_state.reserva_idem = atual
+    return atual[1]
 
-            if status in ("pago", "finalizado"):
-                ocupados.add(horario)
-                continue
 
-            if status == "pendente":
-                if TEMPO_EXPIRACAO_MIN <= 0:
-                    ocupados.add(horario)
-                else:
-                    created_at = parse_dt(r.get("created_at", ""))
-                    if created_at is None:
-                        ocupados.add(horario)
-                    else:
-                        if created_at.tzinfo is None:
-                            created_at = created_at.replace(tzinfo=timezone.utc)
-                        if (now - created_at) <= timedelta(minutes=TEMPO_EXPIRACAO_MIN):
-                            ocupados.add(horario)
+def aviso_limite(espera_seg: float):
+    st.warning(f"Muitas tentativas seguidas. Aguarde {max(1, round(espera_seg))}s e tente de novo.")
 
-        return ocupados
-    except Exception:
-        return set()
 
 def inserir_pre_agendamento_publico(
     tenant_id: str,
@@ -1210,58 +1400,117 @@ def inserir_pre_agendamento_publico(
     horario: str,
     servicos: list,
     valor_sinal: float,
+    idempotency_key: str | None = None,
+    recurso_id: str | None = None,
 ):
+    """
+    Reserva pela página (agenda_nucleo.reservar_horario_publico) mostrando o
+    erro na tela. Retorna a resposta do servidor ou None.
+    """
     assert_edge_config()
-    payload = {
-        "tenant_id": str(tenant_id),
-        "cliente": cliente.strip(),
-        "data": data_escolhida.isoformat(),
-        "horario": str(horario),
-        "servico": servicos_para_texto(servicos),
-        "valor": float(valor_sinal),
-    }
+    out = reservar_horario_publico(
+        tenant_id,
+        cliente,
+        data_escolhida,
+        horario,
+        servicos,
+        valor_sinal,
+        idempotency_key,
+        recurso_id,
+        origem=origem_cliente(),
+    )
+    if out.get("ok"):
+        return out
 
+    err = str(out.get("error") or "")
+    if err == "rate_limited":
+        aviso_limite(float(out.get("details") or 0))
+    elif err == "tenant_blocked":
+        st.error("🔒 Agenda indisponível (assinatura vencida/inativa).")
+    elif err == "slot_taken":
+        st.warning("Esse horário já foi reservado (ou lotou). Escolha outro.")
+    elif err == "resource_not_found":
+        st.warning("Esse profissional não está mais disponível. Escolha outro.")
+    elif err == "outside_hours":
+        st.warning("Esse horário não está mais no expediente desse dia. Escolha outro.")
+    elif err.startswith("edge_http_"):
+        st.error(f"Erro ao criar reserva (HTTP {err[len('edge_http_'):]}).")
+        st.code(out.get("details"))
+    elif err == "network":
+        st.error("Falha de rede ao chamar a função de reserva.")
+        st.code(out.get("details"))
+    else:
+        st.error("Erro retornado pela função:")
+        st.code(out)
+    return None
+
+@medido("edge")
+def entrar_lista_espera_publico(
+    tenant_id: str,
+    cliente: str,
+    whatsapp: str,
+    data_escolhida: date,
+    servicos: list,
+    recurso_id: str | None = None,
+):
+    """Coloca o cliente na lista de espera do dia. Retorna {"ok": True, "posicao": n} ou None."""
     try:
-        resp = requests.post(URL_RESERVAR, headers=fn_headers(), json=payload, timeout=12)
+        limitar("espera", tenant_id, origem_cliente())
+    except LimiteExcedido as e:
+        aviso_limite(e.espera_seg)
+        return None
+    try:
+        resp = requests.post(
+            URL_LISTA_ESPERA,
+            headers=fn_headers(),
+            json={
+                "tenant_id": str(tenant_id),
+                "data": data_escolhida.isoformat(),
+                "cliente": cliente.strip(),
+                "whatsapp": whatsapp.strip(),
+                "servico": servicos_para_texto(servicos),
+                "recurso_id": recurso_id or None,
+            },
+            timeout=12,
+        )
         if resp.status_code != 200:
-            st.error(f"Erro ao criar reserva (HTTP {resp.status_code}).")
+            st.error(f"Erro ao entrar na lista de espera (HTTP {resp.status_code}).")
             st.code(resp.text)
             return None
-
         out = resp.json()
         if isinstance(out, dict) and out.get("ok") is False:
-            err = out.get("error")
-            if err == "tenant_blocked":
-                st.error("🔒 Agenda indisponível (assinatura vencida/inativa).")
-            elif err == "slot_taken":
-                st.warning("Esse horário já foi reservado. Escolha outro.")
+            if out.get("error") == "invalid_payload":
+                st.warning("Confira seu nome e o WhatsApp com DDD.")
             else:
                 st.error("Erro retornado pela função:")
                 st.code(out)
             return None
-
         return out
     except Exception as e:
-        st.error("Falha de rede ao chamar a função de reserva.")
+        st.error("Falha de rede ao entrar na lista de espera.")
         st.code(str(e))
         return None
 
 # ============================================================
 # ADMIN: AGENDAMENTOS
 # ============================================================
+@medido("supabase")
 def listar_agendamentos_admin(access_token: str, tenant_id: str):
     sb = sb_user(access_token)
     resp = (
         sb.table("agendamentos")
-        .select("id,cliente,data,horario,servico,status,valor,created_at,tenant_id")
+        .select("id,cliente,data,horario,servico,status,valor,created_at,tenant_id,recurso_id")
         .eq("tenant_id", str(tenant_id))
         .order("data")
         .order("horario")
         .execute()
     )
-    df = pd.DataFrame(resp.data or [])
+    return agendamentos_para_df(resp.data or [])
+
+def agendamentos_para_df(linhas: list):
+    df = pd.DataFrame(linhas)
     if df.empty:
-        return pd.DataFrame(columns=["id", "Cliente", "Data", "Horário", "Serviço(s)", "Status", "Sinal", "Criado em"])
+        return pd.DataFrame(columns=["id", "Cliente", "Data", "Horário", "Serviço(s)", "Status", "Sinal", "Criado em", "recurso_id"])
 
     df.rename(
         columns={
@@ -1281,232 +1530,476 @@ def listar_agendamentos_admin(access_token: str, tenant_id: str):
     df["Sinal"] = df["Sinal"].apply(lambda x: float(x) if x is not None else 0.0)
     return df
 
-def marcar_status_admin(access_token: str, tenant_id: str, ag_id: int, novo_status: str):
-    novo_status = norm_status(novo_status)
-    sb = sb_user(access_token)
-    return (
-        sb.table("agendamentos")
-        .update({"status": novo_status})
-        .eq("tenant_id", str(tenant_id))
-        .eq("id", ag_id)
-        .execute()
-    )
-
-def excluir_agendamento_admin(access_token: str, tenant_id: str, ag_id: int):
-    sb = sb_user(access_token)
-    return sb.table("agendamentos").delete().eq("tenant_id", str(tenant_id)).eq("id", ag_id).execute()
-
-def atualizar_finalizados_admin(access_token: str, tenant_id: str):
+@medido("supabase")
+def fingerprint_agendamentos_admin(access_token: str, tenant_id: str):
     """
-    Converte 'pago' -> 'finalizado' quando o horário já passou.
-    (cancelado fica cancelado)
+    Assinatura barata da agenda: (quantidade, max(created_at)).
+    Uma consulta com count exato + limit 1, sem trazer a lista.
+    Retorna None se falhar (quem chama recarrega a lista normalmente).
     """
+    sb = sb_user(access_token)
     try:
-        sb = sb_user(access_token)
-        hoje = date.today().isoformat()
         resp = (
             sb.table("agendamentos")
-            .select("id,data,horario,status")
+            .select("created_at", count="exact")
             .eq("tenant_id", str(tenant_id))
-            .eq("status", "pago")
-            .lte("data", hoje)
+            .order("created_at", desc=True)
+            .limit(1)
             .execute()
         )
-        rows = resp.data or []
-        now = agora_local()
-        for r in rows:
-            ag_id = r.get("id")
-            dt = agendamento_dt_local(r.get("data"), r.get("horario"))
-            if dt and dt < now:
-                sb.table("agendamentos").update({"status": "finalizado"}).eq("tenant_id", str(tenant_id)).eq("id", ag_id).execute()
+        ultimo = (resp.data[0] or {}).get("created_at") if resp.data else None
+        return (int(resp.count or 0), str(ultimo or ""))
     except Exception:
-        return
-
-# ============================================================
-# WHATSAPP
-# ============================================================
-def montar_link_whatsapp(whatsapp_numero: str, texto: str):
-    num = "".join([c for c in str(whatsapp_numero or "") if c.isdigit()])
-    if num and not num.startswith("55"):
-        if len(num) in (10, 11):
-            num = "55" + num
-    text_encoded = urllib.parse.quote(texto, safe="")
-    return f"https://wa.me/{num}?text={text_encoded}"
-
-def montar_mensagem_pagamento_cliente(
-    nome,
-    data_atendimento: date,
-    horario,
-    servicos: list,
-    valor_sinal: float,
-    pix_chave: str,
-    pix_nome: str,
-    pix_cidade: str,
-    services_map: dict,
-    deposit_cfg: dict | None = None,
-):
-    deposit_cfg = deposit_cfg or {"enabled": True, "value": float(valor_sinal)}
-    deposit_on = bool(deposit_cfg.get("enabled", True)) and float(valor_sinal or 0) > 0
-
-    servs = normalizar_servicos(servicos)
-    total = calcular_total_servicos(servs, services_map)
-    lista = "\n".join([f"• {s} ({fmt_brl(services_map.get(s, 0.0))})" for s in servs]) if servs else "-"
-    msg = (
-        "Olá! Quero agendar um atendimento.\n\n"
-        f"👤 Cliente: {nome}\n"
-        f"📅 Data: {data_atendimento.strftime('%d/%m/%Y')}\n"
-        f"⏰ Horário: {horario}\n"
-        "🧾 Serviço(s):\n"
-        f"{lista}\n\n"
-        f"💰 Total: {fmt_brl(total)}\n"
-    )
-    if deposit_on:
-        msg += (
-            f"✅ Sinal: {fmt_brl(valor_sinal)}\n\n"
-            "Pix para pagamento do sinal:\n"
-            f"🔑 Chave Pix: {pix_chave}\n"
-            f"👤 Nome: {pix_nome}\n"
-            f"🏙️ Cidade: {pix_cidade}\n\n"
-            "📌 Após pagar, envie o comprovante aqui para eu confirmar como PAGO. 🙏"
-        )
-    else:
-        msg += "\n📌 Me confirme por aqui que eu valido o agendamento. 🙏"
-    return msg
+        return None
 
-# ============================================================
-# HORÁRIOS (usando settings)
-# ============================================================
-WEEKDAY_LABELS = {
-    "0": "Segunda",
-    "1": "Terça",
-    "2": "Quarta",
-    "3": "Quinta",
-    "4": "Sexta",
-    "5": "Sábado",
-    "6": "Domingo",
-}
+def feed_realtime_admin(access_token: str, tenant_id: str):
+    """Feed realtime compartilhado do tenant (ou None se desligado/indisponível)."""
+    if not REALTIME_ATIVO:
+        return None
+    try:
+        url = REALTIME_URL or realtime_url(SUPABASE_URL, SUPABASE_ANON_KEY)
+        return feed_do_tenant(url, tenant_id, access_token)
+    except Exception:
+        return None
 
-def horarios_do_dia_com_settings(d: date, working_hours: dict):
-    wd = str(d.weekday())
-    return working_hours.get(wd, [])
+def invalidar_cache_agendamentos():
+    st.session_state.pop("ag_cache", None)
+
+def carregar_agendamentos_cache(access_token: str, tenant_id: str):
+    """
+    Lista + settings da tabela, recarregados só quando o fingerprint muda.
+    Com realtime conectado o fingerprint é o número do último evento recebido
+    (nenhuma consulta enquanto nada muda); senão é o count/max(created_at).
+    Retorna (df, settings, regras, novos) — regras = clientes fixos (recorrentes),
+    novos = quantos agendamentos entraram desde a última leitura.
+    """
+    boot = st.session_state.pop("admin_boot_agenda", None)
+    if boot and boot["tenant_id"] != tenant_id:
+        boot = None
+
+    novos_rt = None
+    feed = feed_realtime_admin(access_token, tenant_id)
+    if feed is not None and feed.ativo:
+        # feed parado por ociosidade volta como outro objeto, com a sequência do zero
+        cursor = st.session_state.get("rt_cursor")
+        if cursor is None or cursor[0] != id(feed):
+            eventos, seq = [], feed.ultimo_seq
+        else:
+            eventos, seq = feed.eventos_desde(cursor[1])
+        st.session_state.rt_cursor = (id(feed), seq)
+        novos_rt = sum(1 for e in eventos if e.get("type") == "INSERT")
+        fp = ("rt", id(feed), seq)
+    elif boot:
+        fp = boot["fp"]
+    else:
+        fp = fingerprint_agendamentos_admin(access_token, tenant_id)
+
+    cache = st.session_state.get("ag_cache")
+    if cache and cache["tenant_id"] == tenant_id and fp is not None and cache["fp"] == fp:
+        return cache["df"].copy(), cache["settings"], cache["regras"], 0
+
+    if boot and boot["linhas"] is not None:
+        # veio tudo no admin_bootstrap (settings já está no cache)
+        carga = {
+            "df": agendamentos_para_df(boot["linhas"]),
+            "settings": get_tenant_settings_admin(access_token, tenant_id),
+            "regras": boot["regras"],
+        }
+    else:
+        # as três leituras são independentes: saem juntas
+        carga = carregar_em_paralelo(
+            {
+                "df": lambda: listar_agendamentos_admin(access_token, tenant_id),
+                "settings": lambda: get_tenant_settings_admin(access_token, tenant_id),
+                "regras": lambda: listar_recorrentes_admin(access_token, tenant_id),
+            },
+            ADMIN_ORCAMENTO_SEG,
+        )
+    anterior = cache if cache and cache["tenant_id"] == tenant_id else None
+    if len(carga) < 3:
+        # estourou o orçamento: mostra o que já tinha e tenta de novo na próxima execução
+        fp = anterior["fp"] if anterior else None
+    df = carga["df"] if "df" in carga else (anterior["df"] if anterior else listar_agendamentos_admin(access_token, tenant_id))
+    settings = carga["settings"] if "settings" in carga else (anterior["settings"] if anterior else {})
+    regras = carga["regras"] if "regras" in carga else (anterior["regras"] if anterior else [])
+    novos = 0
+    if novos_rt is not None:
+        novos = novos_rt
+    elif cache and cache["tenant_id"] == tenant_id and fp is not None and cache["fp"] is not None and cache["fp"][0] != "rt":
+        novos = max(0, fp[0] - cache["fp"][0])
+    st.session_state.ag_cache = {"tenant_id": tenant_id, "fp": fp, "df": df, "settings": settings, "regras": regras}
+    return df.copy(), settings, regras, novos
+
+# ----------------------------
+# CLIENTES FIXOS (agendamentos_recorrentes)
+# Uma linha por regra; as ocorrências são geradas só para a janela exibida
+# (expandir_recorrentes) e o banco faz o mesmo por dia em agenda_ocupacao.
+# ----------------------------
+FREQ_LABELS = {"semanal": "Toda semana", "quinzenal": "A cada 2 semanas", "mensal": "Todo mês"}
+
+@medido("supabase")
+def listar_recorrentes_admin(access_token: str, tenant_id: str):
+    sb = sb_user(access_token)
+    try:
+        resp = (
+            sb.table("agendamentos_recorrentes")
+            .select("id,cliente,servico,horario,recurso_id,valor,freq,inicio,fim,excecoes,ativo")
+            .eq("tenant_id", str(tenant_id))
+            .order("inicio")
+            .execute()
+        )
+        return resp.data or []
+    except Exception:
+        return []
+
+@medido("supabase")
+def salvar_recorrente_admin(access_token: str, tenant_id: str, regra: dict):
+    """Insere (sem id) ou atualiza a regra. Retorna (ok, msg)."""
+    sb = sb_user(access_token)
+    dados = {k: v for k, v in regra.items() if k != "id"}
+    dados["tenant_id"] = str(tenant_id)
+    try:
+        if regra.get("id"):
+            sb.table("agendamentos_recorrentes").update(dados).eq("tenant_id", str(tenant_id)).eq("id", int(regra["id"])).execute()
+        else:
+            sb.table("agendamentos_recorrentes").insert(dados).execute()
+        invalidar_agenda(tenant_id)
+        return True, "OK"
+    except Exception as e:
+        return False, str(e)
+
+@medido("supabase")
+def excluir_recorrente_admin(access_token: str, tenant_id: str, regra_id: int):
+    sb = sb_user(access_token)
+    try:
+        sb.table("agendamentos_recorrentes").delete().eq("tenant_id", str(tenant_id)).eq("id", int(regra_id)).execute()
+        invalidar_agenda(tenant_id)
+        return True, "OK"
+    except Exception as e:
+        return False, str(e)
+
+def ocorrencias_para_df(ocorrencias: list):
+    """Ocorrências (expandir_recorrentes) com as colunas da tabela do admin."""
+    return pd.DataFrame(
+        [
+            {
+                "id": None,
+                "Cliente": o["cliente"],
+                "Data": o["data"],
+                "Horário": str(o["horario"]),
+                "Serviço(s)": o["servico"],
+                "Status": STATUS_RECORRENTE,
+                "Sinal": 0.0,
+                "Criado em": "",
+                "recurso_id": o["recurso_id"],
+            }
+            for o in ocorrencias
+        ],
+        columns=["id", "Cliente", "Data", "Horário", "Serviço(s)", "Status", "Sinal", "Criado em", "recurso_id"],
+    )
+
+# ----------------------------
+# LISTA DE ESPERA
+# Cancelamento/exclusão (trigger) e pendente expirado viram eventos em
+# agenda_eventos; processar_lista_espera consome só esses eventos e oferece
+# cada vaga ao primeiro da fila do dia. O painel chama a RPC logo depois de
+# um cancelamento e, fora isso, no máximo a cada ESPERA_INTERVALO_SEG.
+# ----------------------------
+@medido("supabase")
+def processar_lista_espera_admin(access_token: str, tenant_id: str, forcar: bool = False):
+    """Consome a fila de vagas liberadas. Retorna as novas ofertas (lista), ou None se não era hora de rodar."""
+    agora = time.monotonic()
+    ultimo = st.session_state.get("espera_ultimo_proc")
+    if not forcar and ultimo is not None and agora - ultimo < ESPERA_INTERVALO_SEG:
+        return None
+    st.session_state.espera_ultimo_proc = agora
+    try:
+        sb = sb_user(access_token)
+        out = sb.rpc("processar_lista_espera", {"tenant_id": str(tenant_id)}).execute().data
+        if isinstance(out, dict) and out.get("ok"):
+            return out.get("ofertas") or []
+    except Exception:
+        pass
+    return []
+
+@medido("supabase")
+def listar_espera_admin(access_token: str, tenant_id: str):
+    """Entradas de hoje em diante que ainda interessam (aguardando / oferecido)."""
+    sb = sb_user(access_token)
+    try:
+        resp = (
+            sb.table("lista_espera")
+            .select("id,data,cliente,whatsapp,servico,status,horario_ofertado,created_at")
+            .eq("tenant_id", str(tenant_id))
+            .in_("status", ["aguardando", "oferecido"])
+            .gte("data", date.today().isoformat())
+            .order("data")
+            .order("created_at")
+            .execute()
+        )
+        return resp.data or []
+    except Exception:
+        return []
+
+@medido("supabase")
+def marcar_espera_admin(access_token: str, tenant_id: str, espera_id: int, novo_status: str):
+    sb = sb_user(access_token)
+    return (
+        sb.table("lista_espera")
+        .update({"status": novo_status})
+        .eq("tenant_id", str(tenant_id))
+        .eq("id", int(espera_id))
+        .execute()
+    )
+
+@medido("supabase")
+def marcar_status_admin(access_token: str, tenant_id: str, ag_id: int, novo_status: str):
+    novo_status = norm_status(novo_status)
+    sb = sb_user(access_token)
+    out = (
+        sb.table("agendamentos")
+        .update({"status": novo_status})
+        .eq("tenant_id", str(tenant_id))
+        .eq("id", ag_id)
+        .execute()
+    )
+    invalidar_agenda(tenant_id)
+    return out
+
+@medido("supabase")
+def excluir_agendamento_admin(access_token: str, tenant_id: str, ag_id: int):
+    sb = sb_user(access_token)
+    out = sb.table("agendamentos").delete().eq("tenant_id", str(tenant_id)).eq("id", ag_id).execute()
+    invalidar_agenda(tenant_id)
+    return out
+
+@medido("supabase")
+def atualizar_finalizados_admin(access_token: str, tenant_id: str):
+    """
+    Converte 'pago' -> 'finalizado' quando o horário já passou.
+    (cancelado fica cancelado)
+    Retorna quantos agendamentos foram atualizados.
+    """
+    atualizados = 0
+    try:
+        sb = sb_user(access_token)
+        hoje = date.today().isoformat()
+        resp = (
+            sb.table("agendamentos")
+            .select("id,data,horario,status")
+            .eq("tenant_id", str(tenant_id))
+            .eq("status", "pago")
+            .lte("data", hoje)
+            .execute()
+        )
+        rows = resp.data or []
+        now = agora_local()
+        for r in rows:
+            ag_id = r.get("id")
+            dt = agendamento_dt_local(r.get("data"), r.get("horario"))
+            if dt and dt < now:
+                sb.table("agendamentos").update({"status": "finalizado"}).eq("tenant_id", str(tenant_id)).eq("id", ag_id).execute()
+                atualizados += 1
+    except Exception:
+        pass
+    return atualizados
 
 # ============================================================
-# MENU (expander) com itens
+# WHATSAPP
 # ============================================================
-def menu_topo_comandos(access_token: str, tenant_id: str):
-    settings = get_tenant_settings_admin(access_token, tenant_id)
-    services_map = settings_get_services(settings)
-    working_hours = settings_get_working_hours(settings)
+def montar_mensagem_oferta_espera(nome, data_atendimento: date, horario, link_agenda: str):
+    return (
+        f"Olá, {nome}! Abriu uma vaga no dia {data_atendimento.strftime('%d/%m/%Y')} às {horario}. 🎉\n\n"
+        "Você estava na lista de espera. Se ainda quiser, reserve por aqui:\n"
+        f"{link_agenda}"
+    )
 
+def link_cliente(tenant_id: str) -> str:
     base = PUBLIC_APP_BASE_URL or "https://SEUAPP.streamlit.app"
-    link_cliente = f"{base}/?t={tenant_id}"
+    return f"{base}/?t={tenant_id}"
+
+# ============================================================
+# HORÁRIOS (usando settings)
+# ============================================================
+WEEKDAY_LABELS = {
+    "0": "Segunda",
+    "1": "Terça",
+    "2": "Quarta",
+    "3": "Quinta",
+    "4": "Sexta",
+    "5": "Sábado",
+    "6": "Domingo",
+}
+
+def horarios_do_dia_com_settings(d: date, working_hours: dict):
+    wd = str(d.weekday())
+    return working_hours.get(wd, [])
 
+# ============================================================
+# MENU (expander) com itens
+# Cada painel é um st.fragment: abrir/fechar/salvar reexecuta só o painel,
+# e cada um carrega o que precisa (settings/profile) apenas quando aberto.
+# ============================================================
+PAINEIS_MENU = [
+    "show_profile",
+    "show_copy",
+    "show_hours",
+    "show_exceptions",
+    "show_resources",
+    "show_recurring",
+    "show_services",
+    "show_catalog",
+    "show_deposit",
+]
+
+def abrir_painel(flag: str):
+    for p in PAINEIS_MENU:
+        st.session_state[p] = (p == flag)
+
+@st.fragment
+@medido("render")
+def menu_topo_comandos(access_token: str, tenant_id: str):
     with st.expander("☰ Menu rápido", expanded=False):
         st.caption("Ações do seu painel (perfil, link, horários, serviços e catálogo).")
 
         if st.button("👤 Meu perfil", use_container_width=True):
-            st.session_state.show_profile = True
-            st.session_state.show_copy = False
-            st.session_state.show_hours = False
-            st.session_state.show_services = False
-            st.session_state.show_catalog = False
-            st.session_state.show_deposit = False
+            abrir_painel("show_profile")
 
         if st.button("🔗 Copiar link do cliente", use_container_width=True):
-            st.session_state.show_copy = True
-            st.session_state.show_profile = False
-            st.session_state.show_hours = False
-            st.session_state.show_services = False
-            st.session_state.show_catalog = False
-            st.session_state.show_deposit = False
+            abrir_painel("show_copy")
 
         if st.button("⏰ Horário de trabalho", use_container_width=True):
-            st.session_state.show_hours = True
-            st.session_state.show_profile = False
-            st.session_state.show_copy = False
-            st.session_state.show_services = False
-            st.session_state.show_catalog = False
-            st.session_state.show_deposit = False
+            abrir_painel("show_hours")
+
+        if st.button("📆 Folgas, férias e feriados", use_container_width=True):
+            abrir_painel("show_exceptions")
+
+        if st.button("👩‍🎨 Profissionais", use_container_width=True):
+            abrir_painel("show_resources")
+
+        if st.button("🔁 Clientes fixos", use_container_width=True):
+            abrir_painel("show_recurring")
 
         if st.button("🧾 Serviços e valores", use_container_width=True):
-            st.session_state.show_services = True
-            st.session_state.show_profile = False
-            st.session_state.show_copy = False
-            st.session_state.show_hours = False
-            st.session_state.show_catalog = False
-            st.session_state.show_deposit = False
+            abrir_painel("show_services")
 
         if st.button("💰 Sinal (opcional)", use_container_width=True):
-            st.session_state.show_deposit = True
-            st.session_state.show_profile = False
-            st.session_state.show_copy = False
-            st.session_state.show_hours = False
-            st.session_state.show_services = False
-            st.session_state.show_catalog = False
+            abrir_painel("show_deposit")
 
         if st.button("📒 Catálogo (fotos/PDF)", use_container_width=True):
-            st.session_state.show_catalog = True
-            st.session_state.show_profile = False
+            abrir_painel("show_catalog")
+
+    painel_link_cliente(tenant_id)
+    painel_perfil(access_token, tenant_id)
+    painel_horarios(access_token, tenant_id)
+    painel_excecoes(access_token, tenant_id)
+    painel_recursos(access_token, tenant_id)
+    painel_recorrentes(access_token, tenant_id)
+    painel_servicos(access_token, tenant_id)
+    painel_catalogo(access_token, tenant_id)
+    painel_sinal(access_token, tenant_id)
+
+@st.fragment
+def painel_link_cliente(tenant_id: str):
+    if not st.session_state.show_copy:
+        return
+
+    with st.container(border=True):
+        st.markdown("### 🔗 Link do cliente")
+        st.text_input("Copie o link abaixo", value=link_cliente(tenant_id), key="link_cliente_input")
+        st.caption("Dica: clique no campo e use Ctrl+C (no celular: segure e copie).")
+        if st.button("Fechar", use_container_width=True):
             st.session_state.show_copy = False
-            st.session_state.show_hours = False
-            st.session_state.show_services = False
-            st.session_state.show_deposit = False
+            st.rerun(scope="fragment")
 
-    if st.session_state.show_copy:
-        with st.container(border=True):
-            st.markdown("### 🔗 Link do cliente")
-            st.text_input("Copie o link abaixo", value=link_cliente, key="link_cliente_input")
-            st.caption("Dica: clique no campo e use Ctrl+C (no celular: segure e copie).")
+@st.fragment
+def painel_perfil(access_token: str, tenant_id: str):
+    if not st.session_state.show_profile:
+        return
+
+    with st.container(border=True):
+        st.markdown("### 👤 Meu perfil")
+        profile = carregar_profile(access_token)
+        if not profile:
+            st.error("Não foi possível carregar seu perfil.")
+            return
+
+        nome = st.text_input("Nome da loja", value=profile.get("nome") or "")
+        whatsapp = st.text_input("WhatsApp (somente números)", value=profile.get("whatsapp") or "")
+        pix_chave = st.text_input("Chave Pix", value=profile.get("pix_chave") or "")
+        pix_nome = st.text_input("Nome do Pix", value=profile.get("pix_nome") or "")
+        pix_cidade = st.text_input("Cidade do Pix", value=profile.get("pix_cidade") or "")
+
+        c1, c2 = st.columns(2)
+        with c1:
+            if st.button("💾 Salvar", use_container_width=True, type="primary"):
+                ok, err = salvar_perfil_admin(
+                    access_token,
+                    tenant_id,
+                    {
+                        "nome": nome.strip(),
+                        "whatsapp": whatsapp.strip(),
+                        "pix_chave": pix_chave.strip(),
+                        "pix_nome": pix_nome.strip(),
+                        "pix_cidade": pix_cidade.strip(),
+                    },
+                )
+                if not ok:
+                    st.error("Não foi possível salvar o perfil.")
+                    st.code(err)
+                    return
+                st.success("Perfil atualizado!")
+                st.session_state.show_profile = False
+                st.rerun(scope="fragment")
+        with c2:
             if st.button("Fechar", use_container_width=True):
-                st.session_state.show_copy = False
-                st.rerun()
+                st.session_state.show_profile = False
+                st.rerun(scope="fragment")
 
-    if st.session_state.show_profile:
-        with st.container(border=True):
-            st.markdown("### 👤 Meu perfil")
-            profile = carregar_profile(access_token)
-            if not profile:
-                st.error("Não foi possível carregar seu perfil.")
-                return
-
-            nome = st.text_input("Nome da loja", value=profile.get("nome") or "")
-            whatsapp = st.text_input("WhatsApp (somente números)", value=profile.get("whatsapp") or "")
-            pix_chave = st.text_input("Chave Pix", value=profile.get("pix_chave") or "")
-            pix_nome = st.text_input("Nome do Pix", value=profile.get("pix_nome") or "")
-            pix_cidade = st.text_input("Cidade do Pix", value=profile.get("pix_cidade") or "")
-
-            c1, c2 = st.columns(2)
-            with c1:
-                if st.button("💾 Salvar", use_container_width=True, type="primary"):
-                    sb = sb_user(access_token)
-                    uid = sb.auth.get_user(access_token).user.id
-                    salvar_profile(
-                        access_token,
-                        {
-                            "nome": nome.strip(),
-                            "whatsapp": whatsapp.strip(),
-                            "pix_chave": pix_chave.strip(),
-                            "pix_nome": pix_nome.strip(),
-                            "pix_cidade": pix_cidade.strip(),
-                        },
-                    )
-                    atualizar_tenant_whatsapp(access_token, uid, tenant_id, whatsapp.strip())
-                    st.success("Perfil atualizado!")
-                    st.session_state.show_profile = False
-                    st.rerun()
-            with c2:
-                if st.button("Fechar", use_container_width=True):
-                    st.session_state.show_profile = False
-                    st.rerun()
+@st.fragment
+def painel_horarios(access_token: str, tenant_id: str):
+    if not st.session_state.show_hours:
+        return
 
-    if st.session_state.show_hours:
-        with st.container(border=True):
-            st.markdown("### ⏰ Horário de trabalho")
-            st.caption("Digite horários no formato **HH:MM**, separados por vírgula. Ex: 09:00, 10:00, 15:00")
+    settings = get_tenant_settings_admin(access_token, tenant_id)
+    working_hours = settings_get_working_hours(settings)
+    rules = settings_get_working_rules(settings)
+
+    with st.container(border=True):
+        st.markdown("### ⏰ Horário de trabalho")
+
+        modos = ["Por intervalos", "Lista de horários"]
+        modo = st.radio(
+            "Como você quer informar?",
+            modos,
+            index=0 if rules["enabled"] else 1,
+            horizontal=True,
+            key="wh_modo",
+        )
 
-            edited = {}
-            invalids = []
+        edited = {}
+        edited_days = {}
+        invalids = []
 
+        if modo == "Por intervalos":
+            st.caption(
+                "Informe as faixas de atendimento no formato **HH:MM-HH:MM**, separadas por vírgula "
+                "(ex.: 09:00-12:00, 13:00-18:00 — o intervalo entre elas é o almoço). Deixe vazio nos dias de folga."
+            )
+            step = st.selectbox(
+                "Um horário a cada (min)",
+                PASSOS_SLOT,
+                index=PASSOS_SLOT.index(rules["step"]) if rules["step"] in PASSOS_SLOT else PASSOS_SLOT.index(30),
+                key="wh_step",
+            )
+            for k in ["0", "1", "2", "3", "4", "5", "6"]:
+                txt_default = ", ".join(f"{a}-{b}" for a, b in rules["days"].get(k, []))
+                txt = st.text_input(f"{WEEKDAY_LABELS[k]}", value=txt_default, key=f"wr_{k}")
+                faixas, ruins = parse_faixas(txt)
+                invalids.extend(f"{WEEKDAY_LABELS[k]}: {r}" for r in ruins)
+                edited_days[k] = faixas
+        else:
+            st.caption("Digite horários no formato **HH:MM**, separados por vírgula. Ex: 09:00, 10:00, 15:00")
             for k in ["0", "1", "2", "3", "4", "5", "6"]:
                 cur = working_hours.get(k, [])
                 txt_default = ", ".join(cur)
@@ -1522,247 +2015,684 @@ def menu_topo_comandos(access_token: str, tenant_id: str):
                         cleaned.append(t)
                 edited[k] = unique_sorted_times(cleaned)
 
-            c1, c2 = st.columns(2)
-            with c1:
-                if st.button("💾 Salvar horários", use_container_width=True, type="primary"):
-                    if invalids:
-                        st.error("Há horários inválidos. Corrija antes de salvar:")
-                        st.code("\n".join(invalids))
-                    else:
-                        settings["working_hours"] = edited
-                        ok, msg = save_tenant_settings_admin(access_token, tenant_id, settings)
-                        if ok:
-                            st.success("Horários salvos!")
-                            st.session_state.show_hours = False
-                            st.rerun()
-                        else:
-                            st.warning("Não consegui salvar no banco.")
-                            st.code(msg)
-            with c2:
-                if st.button("Fechar", use_container_width=True):
-                    st.session_state.show_hours = False
-                    st.rerun()
-
-    if st.session_state.show_services:
-        with st.container(border=True):
-            st.markdown("### 🧾 Serviços e valores")
-            st.caption("Edite a lista e clique em salvar. Você pode adicionar linhas (dinâmico).")
-
-            df = pd.DataFrame([{"Servico": k, "Valor": float(v)} for k, v in services_map.items()])
-            df = df.sort_values("Servico").reset_index(drop=True)
+        capacidade = st.number_input(
+            "Clientes por horário",
+            min_value=1,
+            max_value=50,
+            step=1,
+            value=settings_get_capacity(settings),
+            help="Mais de 1 para aulas em grupo ou várias cadeiras: o horário só some quando lotar.",
+            key="wh_capacidade",
+        )
 
-            edited_df = st.data_editor(
-                df,
-                num_rows="dynamic",
-                use_container_width=True,
-                column_config={
-                    "Servico": st.column_config.TextColumn("Serviço"),
-                    "Valor": st.column_config.NumberColumn("Valor", min_value=0.0, step=1.0, format="%.2f"),
-                },
-                key="services_editor",
-            )
+        c1, c2 = st.columns(2)
+        with c1:
+            if st.button("💾 Salvar horários", use_container_width=True, type="primary"):
+                if invalids:
+                    st.error("Há horários inválidos. Corrija antes de salvar:")
+                    st.code("\n".join(invalids))
+                else:
+                    if modo == "Por intervalos":
+                        patch = {"working_rules": {"enabled": True, "step": int(step), "days": edited_days}}
+                    else:
+                        patch = {"working_hours": edited, "working_rules": dict(rules, enabled=False)}
+                    patch["slot_capacity"] = int(capacidade or 1)
+                    ok, msg = save_tenant_settings_admin(access_token, tenant_id, patch, settings)
+                    if ok:
+                        st.success("Horários salvos!")
+                        st.session_state.show_hours = False
+                        st.rerun(scope="fragment")
+                    else:
+                        st.warning("Não consegui salvar no banco.")
+                        st.code(msg)
+        with c2:
+            if st.button("Fechar", use_container_width=True):
+                st.session_state.show_hours = False
+                st.rerun(scope="fragment")
 
-            c1, c2 = st.columns(2)
-            with c1:
-                if st.button("💾 Salvar serviços", use_container_width=True, type="primary"):
-                    new_map = {}
-                    errors = []
+@st.fragment
+def painel_excecoes(access_token: str, tenant_id: str):
+    if not st.session_state.show_exceptions:
+        return
 
-                    for _, row in edited_df.iterrows():
-                        name = str(row.get("Servico") or "").strip()
-                        val = row.get("Valor")
+    settings = get_tenant_settings_admin(access_token, tenant_id)
+    exc = settings_get_date_exceptions(settings)
 
-                        if not name:
-                            continue
-                        try:
-                            fval = float(val)
-                            if fval < 0:
-                                errors.append(f"Valor negativo em: {name}")
-                                continue
-                            new_map[name] = fval
-                        except Exception:
-                            errors.append(f"Valor inválido em: {name}")
-
-                    if not new_map:
-                        errors.append("Você precisa ter pelo menos 1 serviço.")
-
-                    if errors:
-                        st.error("Corrija antes de salvar:")
-                        st.code("\n".join(errors))
-                    else:
-                        settings["services"] = new_map
-                        ok, msg = save_tenant_settings_admin(access_token, tenant_id, settings)
-                        if ok:
-                            st.success("Serviços salvos!")
-                            st.session_state.show_services = False
-                            st.rerun()
-                        else:
-                            st.warning("Não consegui salvar no banco.")
-                            st.code(msg)
+    with st.container(border=True):
+        st.markdown("### 📆 Folgas, férias e feriados")
+        st.caption(
+            "Cada linha vale do dia **De** até o dia **Até**. Deixe **Horários** vazio para fechar "
+            "(folga/férias) ou informe faixas HH:MM-HH:MM para um horário especial (ex.: abrir um domingo)."
+        )
 
-            with c2:
-                if st.button("Fechar", use_container_width=True):
-                    st.session_state.show_services = False
-                    st.rerun()
+        fechar_feriados = st.checkbox(
+            "Fechar nos feriados nacionais",
+            value=exc["fechar_feriados"],
+            key="exc_feriados",
+        )
+        prox = proximos_feriados(date.today(), 4)
+        if prox:
+            st.caption("Próximos: " + " • ".join(f"{d.strftime('%d/%m')} {nome}" for d, nome in prox))
 
-    # ==========================
-    # CATÁLOGO (fotos/PDF) - ADMIN
-    # ==========================
-    if st.session_state.show_catalog:
-        with st.container(border=True):
-            st.markdown("### 📒 Catálogo (fotos e PDF)")
-            st.caption("Envie fotos do seu trabalho ou um PDF. Aparece automaticamente no seu link público.")
-
-            catalog = settings_get_catalog(settings)
-            enabled = st.checkbox("Mostrar catálogo no link público", value=catalog["enabled"])
-            items = catalog["items"]
-
-            colA, colB = st.columns([1, 1])
-            with colA:
-                if st.button("🧹 Limpar catálogo inteiro (apagar tudo)", use_container_width=True):
-                    removed, errs = delete_catalog_all(access_token, items)
-                    items = []
-                    settings_set_catalog(settings, enabled=enabled, items=items)
-                    okx, msgx = save_tenant_settings_admin(access_token, tenant_id, settings)
-                    if okx:
-                        st.success(f"Catálogo limpo! Removidos: {removed}")
-                        if errs:
-                            st.warning("Alguns arquivos falharam ao remover (melhor esforço):")
-                            st.code("\n".join(errs))
-                        st.rerun()
-                    else:
-                        st.error("Não consegui salvar settings após limpar.")
-                        st.code(msgx)
-
-            st.divider()
-            st.markdown("**Adicionar arquivos**")
-            up = st.file_uploader(
-                "Selecione 1 ou mais arquivos (JPG/PNG/WEBP/PDF)",
-                type=["jpg", "jpeg", "png", "webp", "pdf"],
-                accept_multiple_files=True,
-                label_visibility="collapsed",
-            )
+        df = pd.DataFrame(
+            [
+                {
+                    "De": parse_date_iso(it["de"]),
+                    "Ate": parse_date_iso(it["ate"]),
+                    "Horarios": ", ".join(f"{a}-{b}" for a, b in it["faixas"]),
+                }
+                for it in exc["itens"]
+            ],
+            columns=["De", "Ate", "Horarios"],
+        )
+        edited_df = st.data_editor(
+            df,
+            num_rows="dynamic",
+            use_container_width=True,
+            column_config={
+                "De": st.column_config.DateColumn("De", format="DD/MM/YYYY"),
+                "Ate": st.column_config.DateColumn("Até", format="DD/MM/YYYY"),
+                "Horarios": st.column_config.TextColumn("Horários (vazio = fechado)"),
+            },
+            key="exceptions_editor",
+        )
 
-            if st.button("⬆️ Enviar arquivos", type="primary", use_container_width=True, disabled=not up):
-                added = 0
-                errs = []
-                for f in (up or []):
-                    ok, msg, item = upload_catalog_file(access_token, tenant_id, f)
-                    if ok and item:
-                        items.append(item)
-                        added += 1
-                    else:
-                        errs.append(f"{f.name}: {msg}")
+        c1, c2 = st.columns(2)
+        with c1:
+            if st.button("💾 Salvar exceções", use_container_width=True, type="primary"):
+                itens = []
+                errors = []
+                for _, row in edited_df.iterrows():
+                    de = parse_date_iso(row.get("De")) if not pd.isna(row.get("De")) else None
+                    ate = parse_date_iso(row.get("Ate")) if not pd.isna(row.get("Ate")) else None
+                    if not de and not ate:
+                        continue
+                    de = de or ate
+                    ate = ate or de
+                    if ate < de:
+                        de, ate = ate, de
+                    faixas, ruins = parse_faixas(str(row.get("Horarios") or ""))
+                    if ruins:
+                        errors.append(f"{de.strftime('%d/%m/%Y')}: {', '.join(ruins)}")
+                        continue
+                    itens.append({"de": de.isoformat(), "ate": ate.isoformat(), "faixas": faixas})
 
-                settings_set_catalog(settings, enabled=enabled, items=items)
-                ok2, msg2 = save_tenant_settings_admin(access_token, tenant_id, settings)
-                if ok2:
-                    st.success(f"✅ {added} arquivo(s) enviado(s).")
-                    if errs:
-                        st.warning("Alguns falharam:")
-                        st.code("\n".join(errs))
-                    st.rerun()
+                if errors:
+                    st.error("Há horários inválidos. Corrija antes de salvar:")
+                    st.code("\n".join(errors))
                 else:
-                    st.error("Não consegui salvar o catálogo no banco.")
-                    st.code(msg2)
-
-            st.divider()
-            st.markdown("**Seus arquivos**")
-            if not items:
-                st.info("Você ainda não enviou nada.")
-            else:
-                for idx, it in enumerate(list(items)):
-                    cols = st.columns([1.2, 1.8, 0.7])
-                    with cols[0]:
-                        if it.get("type") == "pdf":
-                            st.markdown("📄 **PDF**")
-                            st.link_button("Abrir PDF", it["url"], use_container_width=True)
-                        else:
-                            st.image(it["url"], use_container_width=True)
-
-                    with cols[1]:
-                        new_caption = st.text_input(
-                            f"Legenda (opcional) • #{idx+1}",
-                            value=it.get("caption", ""),
-                            key=f"cap_{idx}_{it['path']}",
-                        )
-                        items[idx]["caption"] = new_caption.strip()
-                        st.caption(it["path"])
-
-                    with cols[2]:
-                        if st.button("🗑️ Remover", key=f"rm_{idx}_{it['path']}", use_container_width=True):
-                            okd, msgd = delete_catalog_item(access_token, it["path"])
-                            if not okd:
-                                st.error("Falha ao remover do Storage.")
-                                st.code(msgd)
-                            else:
-                                items.pop(idx)
-                                settings_set_catalog(settings, enabled=enabled, items=items)
-                                ok3, msg3 = save_tenant_settings_admin(access_token, tenant_id, settings)
-                                if ok3:
-                                    st.success("Removido.")
-                                    st.rerun()
-                                else:
-                                    st.error("Removi do Storage, mas não consegui atualizar o banco.")
-                                    st.code(msg3)
-
-                st.divider()
-                c1, c2 = st.columns(2)
-                with c1:
-                    if st.button("💾 Salvar alterações do catálogo", use_container_width=True, type="primary"):
-                        settings_set_catalog(settings, enabled=enabled, items=items)
-                        ok4, msg4 = save_tenant_settings_admin(access_token, tenant_id, settings)
-                        if ok4:
-                            st.success("Catálogo atualizado!")
-                            st.rerun()
-                        else:
-                            st.error("Não consegui salvar.")
-                            st.code(msg4)
-                with c2:
-                    if st.button("Fechar", use_container_width=True):
-                        st.session_state.show_catalog = False
-                        st.rerun()
+                    ok, msg = save_tenant_settings_admin(
+                        access_token,
+                        tenant_id,
+                        {"date_exceptions": {"fechar_feriados": bool(fechar_feriados), "itens": itens}},
+                        settings,
+                    )
+                    if ok:
+                        st.success("Exceções salvas!")
+                        st.session_state.show_exceptions = False
+                        st.rerun(scope="fragment")
+                    else:
+                        st.warning("Não consegui salvar no banco.")
+                        st.code(msg)
+        with c2:
+            if st.button("Fechar", use_container_width=True):
+                st.session_state.show_exceptions = False
+                st.rerun(scope="fragment")
 
-    # ==========================
-    # SINAL (opcional) - ADMIN
-    # ==========================
-    deposit_cfg = settings_get_deposit(settings)
+@st.fragment
+def painel_recursos(access_token: str, tenant_id: str):
+    if not st.session_state.show_resources:
+        return
 
-    if st.session_state.show_deposit:
-        with st.container(border=True):
-            st.markdown("### 💰 Sinal (opcional)")
-            st.caption("Se desativar, a agenda funciona normalmente sem cobrança/PIX.")
+    settings = get_tenant_settings_admin(access_token, tenant_id)
+    recursos = settings_get_resources(settings)
+
+    with st.container(border=True):
+        st.markdown("### 👩‍🎨 Profissionais")
+        st.caption(
+            "Cadastre quem atende (ou cadeiras/salas). Cada profissional tem a própria agenda; "
+            "o cliente escolhe um ou fica com o primeiro livre, na ordem desta lista. "
+            "Deixe vazio para continuar com uma agenda só."
+        )
 
-            enabled = st.checkbox("Cobrar sinal para reservar", value=deposit_cfg["enabled"])
-            value = st.number_input("Valor do sinal (R$)", min_value=0.0, step=1.0, value=float(deposit_cfg["value"]))
+        df = pd.DataFrame(
+            [{"id": r["id"], "Nome": r["nome"], "Ativo": r["ativo"]} for r in recursos],
+            columns=["id", "Nome", "Ativo"],
+        )
+        edited_df = st.data_editor(
+            df,
+            num_rows="dynamic",
+            use_container_width=True,
+            column_config={
+                "id": None,
+                "Nome": st.column_config.TextColumn("Nome"),
+                "Ativo": st.column_config.CheckboxColumn("Atende", default=True),
+            },
+            key="resources_editor",
+        )
 
-            c1, c2 = st.columns(2)
-            with c1:
-                if st.button("💾 Salvar sinal", use_container_width=True, type="primary"):
-                    settings_set_deposit(settings, enabled=enabled, value=value)
-                    ok, msg = save_tenant_settings_admin(access_token, tenant_id, settings)
+        c1, c2 = st.columns(2)
+        with c1:
+            if st.button("💾 Salvar profissionais", use_container_width=True, type="primary"):
+                novos = []
+                nomes = set()
+                errors = []
+                for _, row in edited_df.iterrows():
+                    nome = str(row.get("Nome") or "").strip()
+                    if not nome:
+                        continue
+                    if nome.lower() in nomes:
+                        errors.append(f"Nome repetido: {nome}")
+                        continue
+                    nomes.add(nome.lower())
+                    rid = row.get("id")
+                    rid = str(rid).strip() if rid and not pd.isna(rid) else novo_recurso_id()
+                    ativo = row.get("Ativo")
+                    novos.append({"id": rid, "nome": nome, "ativo": True if pd.isna(ativo) else bool(ativo)})
+
+                if errors:
+                    st.error("Corrija antes de salvar:")
+                    st.code("\n".join(errors))
+                else:
+                    ok, msg = save_tenant_settings_admin(access_token, tenant_id, {"resources": novos}, settings)
                     if ok:
-                        st.success("Configuração de sinal salva!")
-                        st.session_state.show_deposit = False
+                        st.success("Profissionais salvos!")
+                        st.session_state.show_resources = False
+                        # nomes aparecem na tabela de agendamentos -> rerun completo
+                        invalidar_cache_agendamentos()
                         st.rerun()
                     else:
-                        st.error("Não consegui salvar.")
+                        st.warning("Não consegui salvar no banco.")
                         st.code(msg)
-            with c2:
-                if st.button("Fechar", use_container_width=True):
-                    st.session_state.show_deposit = False
-                    st.rerun()
+        with c2:
+            if st.button("Fechar", use_container_width=True):
+                st.session_state.show_resources = False
+                st.rerun(scope="fragment")
+
+def parse_lista_datas(txt: str):
+    """'24/12/2026, 2026-12-31' -> (["2026-12-24", "2026-12-31"], [inválidas])"""
+    datas, invalidas = [], []
+    for parte in (txt or "").split(","):
+        parte = parte.strip()
+        if not parte:
+            continue
+        try:
+            d = datetime.strptime(parte, "%d/%m/%Y").date() if "/" in parte else date.fromisoformat(parte)
+        except Exception:
+            invalidas.append(parte)
+            continue
+        datas.append(d.isoformat())
+    return sorted(set(datas)), invalidas
 
-# ============================================================
-# UI: MODO PÚBLICO (CLIENTE)
-# ============================================================
-def tela_publica():
-    tenant = carregar_tenant_publico(PUBLIC_TENANT_ID)
-    if not tenant:
-        st.error("Este link não é válido, não existe ou não está público ainda.")
-        st.stop()
+@st.fragment
+def painel_recorrentes(access_token: str, tenant_id: str):
+    if not st.session_state.show_recurring:
+        return
 
-    nome_raw = (tenant.get("nome") or "").strip()
+    settings = get_tenant_settings_admin(access_token, tenant_id)
+    recursos = settings_get_resources(settings)
+    nome_por_id = {r["id"]: r["nome"] for r in recursos}
+    id_por_nome = {r["nome"]: r["id"] for r in recursos}
+    regras = listar_recorrentes_admin(access_token, tenant_id)
+    freq_por_label = {v: k for k, v in FREQ_LABELS.items()}
+
+    with st.container(border=True):
+        st.markdown("### 🔁 Clientes fixos")
+        st.caption(
+            "Clientes que vêm sempre no mesmo horário. O horário fica ocupado em todas as datas da regra, "
+            "sem precisar lançar um por um. Em **Pular datas** informe as exceções (DD/MM/AAAA, separadas por vírgula)."
+        )
+
+        df = pd.DataFrame(
+            [
+                {
+                    "id": r.get("id"),
+                    "Cliente": r.get("cliente") or "",
+                    "Servico": r.get("servico") or "",
+                    "Horario": r.get("horario") or "",
+                    "Frequencia": FREQ_LABELS.get(r.get("freq"), FREQ_LABELS["semanal"]),
+                    "Inicio": parse_date_iso(r.get("inicio")),
+                    "Fim": parse_date_iso(r.get("fim")),
+                    "Pular": ", ".join(
+                        d.strftime("%d/%m/%Y") for d in (parse_date_iso(x) for x in (r.get("excecoes") or [])) if d
+                    ),
+                    "Profissional": nome_por_id.get(r.get("recurso_id") or "", ""),
+                    "Ativo": bool(r.get("ativo", True)),
+                }
+                for r in regras
+            ],
+            columns=["id", "Cliente", "Servico", "Horario", "Frequencia", "Inicio", "Fim", "Pular", "Profissional", "Ativo"],
+        )
+        column_config = {
+            "id": None,
+            "Cliente": st.column_config.TextColumn("Cliente"),
+            "Servico": st.column_config.TextColumn("Serviço(s)", help="Vários: separe com +"),
+            "Horario": st.column_config.TextColumn("Horário (HH:MM)"),
+            "Frequencia": st.column_config.SelectboxColumn(
+                "Frequência", options=list(FREQ_LABELS.values()), default=FREQ_LABELS["semanal"]
+            ),
+            "Inicio": st.column_config.DateColumn("Primeira data", format="DD/MM/YYYY"),
+            "Fim": st.column_config.DateColumn("Até (opcional)", format="DD/MM/YYYY"),
+            "Pular": st.column_config.TextColumn("Pular datas"),
+            "Profissional": (
+                st.column_config.SelectboxColumn("Profissional", options=list(id_por_nome.keys()))
+                if recursos else None
+            ),
+            "Ativo": st.column_config.CheckboxColumn("Ativo", default=True),
+        }
+        edited_df = st.data_editor(
+            df,
+            num_rows="dynamic",
+            use_container_width=True,
+            column_config=column_config,
+            key="recurring_editor",
+        )
+
+        c1, c2 = st.columns(2)
+        with c1:
+            if st.button("💾 Salvar clientes fixos", use_container_width=True, type="primary"):
+                novas = []
+                errors = []
+                for _, row in edited_df.iterrows():
+                    cliente = str(row.get("Cliente") or "").strip()
+                    if not cliente:
+                        continue
+                    horario = str(row.get("Horario") or "").strip()
+                    if not validar_hhmm(horario):
+                        errors.append(f"{cliente}: horário inválido ({horario or 'vazio'})")
+                        continue
+                    inicio = parse_date_iso(row.get("Inicio")) if not pd.isna(row.get("Inicio")) else None
+                    fim = parse_date_iso(row.get("Fim")) if not pd.isna(row.get("Fim")) else None
+                    if not inicio:
+                        errors.append(f"{cliente}: informe a primeira data")
+                        continue
+                    if fim and fim < inicio:
+                        errors.append(f"{cliente}: data final antes da primeira")
+                        continue
+                    pular, ruins = parse_lista_datas(str(row.get("Pular") or ""))
+                    if ruins:
+                        errors.append(f"{cliente}: datas inválidas ({', '.join(ruins)})")
+                        continue
+                    servicos = texto_para_lista_servicos(str(row.get("Servico") or ""))
+                    rid = row.get("id")
+                    ativo = row.get("Ativo")
+                    novas.append({
+                        "id": int(rid) if rid is not None and not pd.isna(rid) else None,
+                        "cliente": cliente,
+                        "servico": servicos_para_texto(servicos),
+                        "horario": min_para_hhmm(hhmm_para_min(horario)),
+                        "recurso_id": id_por_nome.get(str(row.get("Profissional") or "")) or None,
+                        "freq": freq_por_label.get(row.get("Frequencia"), "semanal"),
+                        "inicio": inicio.isoformat(),
+                        "fim": fim.isoformat() if fim else None,
+                        "excecoes": pular,
+                        "ativo": True if pd.isna(ativo) else bool(ativo),
+                    })
+
+                if errors:
+                    st.error("Corrija antes de salvar:")
+                    st.code("\n".join(errors))
+                else:
+                    falhas = []
+                    mantidas = {r["id"] for r in novas if r["id"]}
+                    for r in regras:
+                        if r.get("id") not in mantidas:
+                            ok, msg = excluir_recorrente_admin(access_token, tenant_id, r["id"])
+                            if not ok:
+                                falhas.append(msg)
+                    for r in novas:
+                        ok, msg = salvar_recorrente_admin(access_token, tenant_id, r)
+                        if not ok:
+                            falhas.append(msg)
+
+                    if falhas:
+                        st.warning("Não consegui salvar tudo no banco.")
+                        st.code("\n".join(falhas))
+                    else:
+                        st.success("Clientes fixos salvos!")
+                        st.session_state.show_recurring = False
+                        # ocorrências aparecem na tabela de agendamentos -> rerun completo
+                        invalidar_cache_agendamentos()
+                        st.rerun()
+        with c2:
+            if st.button("Fechar", use_container_width=True):
+                st.session_state.show_recurring = False
+                st.rerun(scope="fragment")
+
+@st.fragment
+def painel_servicos(access_token: str, tenant_id: str):
+    if not st.session_state.show_services:
+        return
+
+    settings = get_tenant_settings_admin(access_token, tenant_id)
+    services_map = settings_get_services(settings)
+    durations = settings_get_durations(settings)
+
+    with st.container(border=True):
+        st.markdown("### 🧾 Serviços e valores")
+        st.caption("Edite a lista e clique em salvar. Você pode adicionar linhas (dinâmico).")
+        st.caption("Duração em minutos: o horário fica ocupado pelo tempo do serviço. Deixe 0 para ocupar só o horário de início.")
+
+        df = pd.DataFrame([
+            {"Servico": k, "Valor": float(v), "Duracao": int(durations.get(k, 0))}
+            for k, v in services_map.items()
+        ])
+        df = df.sort_values("Servico").reset_index(drop=True)
+
+        edited_df = st.data_editor(
+            df,
+            num_rows="dynamic",
+            use_container_width=True,
+            column_config={
+                "Servico": st.column_config.TextColumn("Serviço"),
+                "Valor": st.column_config.NumberColumn("Valor", min_value=0.0, step=1.0, format="%.2f"),
+                "Duracao": st.column_config.NumberColumn("Duração (min)", min_value=0, step=5, format="%d"),
+            },
+            key="services_editor",
+        )
+
+        buffer_min = st.number_input(
+            "Intervalo entre atendimentos (min)",
+            min_value=0,
+            step=5,
+            value=settings_get_buffer(settings),
+            key="services_buffer",
+        )
+
+        c1, c2 = st.columns(2)
+        with c1:
+            if st.button("💾 Salvar serviços", use_container_width=True, type="primary"):
+                new_map = {}
+                new_durations = {}
+                errors = []
+
+                for _, row in edited_df.iterrows():
+                    name = str(row.get("Servico") or "").strip()
+                    val = row.get("Valor")
+
+                    if not name:
+                        continue
+                    try:
+                        fval = float(val)
+                        if fval < 0:
+                            errors.append(f"Valor negativo em: {name}")
+                            continue
+                        new_map[name] = fval
+                    except Exception:
+                        errors.append(f"Valor inválido em: {name}")
+                        continue
+                    try:
+                        dur = int(row.get("Duracao") or 0)
+                    except Exception:
+                        dur = 0
+                    if dur > 0:
+                        new_durations[name] = dur
+
+                if not new_map:
+                    errors.append("Você precisa ter pelo menos 1 serviço.")
+
+                if errors:
+                    st.error("Corrija antes de salvar:")
+                    st.code("\n".join(errors))
+                else:
+                    ok, msg = save_tenant_settings_admin(
+                        access_token,
+                        tenant_id,
+                        {"services": new_map, "service_durations": new_durations, "buffer_min": int(buffer_min or 0)},
+                        settings,
+                    )
+                    if ok:
+                        st.success("Serviços salvos!")
+                        st.session_state.show_services = False
+                        # preços aparecem na tabela de agendamentos -> rerun completo
+                        invalidar_cache_agendamentos()
+                        st.rerun()
+                    else:
+                        st.warning("Não consegui salvar no banco.")
+                        st.code(msg)
+
+        with c2:
+            if st.button("Fechar", use_container_width=True):
+                st.session_state.show_services = False
+                st.rerun(scope="fragment")
+
+# ==========================
+# CATÁLOGO (fotos/PDF) - ADMIN
+# ==========================
+@st.fragment
+def painel_catalogo(access_token: str, tenant_id: str):
+    if not st.session_state.show_catalog:
+        return
+
+    settings = get_tenant_settings_admin(access_token, tenant_id)
+    por_pagina = agenda_nucleo.CATALOGO_POR_PAGINA
+
+    with st.container(border=True):
+        st.markdown("### 📒 Catálogo (fotos e PDF)")
+        st.caption("Envie fotos do seu trabalho ou um PDF. Aparece automaticamente no seu link público.")
+
+        catalog = settings_get_catalog(settings)
+        enabled = st.checkbox("Mostrar catálogo no link público", value=catalog["enabled"])
+
+        pagina = int(st.session_state.get("cat_pagina", 0))
+        items, total = listar_catalogo_admin(access_token, tenant_id, pagina, por_pagina)
+        paginas = max(1, -(-total // por_pagina))
+        if pagina >= paginas and total:
+            # página sumiu (itens removidos em outra aba): volta para a última
+            pagina = paginas - 1
+            st.session_state.cat_pagina = pagina
+            items, total = listar_catalogo_admin(access_token, tenant_id, pagina, por_pagina)
+
+        colA, colB = st.columns([1, 1])
+        with colA:
+            if st.button("🧹 Limpar catálogo inteiro (apagar tudo)", use_container_width=True, disabled=not total):
+                removed, errs = delete_catalog_all(access_token, listar_paths_catalogo_admin(access_token, tenant_id))
+                okx, msgx = excluir_catalogo_admin(access_token, tenant_id)
+                if okx:
+                    st.session_state.cat_pagina = 0
+                    st.success(f"Catálogo limpo! Removidos: {removed}")
+                    if errs:
+                        st.warning("Alguns arquivos falharam ao remover (melhor esforço):")
+                        st.code("\n".join(errs))
+                    st.rerun(scope="fragment")
+                else:
+                    st.error("Não consegui limpar o catálogo no banco.")
+                    st.code(msgx)
+
+        st.divider()
+        st.markdown("**Adicionar arquivos**")
+        up = st.file_uploader(
+            "Selecione 1 ou mais arquivos (JPG/PNG/WEBP/PDF)",
+            type=["jpg", "jpeg", "png", "webp", "pdf"],
+            accept_multiple_files=True,
+            label_visibility="collapsed",
+        )
+
+        if st.button("⬆️ Enviar arquivos", type="primary", use_container_width=True, disabled=not up):
+            novos = []
+            errs = []
+            for f in (up or []):
+                ok, msg, item = upload_catalog_file(access_token, tenant_id, f)
+                if ok and item:
+                    novos.append(item)
+                else:
+                    errs.append(f"{f.name}: {msg}")
+
+            ok2, msg2 = inserir_catalogo_admin(access_token, tenant_id, novos)
+            if ok2:
+                st.success(f"✅ {len(novos)} arquivo(s) enviado(s).")
+                if errs:
+                    st.warning("Alguns falharam:")
+                    st.code("\n".join(errs))
+                st.rerun(scope="fragment")
+            else:
+                st.error("Não consegui salvar o catálogo no banco.")
+                st.code(msg2)
+
+        st.divider()
+        st.markdown("**Seus arquivos**")
+        legendas = {}
+        if not items:
+            st.info("Você ainda não enviou nada.")
+        else:
+            for idx, it in enumerate(items):
+                n = pagina * por_pagina + idx + 1
+                cols = st.columns([1.2, 1.8, 0.7])
+                with cols[0]:
+                    if it["tipo"] == "pdf":
+                        st.markdown("📄 **PDF**")
+                        st.link_button("Abrir PDF", it["url"], use_container_width=True)
+                    else:
+                        st.image(it["url"], use_container_width=True)
+
+                with cols[1]:
+                    new_caption = st.text_input(
+                        f"Legenda (opcional) • #{n}",
+                        value=it["legenda"],
+                        key=f"cap_{it['id']}",
+                    ).strip()
+                    if new_caption != it["legenda"]:
+                        legendas[it["id"]] = new_caption
+                    st.caption(it["path"])
+
+                with cols[2]:
+                    c_up, c_down = st.columns(2)
+                    with c_up:
+                        if st.button("⬆️", key=f"up_{it['id']}", use_container_width=True, disabled=n == 1):
+                            okm, msgm = mover_catalogo_admin(access_token, tenant_id, it["id"], -1)
+                            if not okm:
+                                st.error(msgm)
+                            else:
+                                st.rerun(scope="fragment")
+                    with c_down:
+                        if st.button("⬇️", key=f"down_{it['id']}", use_container_width=True, disabled=n == total):
+                            okm, msgm = mover_catalogo_admin(access_token, tenant_id, it["id"], 1)
+                            if not okm:
+                                st.error(msgm)
+                            else:
+                                st.rerun(scope="fragment")
+                    if st.button("🗑️ Remover", key=f"rm_{it['id']}", use_container_width=True):
+                        okd, msgd = delete_catalog_item(access_token, it["path"])
+                        if not okd:
+                            st.error("Falha ao remover do Storage.")
+                            st.code(msgd)
+                        else:
+                            ok3, msg3 = excluir_catalogo_admin(access_token, tenant_id, [it["id"]])
+                            if ok3:
+                                st.success("Removido.")
+                                st.rerun(scope="fragment")
+                            else:
+                                st.error("Removi do Storage, mas não consegui atualizar o banco.")
+                                st.code(msg3)
+
+            if paginas > 1:
+                p1, p2, p3 = st.columns([1, 1, 1])
+                with p1:
+                    if st.button("⬅️ Anterior", key="cat_ant", use_container_width=True, disabled=pagina == 0):
+                        st.session_state.cat_pagina = pagina - 1
+                        st.rerun(scope="fragment")
+                with p2:
+                    st.caption(f"Página {pagina + 1} de {paginas} • {total} arquivo(s)")
+                with p3:
+                    if st.button("Próxima ➡️", key="cat_prox", use_container_width=True, disabled=pagina >= paginas - 1):
+                        st.session_state.cat_pagina = pagina + 1
+                        st.rerun(scope="fragment")
+
+        st.divider()
+        c1, c2 = st.columns(2)
+        with c1:
+            if st.button("💾 Salvar alterações do catálogo", use_container_width=True, type="primary"):
+                ok4, msg4 = atualizar_legendas_catalogo_admin(access_token, tenant_id, legendas)
+                if ok4 and enabled != catalog["enabled"]:
+                    settings_set_catalog(settings, enabled=enabled)
+                    ok4, msg4 = save_tenant_settings_admin(access_token, tenant_id, {"catalog": settings["catalog"]}, settings)
+                if ok4:
+                    st.success("Catálogo atualizado!")
+                    st.rerun(scope="fragment")
+                else:
+                    st.error("Não consegui salvar.")
+                    st.code(msg4)
+        with c2:
+            if st.button("Fechar", use_container_width=True):
+                st.session_state.show_catalog = False
+                st.rerun(scope="fragment")
+
+# ==========================
+# SINAL (opcional) - ADMIN
+# ==========================
+@st.fragment
+def painel_sinal(access_token: str, tenant_id: str):
+    if not st.session_state.show_deposit:
+        return
+
+    settings = get_tenant_settings_admin(access_token, tenant_id)
+    deposit_cfg = settings_get_deposit(settings)
+
+    with st.container(border=True):
+        st.markdown("### 💰 Sinal (opcional)")
+        st.caption("Se desativar, a agenda funciona normalmente sem cobrança/PIX.")
+
+        enabled = st.checkbox("Cobrar sinal para reservar", value=deposit_cfg["enabled"])
+        value = st.number_input("Valor do sinal (R$)", min_value=0.0, step=1.0, value=float(deposit_cfg["value"]))
+
+        c1, c2 = st.columns(2)
+        with c1:
+            if st.button("💾 Salvar sinal", use_container_width=True, type="primary"):
+                settings_set_deposit(settings, enabled=enabled, value=value)
+                ok, msg = save_tenant_settings_admin(access_token, tenant_id, {"deposit": settings["deposit"]}, settings)
+                if ok:
+                    st.success("Configuração de sinal salva!")
+                    st.session_state.show_deposit = False
+                    # coluna "Sinal" e KPIs da tabela dependem disso -> rerun completo
+                    invalidar_cache_agendamentos()
+                    st.rerun()
+                else:
+                    st.error("Não consegui salvar.")
+                    st.code(msg)
+        with c2:
+            if st.button("Fechar", use_container_width=True):
+                st.session_state.show_deposit = False
+                st.rerun(scope="fragment")
+
+# ============================================================
+# UI: MODO PÚBLICO (CLIENTE)
+# ============================================================
+def tela_publica():
+    assert_edge_config()
+    # o id já vem na URL: tenant e ocupação do dia (o da última escolha, ou
+    # hoje) saem juntos, numa ida só ao servidor
+    data_prevista = st.session_state.get("pub_data") or date.today()
+    origem = origem_cliente()
+
+    def ocupacao_prevista():
+        # passou do limite: devolve o LimiteExcedido para o aviso lá embaixo
+        try:
+            return agendamentos_bloqueantes_publico(PUBLIC_TENANT_ID, data_prevista, origem)
+        except LimiteExcedido as e:
+            return e
+
+    try:
+        carga = carregar_em_paralelo(
+            {
+                "tenant": lambda: carregar_tenant_publico(PUBLIC_TENANT_ID),
+                "ocupacao": ocupacao_prevista,
+            },
+            PUBLICO_ORCAMENTO_SEG,
+        )
+        tenant = carga["tenant"] if "tenant" in carga else carregar_tenant_publico(PUBLIC_TENANT_ID)
+    except EdgeIndisponivel:
+        # servidor fora e nenhuma cópia guardada: não é o link que está errado
+        st.warning("⏳ A agenda está temporariamente indisponível. Tente de novo em alguns instantes.")
+        if st.button("🔄 Tentar de novo", use_container_width=True):
+            st.rerun()
+        st.stop()
+    if not tenant:
+        st.error("Este link não é válido, não existe ou não está público ainda.")
+        st.stop()
+    if tenant.get("desatualizado"):
+        st.caption("⚠️ Sem conexão com o servidor agora: mostrando os dados salvos mais recentes.")
+
+    nome_raw = (tenant.get("nome") or "").strip()
     if not nome_raw or nome_raw.lower() in ("minha loja", "minha agenda"):
         nome_prof = "Profissional"
     else:
@@ -1786,7 +2716,12 @@ def tela_publica():
 
     settings = tenant.get("settings") if isinstance(tenant.get("settings"), dict) else {}
     services_map = settings_get_services(settings)
-    working_hours = settings_get_working_hours(settings)
+    calendario = settings_get_slot_calendar(settings)
+    durations = settings_get_durations(settings)
+    buffer_min = settings_get_buffer(settings)
+    capacidade = settings_get_capacity(settings)
+    recursos = recursos_ativos(settings)
+    nomes_recursos = {r["id"]: r["nome"] for r in recursos}
     catalog = settings_get_catalog(settings)
     deposit_cfg = settings_get_deposit(settings)
 
@@ -1796,7 +2731,15 @@ def tela_publica():
         st.subheader("Agendar")
 
         nome = st.text_input("Seu nome")
-        data_atendimento = st.date_input("Data do atendimento", min_value=date.today())
+        data_atendimento = st.date_input("Data do atendimento", min_value=date.today(), key="pub_data")
+
+        # data nova: os próximos dias costumam ser os próximos cliques
+        if PUBLICO_PRECARGA_DIAS and st.session_state.get("pub_precarga") != data_atendimento:
+            st.session_state.pub_precarga = data_atendimento
+            precarregar_ocupacao(
+                PUBLIC_TENANT_ID,
+                [data_atendimento + timedelta(days=i) for i in range(1, PUBLICO_PRECARGA_DIAS + 1)],
+            )
 
         servicos_escolhidos = st.multiselect(
             "Escolha o serviço (pode selecionar mais de um)",
@@ -1808,28 +2751,115 @@ def tela_publica():
         total_servico = calcular_total_servicos(servicos_escolhidos, services_map)
         valor_sinal = calcular_sinal(servicos_escolhidos, deposit_cfg)
 
+        duracao_total = sum(durations.get(s, 0) for s in servicos_escolhidos)
+        duracao_txt = f" • Duração: **{fmt_duracao(duracao_total)}**" if duracao_total else ""
+
         if servicos_escolhidos:
             if deposit_cfg["enabled"] and valor_sinal > 0:
-                st.caption(f"Total: **{fmt_brl(total_servico)}** • Sinal: **{fmt_brl(valor_sinal)}**")
+                st.caption(f"Total: **{fmt_brl(total_servico)}** • Sinal: **{fmt_brl(valor_sinal)}**{duracao_txt}")
             else:
-                st.caption(f"Total: **{fmt_brl(total_servico)}**")
+                st.caption(f"Total: **{fmt_brl(total_servico)}**{duracao_txt}")
         else:
             if deposit_cfg["enabled"] and valor_sinal > 0:
                 st.caption(f"Sinal: **{fmt_brl(valor_sinal)}**")
 
-        horarios = horarios_do_dia_com_settings(data_atendimento, working_hours)
-        if not horarios:
-            disponiveis = []
+        recurso_escolhido = None
+        if len(recursos) > 1:
+            recurso_escolhido = st.selectbox(
+                "Profissional",
+                [None] + [r["id"] for r in recursos],
+                format_func=lambda rid: nomes_recursos.get(rid, "Qualquer profissional"),
+            )
+
+        if data_atendimento == data_prevista and "ocupacao" in carga:
+            # já veio na carga paralela; se falhou, não busca de novo
+            bloqueantes = carga["ocupacao"]
+        else:
+            try:
+                bloqueantes = agendamentos_bloqueantes_publico(PUBLIC_TENANT_ID, data_atendimento, origem)
+            except LimiteExcedido as e:
+                bloqueantes = e
+        limite_espera = 0.0
+        if isinstance(bloqueantes, LimiteExcedido):
+            limite_espera = bloqueantes.espera_seg
+            bloqueantes = None
+        ocupacao_fora = bloqueantes is None and bool(calendario.slots_do_dia(data_atendimento)[0])
+        if ocupacao_fora:
+            # sem a ocupação do dia não dá para saber o que está livre: não oferece nada
+            disp = None
         else:
-            ocupados = horarios_ocupados_publico(PUBLIC_TENANT_ID, data_atendimento)
-            disponiveis = [h for h in horarios if h not in ocupados]
+            disp = disponibilidade_publico(
+                PUBLIC_TENANT_ID,
+                data_atendimento,
+                calendario,
+                servicos_escolhidos,
+                durations,
+                buffer_min,
+                recursos,
+                capacidade,
+                bloqueantes=bloqueantes or [],
+            )
+        disponiveis = [min_para_hhmm(m) for m in disp.livres(recurso_escolhido)] if disp else []
+
+        def fmt_vagas(h: str) -> str:
+            if capacidade <= 1:
+                return h
+            n = disp.vagas(hhmm_para_min(h), recurso_escolhido)
+            return f"{h} • {n} vaga{'s' if n != 1 else ''}"
 
         st.markdown("**Horários disponíveis**")
-        if disponiveis:
-            horario_escolhido = st.radio("Escolha um horário", disponiveis, label_visibility="collapsed")
+        if getattr(bloqueantes, "desatualizado", False) and disponiveis:
+            st.caption("⚠️ Horários podem estar desatualizados: a vaga é confirmada na hora de reservar.")
+        if ocupacao_fora:
+            horario_escolhido = None
+            if limite_espera:
+                aviso_limite(limite_espera)
+            else:
+                st.warning("⏳ Não consegui carregar os horários agora. Tente de novo em alguns instantes.")
+            if st.button("🔄 Tentar de novo", use_container_width=True, key="pub_horarios_retry"):
+                st.rerun()
+        elif disponiveis:
+            horario_escolhido = st.radio(
+                "Escolha um horário",
+                disponiveis,
+                format_func=fmt_vagas,
+                label_visibility="collapsed",
+            )
+            if len(recursos) > 1 and not recurso_escolhido:
+                previsto = disp.atribuir(hhmm_para_min(horario_escolhido))
+                if previsto in nomes_recursos:
+                    st.caption(f"Atendimento com **{nomes_recursos[previsto]}**.")
         else:
             horario_escolhido = None
-            st.info("Sem horários disponíveis para esse dia. Escolha outra data.")
+            motivo = calendario.motivo(data_atendimento)
+            if motivo and not calendario.slots_do_dia(data_atendimento)[0]:
+                st.info(f"Sem atendimento nesse dia ({motivo}). Escolha outra data.")
+            else:
+                st.info("Sem horários disponíveis para esse dia. Escolha outra data.")
+
+            # dia com expediente, mas lotado: lista de espera
+            if URL_LISTA_ESPERA and disp is not None:
+                with st.expander("⏳ Entrar na lista de espera desse dia"):
+                    st.caption("Se abrir uma vaga (cancelamento), o profissional te chama no WhatsApp.")
+                    whats_cliente = st.text_input("Seu WhatsApp (com DDD)", key="espera_whats")
+                    if st.button("Quero ser avisado", use_container_width=True, key="espera_entrar"):
+                        if not nome or len("".join(c for c in whats_cliente if c.isdigit())) < 10:
+                            st.error("Preencha seu nome e o WhatsApp com DDD.")
+                        else:
+                            out = entrar_lista_espera_publico(
+                                PUBLIC_TENANT_ID,
+                                nome.strip(),
+                                whats_cliente,
+                                data_atendimento,
+                                servicos_escolhidos,
+                                recurso_escolhido,
+                            )
+                            if out:
+                                pos = out.get("posicao")
+                                st.success(
+                                    f"Você está na lista de espera de {data_atendimento.strftime('%d/%m/%Y')}"
+                                    + (f" (posição {pos})." if pos else ".")
+                                )
 
         st.divider()
 
@@ -1847,9 +2877,9 @@ def tela_publica():
             if st.session_state.wa_link:
                 st.link_button("📲 Abrir WhatsApp", st.session_state.wa_link, use_container_width=True)
 
-        def make_reserva_key(_nome: str, data_at: date, horario: str, servicos: list) -> str:
+        def make_reserva_key(_nome: str, data_at: date, horario: str, servicos: list, recurso: str | None) -> str:
             serv_txt = servicos_para_texto(servicos).lower()
-            return f"{_nome.strip().lower()}|{data_at.isoformat()}|{horario}|{serv_txt}"
+            return f"{_nome.strip().lower()}|{data_at.isoformat()}|{horario}|{serv_txt}|{recurso or ''}"
 
         if reservar_click:
             if not nome or not horario_escolhido or not servicos_escolhidos:
@@ -1858,66 +2888,89 @@ def tela_publica():
                 st.error("Este profissional ainda não configurou WhatsApp para receber a reserva.")
             else:
                 st.session_state.reservando = True
-                chave = make_reserva_key(nome, data_atendimento, horario_escolhido, servicos_escolhidos)
+                chave = make_reserva_key(
+                    nome, data_atendimento, horario_escolhido, servicos_escolhidos, recurso_escolhido
+                )
 
                 if st.session_state.ultima_chave_reserva == chave:
                     st.warning("Você já enviou esse agendamento. Se quiser mudar, fale com o profissional.")
                     st.session_state.reservando = False
                 else:
-                    if horario_escolhido in horarios_ocupados_publico(PUBLIC_TENANT_ID, data_atendimento):
-                        st.warning("Esse horário já foi reservado. Escolha outro.")
+                    # reserva atômica: o próprio insert recusa horário ocupado (slot_taken),
+                    # sem consultar os ocupados antes
+                    resp = inserir_pre_agendamento_publico(
+                        PUBLIC_TENANT_ID,
+                        nome.strip(),
+                        data_atendimento,
+                        horario_escolhido,
+                        servicos_escolhidos,
+                        valor_sinal,
+                        idempotency_key=chave_idempotencia_reserva(chave),
+                        recurso_id=recurso_escolhido,
+                    )
+                    if not resp:
                         st.session_state.reservando = False
                     else:
-                        resp = inserir_pre_agendamento_publico(
-                            PUBLIC_TENANT_ID,
+                        # "qualquer profissional": o servidor diz com quem ficou
+                        ag = resp.get("agendamento") if isinstance(resp, dict) else None
+                        recurso_final = (ag or {}).get("recurso_id") or recurso_escolhido
+                        mensagem = montar_mensagem_pagamento_cliente(
                             nome.strip(),
                             data_atendimento,
                             horario_escolhido,
                             servicos_escolhidos,
                             valor_sinal,
+                            pix_chave=pix_chave,
+                            pix_nome=pix_nome,
+                            pix_cidade=pix_cidade,
+                            services_map=services_map,
+                            deposit_cfg=deposit_cfg,
+                            profissional=nomes_recursos.get(recurso_final, "") if len(recursos) > 1 else "",
                         )
-                        if not resp:
-                            st.session_state.reservando = False
-                        else:
-                            mensagem = montar_mensagem_pagamento_cliente(
-                                nome.strip(),
-                                data_atendimento,
-                                horario_escolhido,
-                                servicos_escolhidos,
-                                valor_sinal,
-                                pix_chave=pix_chave,
-                                pix_nome=pix_nome,
-                                pix_cidade=pix_cidade,
-                                services_map=services_map,
-                                deposit_cfg=deposit_cfg,
-                            )
-                            st.session_state.wa_link = montar_link_whatsapp(whatsapp_num, mensagem)
-                            st.session_state.ultima_chave_reserva = chave
-                            st.session_state.reservando = False
-                            st.success("Reserva criada como **PENDENTE**. Clique em **Abrir WhatsApp** para enviar a mensagem.")
-                            st.rerun()
+                        st.session_state.wa_link = montar_link_whatsapp(whatsapp_num, mensagem)
+                        st.session_state.ultima_chave_reserva = chave
+                        st.session_state.pop("reserva_idem", None)
+                        st.session_state.reservando = False
+                        st.success("Reserva criada como **PENDENTE**. Clique em **Abrir WhatsApp** para enviar a mensagem.")
+                        st.rerun()
 
     with aba_catalogo:
         st.subheader("📒 Catálogo")
         if not catalog["enabled"]:
             st.info("Catálogo indisponível.")
-        elif not catalog["items"]:
-            st.info("Este profissional ainda não adicionou arquivos no catálogo.")
         else:
-            for i, it in enumerate(catalog["items"], start=1):
-                caption = (it.get("caption") or "").strip()
-                if caption:
-                    st.markdown(f"**{caption}**")
-
-                if it.get("type") == "pdf":
+            pagina = int(st.session_state.get("pub_cat_pagina", 0))
+            pag = catalogo_publico(PUBLIC_TENANT_ID, pagina)
+            itens = pag["itens"]
+            paginas = max(1, -(-pag["total"] // agenda_nucleo.CATALOGO_POR_PAGINA))
+            if not itens:
+                st.info("Este profissional ainda não adicionou arquivos no catálogo.")
+            for i, it in enumerate(itens, start=1):
+                if it["legenda"]:
+                    st.markdown(f"**{it['legenda']}**")
+
+                if it["tipo"] == "pdf":
                     st.markdown("📄 **PDF**")
                     st.link_button("Abrir PDF", it["url"], use_container_width=True)
                 else:
                     st.image(it["url"], use_container_width=True)
 
-                if i < len(catalog["items"]):
+                if i < len(itens):
                     st.divider()
 
+            if paginas > 1:
+                p1, p2, p3 = st.columns([1, 1, 1])
+                with p1:
+                    if st.button("⬅️ Anterior", key="pub_cat_ant", use_container_width=True, disabled=pagina == 0):
+                        st.session_state.pub_cat_pagina = pagina - 1
+                        st.rerun()
+                with p2:
+                    st.caption(f"Página {pagina + 1} de {paginas}")
+                with p3:
+                    if st.button("Próxima ➡️", key="pub_cat_prox", use_container_width=True, disabled=pagina >= paginas - 1):
+                        st.session_state.pub_cat_pagina = pagina + 1
+                        st.rerun()
+
 # ============================================================
 # ONBOARDING (primeiro acesso)
 # ============================================================
@@ -1928,9 +2981,7 @@ def settings_is_onboarding_done(settings: dict) -> bool:
         return False
 
 def mark_onboarding_done(access_token: str, tenant_id: str, settings: dict):
-    settings = dict(settings or {})
-    settings["onboarding_done"] = True
-    ok, err = save_tenant_settings_admin(access_token, tenant_id, settings)
+    ok, err = save_tenant_settings_admin(access_token, tenant_id, {"onboarding_done": True}, settings)
     return ok, err
 
 def tela_onboarding(access_token: str, tenant: dict):
@@ -1939,8 +2990,6 @@ def tela_onboarding(access_token: str, tenant: dict):
     Mostra apenas quando settings['onboarding_done'] != True.
     """
     tenant_id = str(tenant.get("id"))
-    user = get_auth_user(access_token)
-    uid = str(getattr(user, "id", "")) if user else ""
 
     settings = get_tenant_settings_admin(access_token, tenant_id) or {}
     if settings_is_onboarding_done(settings):
@@ -1964,13 +3013,8 @@ def tela_onboarding(access_token: str, tenant: dict):
         c1, c2 = st.columns([1, 1])
         with c1:
             if st.button("Continuar ➜", type="primary", use_container_width=True):
-                ok = True
-                if uid:
-                    try:
-                        atualizar_tenant_whatsapp(access_token, uid, tenant_id, w)
-                    except Exception:
-                        ok = False
-                # mesmo se falhar, deixa seguir (usuário pode ajustar depois)
+                # profile + tenant juntos; mesmo se falhar, deixa seguir (usuário pode ajustar depois)
+                salvar_perfil_admin(access_token, tenant_id, {"whatsapp": w.strip()})
                 st.session_state["onboarding_step"] = 2
                 st.rerun()
         with c2:
@@ -2006,12 +3050,10 @@ def tela_onboarding(access_token: str, tenant: dict):
                 if not nome:
                     st.error("Digite o nome do serviço.")
                 else:
-                    settings = dict(settings or {})
-                    sdict = dict(settings.get("services") or {})
+                    sdict = dict((settings or {}).get("services") or {})
                     sdict[nome] = float(s_preco or 0.0)
-                    settings["services"] = sdict
 
-                    ok, err = save_tenant_settings_admin(access_token, tenant_id, settings)
+                    ok, err = save_tenant_settings_admin(access_token, tenant_id, {"services": sdict}, settings)
                     if ok:
                         st.success("✅ Serviço adicionado.")
                         st.rerun()
@@ -2053,9 +3095,12 @@ def tela_onboarding(access_token: str, tenant: dict):
         st.caption("Você pode alterar isso depois nas configurações.")
 
         if st.button("Salvar e continuar ➜", type="primary", use_container_width=True):
-            settings = dict(settings or {})
-            settings["deposit"] = {"enabled": bool(enabled_new), "value": float(value_new)}
-            ok, err = save_tenant_settings_admin(access_token, tenant_id, settings)
+            ok, err = save_tenant_settings_admin(
+                access_token,
+                tenant_id,
+                {"deposit": {"enabled": bool(enabled_new), "value": float(value_new)}},
+                settings,
+            )
             if ok:
                 st.session_state["onboarding_step"] = 4
                 st.rerun()
@@ -2101,6 +3146,395 @@ def tela_onboarding(access_token: str, tenant: dict):
 
         st.stop()
 
+# ============================================================
+# ADMIN: LISTA DE ESPERA (dentro do bloco de agendamentos)
+# ============================================================
+def secao_lista_espera(access_token: str, tenant_id: str):
+    forcar = bool(st.session_state.pop("espera_forcar", False))
+    novas = processar_lista_espera_admin(access_token, tenant_id, forcar=forcar)
+    if novas:
+        st.toast(f"⏳ {len(novas)} vaga(s) para oferecer à lista de espera!")
+
+    # a lista só é relida quando a fila rodou (ou depois de uma ação aqui)
+    if novas is not None or "espera_cache" not in st.session_state:
+        st.session_state.espera_cache = listar_espera_admin(access_token, tenant_id)
+    itens = st.session_state.espera_cache
+    if not itens:
+        return
+
+    ofertas = [e for e in itens if e.get("status") == "oferecido"]
+    aguardando = [e for e in itens if e.get("status") == "aguardando"]
+    titulo = f"⏳ Lista de espera • {len(ofertas)} vaga(s) para avisar • {len(aguardando)} aguardando"
+
+    with st.expander(titulo, expanded=bool(ofertas)):
+        for e in ofertas:
+            d = parse_date_iso(e.get("data"))
+            if not d:
+                continue
+            texto = montar_mensagem_oferta_espera(e.get("cliente"), d, e.get("horario_ofertado"), link_cliente(tenant_id))
+            c1, c2, c3 = st.columns([2, 1, 1])
+            c1.markdown(f"**{e.get('cliente')}** • {d.strftime('%d/%m')} às **{e.get('horario_ofertado')}**")
+            c2.link_button("📲 Oferecer", montar_link_whatsapp(e.get("whatsapp"), texto), use_container_width=True)
+            if c3.button("✔ Avisei", key=f"espera_ok_{e.get('id')}", use_container_width=True):
+                marcar_espera_admin(access_token, tenant_id, e.get("id"), "avisado")
+                st.session_state.pop("espera_cache", None)
+                st.rerun(scope="fragment")
+
+        if aguardando:
+            st.caption("Aguardando vaga:")
+            st.dataframe(
+                pd.DataFrame(
+                    [
+                        {"Data": e.get("data"), "Cliente": e.get("cliente"), "Serviço(s)": e.get("servico")}
+                        for e in aguardando
+                    ]
+                ),
+                use_container_width=True,
+                hide_index=True,
+            )
+
+# ============================================================
+# ADMIN: TABELA DE AGENDAMENTOS (fragment)
+# Filtros, KPIs e ações rápidas reexecutam só este bloco.
+# Com AUTO_REFRESH_SEG > 0 o bloco roda sozinho a cada N segundos,
+# mas só busca a lista de novo quando o fingerprint da agenda muda.
+# ============================================================
+@st.fragment(run_every=AUTO_REFRESH_SEG if AUTO_REFRESH_SEG > 0 else None)
+@medido("render")
+def bloco_agendamentos(access_token: str, tenant_id: str):
+    st.divider()
+    st.subheader("📋 Agendamentos / Reservas")
+
+    # ============================================================
+    # ✅ AJUSTE DO DATAFRAME: tempo relativo + status inline
+    # ============================================================
+    def tempo_relativo(dt_value):
+        """
+        Recebe created_at (str ISO ou datetime) e retorna:
+        agora | há X min | há X h | há X dias
+        """
+        if not dt_value:
+            return ""
+
+        dt = dt_value
+        if isinstance(dt, str):
+            dt = parse_dt(dt)
+
+        if not dt:
+            return ""
+
+        # garante timezone
+        if dt.tzinfo is None:
+            dt = dt.replace(tzinfo=timezone.utc)
+
+        # converte pra Brasil
+        dt_local = dt.astimezone(LOCAL_TZ)
+        diff = agora_local() - dt_local
+        secs = int(diff.total_seconds())
+
+        if secs < 0:
+            # se vier algo "no futuro" por timezone/clock, não quebra
+            secs = abs(secs)
+
+        if secs < 60:
+            return "agora"
+        if secs < 3600:
+            return f"há {secs // 60} min"
+        if secs < 86400:
+            return f"há {secs // 3600} h"
+        return f"há {secs // 86400} dias"
+
+    def status_inline_com_tempo(status_norm: str, created_at_value):
+        label = STATUS_LABELS.get(status_norm, status_norm)
+        rel = tempo_relativo(created_at_value)
+        if rel:
+            return f"{label} • {rel}"
+        return f"{label}"
+
+    df_admin, settings, regras, novos = carregar_agendamentos_cache(access_token, tenant_id)
+    if novos:
+        st.toast(f"🔔 {novos} novo(s) agendamento(s)!")
+
+    secao_lista_espera(access_token, tenant_id)
+
+    if df_admin.empty and not regras:
+        st.info("Nenhum agendamento encontrado.")
+    else:
+        t_tabela = time.perf_counter()
+        # parse Data_dt
+        df_admin["Data_dt"] = pd.to_datetime(df_admin["Data"], errors="coerce")
+
+        # --------- filtros ---------
+        colp1, colp2, colp3 = st.columns([1, 1, 1])
+        with colp1:
+            periodo = st.selectbox("Período", ["Tudo", "Mês", "Ano"], index=0)
+
+        anos_disponiveis = sorted([int(y) for y in df_admin["Data_dt"].dropna().dt.year.unique().tolist()])
+        ano_padrao = anos_disponiveis[-1] if anos_disponiveis else date.today().year
+
+        with colp2:
+            ano_sel = st.selectbox(
+                "Ano",
+                anos_disponiveis if anos_disponiveis else [ano_padrao],
+                index=(len(anos_disponiveis) - 1) if anos_disponiveis else 0,
+            )
+
+        with colp3:
+            mes_sel = st.selectbox("Mês", list(range(1, 13)), index=date.today().month - 1)
+
+        # clientes fixos: ocorrências geradas só para a janela do período
+        if periodo == "Mês":
+            janela_de = date(int(ano_sel), int(mes_sel), 1)
+            janela_ate = (janela_de + timedelta(days=31)).replace(day=1) - timedelta(days=1)
+        elif periodo == "Ano":
+            janela_de, janela_ate = date(int(ano_sel), 1, 1), date(int(ano_sel), 12, 31)
+        else:
+            janela_de = date.today()
+            janela_ate = janela_de + timedelta(days=RECORRENCIA_JANELA_DIAS)
+        df_tab = pd.concat(
+            [df_admin, ocorrencias_para_df(expandir_recorrentes(regras, janela_de, janela_ate))],
+            ignore_index=True,
+        )
+        if df_tab.empty:
+            st.info("Nenhum agendamento no período.")
+            return
+        df_tab["Data_dt"] = pd.to_datetime(df_tab["Data"], errors="coerce")
+
+        # settings para calcular preços
+        services_map = settings_get_services(settings)
+        deposit_cfg = settings_get_deposit(settings)
+        deposit_on = bool(deposit_cfg.get("enabled", True)) and float(deposit_cfg.get("value", 0)) > 0
+
+        def total_from_text(texto_servico: str) -> float:
+            servs = texto_para_lista_servicos(texto_servico)
+            return calcular_total_servicos(servs, services_map)
+
+        df_tab["Preço do serviço"] = df_tab["Serviço(s)"].apply(total_from_text).astype(float)
+
+        # profissional: sem recurso_id = primeiro profissional ativo (agenda antiga)
+        recursos = settings_get_resources(settings)
+        if recursos:
+            nomes_rec = {r["id"]: r["nome"] for r in recursos}
+            ativos = [r["id"] for r in recursos if r["ativo"]]
+            padrao = ativos[0] if ativos else recursos[0]["id"]
+            df_tab["Profissional"] = df_tab["recurso_id"].apply(
+                lambda x: nomes_rec.get(str(x) if x and not pd.isna(x) else padrao, "—")
+            )
+        df_tab["Status_norm"] = df_tab["Status"].apply(norm_status)
+        df_tab["status_ord"] = df_tab["Status_norm"].apply(lambda s: STATUS_SORT.get(s, 99))
+
+        # ✅ NOVO: status com tempo relativo (usa a coluna "Criado em" original)
+        # obs: "Criado em" já vem do rename dentro de listar_agendamentos_admin()
+        if "Criado em" in df_tab.columns:
+            df_tab["Status"] = df_tab.apply(
+                lambda r: status_inline_com_tempo(r["Status_norm"], r["Criado em"]),
+                axis=1
+            )
+        else:
+            # fallback: mantém status label normal
+            df_tab["Status"] = df_tab["Status_norm"].apply(lambda s: STATUS_LABELS.get(s, s))
+
+        # ações rápidas só valem para agendamentos de verdade (não ocorrências)
+        df_admin = df_tab[df_tab["Status_norm"] != STATUS_RECORRENTE].copy()
+        if not df_admin.empty:
+            df_admin["id"] = df_admin["id"].astype(int)
+
+        df_filtrado = df_tab.copy()
+        if periodo == "Mês":
+            df_filtrado = df_filtrado[
+                (df_filtrado["Data_dt"].dt.year == int(ano_sel))
+                & (df_filtrado["Data_dt"].dt.month == int(mes_sel))
+            ]
+        elif periodo == "Ano":
+            df_filtrado = df_filtrado[df_filtrado["Data_dt"].dt.year == int(ano_sel)]
+
+        if "Profissional" in df_filtrado.columns:
+            prof_sel = st.selectbox("Profissional", ["Todos"] + [r["nome"] for r in recursos], index=0)
+            if prof_sel != "Todos":
+                df_filtrado = df_filtrado[df_filtrado["Profissional"] == prof_sel]
+
+        filtrar_status = st.checkbox("Filtrar por status", value=True)
+        if filtrar_status:
+            escolhas = ["Todos"] + [STATUS_LABELS[s] for s in STATUS_ALL + [STATUS_RECORRENTE]]
+            sel = st.multiselect("Status", escolhas, default=["Todos"])
+            if "Todos" not in sel:
+                label_to_norm = {STATUS_LABELS[s]: s for s in STATUS_ALL + [STATUS_RECORRENTE]}
+                wanted = [label_to_norm[x] for x in sel if x in label_to_norm]
+                if wanted:
+                    df_filtrado = df_filtrado[df_filtrado["Status_norm"].isin(wanted)]
+
+        # --------- KPIs úteis ---------
+        t_kpis = time.perf_counter()
+        total_gerado = float(df_filtrado["Preço do serviço"].sum()) if not df_filtrado.empty else 0.0
+        total_sinais = float(df_filtrado["Sinal"].sum()) if not df_filtrado.empty else 0.0
+        qtd = int(len(df_filtrado))
+
+        recebido = (
+            float(df_filtrado[df_filtrado["Status_norm"].isin(["pago", "finalizado"])]["Preço do serviço"].sum())
+            if not df_filtrado.empty else 0.0
+        )
+        a_receber = (
+            float(df_filtrado[df_filtrado["Status_norm"].isin(["pendente"])]["Preço do serviço"].sum())
+            if not df_filtrado.empty else 0.0
+        )
+        cancelados_qtd = int((df_filtrado["Status_norm"] == "cancelado").sum()) if not df_filtrado.empty else 0
+
+        m1, m2, m3, m4 = st.columns(4)
+        m1.metric("Quantidade", f"{qtd}")
+        m2.metric("Recebido", fmt_brl(recebido))
+        m3.metric("A receber", fmt_brl(a_receber))
+        m4.metric("Cancelados", f"{cancelados_qtd}")
+
+        if deposit_on:
+            ex1, ex2 = st.columns(2)
+            ex1.metric("Total serviços (gerado)", fmt_brl(total_gerado))
+            ex2.metric("Total sinais", fmt_brl(total_sinais))
+        else:
+            st.metric("Total serviços (gerado)", fmt_brl(total_gerado))
+        agenda_medicao.registrar("render:kpis", t_kpis)
+
+        # --------- tabela (mais legível) ---------
+        df_show = df_filtrado.sort_values(["Data_dt", "Horário", "status_ord"], ascending=[True, True, True]).copy()
+
+        # ✅ remove colunas técnicas + remove "Criado em" (não serve mais)
+        drop_cols = [c for c in ["Data_dt", "Status_norm", "status_ord", "recurso_id"] if c in df_show.columns]
+        df_show = df_show.drop(columns=drop_cols, errors="ignore")
+
+        if "Criado em" in df_show.columns:
+            df_show = df_show.drop(columns=["Criado em"], errors="ignore")
+
+        if not deposit_on and "Sinal" in df_show.columns:
+            df_show = df_show.drop(columns=["Sinal"], errors="ignore")
+
+        # formatação BRL
+        df_show["Preço do serviço"] = df_show["Preço do serviço"].apply(lambda v: fmt_brl(float(v)))
+        if "Sinal" in df_show.columns:
+            df_show["Sinal"] = df_show["Sinal"].apply(lambda v: fmt_brl(float(v)))
+
+        st.dataframe(
+            df_show.drop(columns=["id"], errors="ignore"),
+            use_container_width=True,
+            height=360
+        )
+        agenda_medicao.registrar("render:tabela_agendamentos", t_tabela)
+
+        if df_admin.empty:
+            return
+
+        # ====================================================
+        # AÇÕES RÁPIDAS
+        # ====================================================
+        # AÇÕES RÁPIDAS
+        # ====================================================
+        st.divider()
+        st.subheader("⚡ Ações rápidas")
+
+        # ✅ legenda para evitar confusão (cancelar vs excluir)
+        st.caption("❌ **Cancelar** mantém o registro no histórico • 🗑️ **Excluir** remove definitivamente.")
+
+        def fmt_ag(ag_id: int) -> str:
+            row = df_admin[df_admin.id == ag_id]
+            if row.empty:
+                return str(ag_id)
+            r = row.iloc[0]
+            # aqui mantemos o label simples no select (sem o "há X"),
+            # pra não ficar mudando enquanto você usa o selectbox
+            return f"{r['Cliente']} • {r['Data']} {r['Horário']} • {STATUS_LABELS.get(r['Status_norm'], r['Status_norm'])}"
+
+        def resumo_ag(ag_id: int) -> str:
+            """Resumo fixo para usar em mensagens de sucesso/erro."""
+            row = df_admin[df_admin.id == ag_id]
+            if row.empty:
+                return f"ID {ag_id}"
+            r = row.iloc[0]
+            return f"{r['Cliente']} • {r['Data']} {r['Horário']}"
+
+        colA, colB = st.columns(2)
+
+        with colA:
+            st.subheader("✅ Marcar como PAGO")
+            pendentes_ids = df_admin[df_admin["Status_norm"] == "pendente"]["id"].tolist()
+            ids_para_pagar = pendentes_ids if pendentes_ids else df_admin["id"].tolist()
+
+            ag_pagar = st.selectbox(
+                "Selecione o agendamento",
+                ids_para_pagar,
+                format_func=fmt_ag,
+                key="pagar_select",
+            )
+
+            if st.button("Marcar como PAGO", type="primary", use_container_width=True):
+                marcar_status_admin(access_token, tenant_id, int(ag_pagar), "pago")
+                st.success(f"✅ Marcado como **PAGO**: {resumo_ag(int(ag_pagar))}")
+                invalidar_cache_agendamentos()
+                st.rerun(scope="fragment")
+
+        with colB:
+            st.subheader("❌ Marcar como CANCELADO")
+            ids_cancel = df_admin[df_admin["Status_norm"] != "cancelado"]["id"].tolist() or df_admin["id"].tolist()
+
+            ag_cancel = st.selectbox(
+                "Selecione o agendamento",
+                ids_cancel,
+                format_func=fmt_ag,
+                key="cancel_select",
+            )
+
+            if st.button("Marcar como CANCELADO", use_container_width=True):
+                marcar_status_admin(access_token, tenant_id, int(ag_cancel), "cancelado")
+                st.session_state.espera_forcar = True  # vaga liberada -> oferece já
+                st.success(f"❌ Marcado como **CANCELADO**: {resumo_ag(int(ag_cancel))}")
+                invalidar_cache_agendamentos()
+                st.rerun(scope="fragment")
+
+        st.subheader("🗑️ Excluir agendamento")
+        ag_excluir = st.selectbox(
+            "Selecione para excluir",
+            df_admin["id"],
+            format_func=fmt_ag,
+            key="excluir_select_unique",
+        )
+
+        # ✅ confirmação obrigatória (protege contra erro irreversível)
+        confirm_delete = st.checkbox(
+            "Confirmo que desejo excluir definitivamente este agendamento",
+            value=False,
+            key="confirm_delete_checkbox",
+        )
+
+        if st.button("Excluir agendamento", use_container_width=True, disabled=not confirm_delete):
+            excluir_agendamento_admin(access_token, tenant_id, int(ag_excluir))
+            st.session_state.espera_forcar = True
+            st.success(f"🗑️ **Excluído definitivamente**: {resumo_ag(int(ag_excluir))}")
+            invalidar_cache_agendamentos()
+            st.rerun(scope="fragment")
+
+# ============================================================
+# UI: PAINEL DE DEBUG (?debug=1, só admin logado)
+# Tempo da execução atual por helper de rede / bloco de tela.
+# Blocos de tela incluem as chamadas de rede feitas dentro deles.
+# ============================================================
+def painel_debug():
+    m = agenda_medicao.atual()
+    if m is None:
+        return
+    linhas = m.resumo()
+    with st.expander(f"🐞 Debug: execução em {m.decorrido_seg() * 1000:.0f} ms", expanded=False):
+        if not linhas:
+            st.caption("Nada medido nesta execução.")
+            return
+        # mesmo helper de rede várias vezes numa execução = suspeita de N+1
+        repetidos = [r["nome"] for r in linhas if r["chamadas"] > 1 and not r["nome"].startswith("render:")]
+        if repetidos:
+            st.warning("Chamadas repetidas: " + ", ".join(repetidos))
+        st.dataframe(
+            pd.DataFrame(linhas).rename(
+                columns={"nome": "Trecho", "chamadas": "Chamadas", "total_ms": "Total (ms)", "max_ms": "Maior (ms)"}
+            ),
+            use_container_width=True,
+            hide_index=True,
+        )
+
 # ============================================================
 # UI: MODO ADMIN (PROFISSIONAL)
 # ============================================================
@@ -2177,13 +3611,43 @@ def tela_admin():
         st.stop()
 
     access_token = st.session_state.access_token
-    user = get_auth_user(access_token)
+    chave_token = hash_token(access_token)
+
+    boot = carregar_bootstrap_admin(access_token)
+    if boot is not None:
+        # uma ida só (admin_bootstrap): a virada pago -> finalizado já foi feita lá
+        carga = {"user": SimpleNamespace(**boot["user"]), "tenant": boot.get("tenant"), "finalizados": boot.get("finalizados", 0)}
+        tid_finalizados = str(boot["tenant"].get("id")) if boot.get("tenant") else None
+    else:
+        # Sem a RPC: cargas independentes em paralelo. Com o tenant da execução
+        # anterior (mesmo token) settings e a virada pago -> finalizado saem junto
+        # com usuário e tenant; na primeira execução só usuário + tenant.
+        anterior = st.session_state.get("admin_tenant")
+        tid_finalizados = anterior[1] if anterior and anterior[0] == chave_token else None
+        tarefas = {
+            "user": lambda: get_auth_user(access_token),
+            "tenant": lambda: carregar_tenant_admin(access_token),
+        }
+        if tid_finalizados:
+            tid = tid_finalizados
+            # settings: só aquece o cache lido pelo onboarding e pela tabela
+            tarefas["settings"] = lambda: get_tenant_settings_admin(access_token, tid)
+            tarefas["finalizados"] = lambda: atualizar_finalizados_admin(access_token, tid)
+        carga = carregar_em_paralelo(tarefas, ADMIN_ORCAMENTO_SEG)
+
+    if "user" not in carga or "tenant" not in carga:
+        st.warning("O servidor demorou para responder. Tente de novo em instantes.")
+        if st.button("🔄 Tentar de novo", use_container_width=True):
+            st.rerun()
+        st.stop()
+
+    user = carga["user"]
     if not user:
         st.warning("Sessão expirada. Faça login novamente.")
         auth_logout()
         st.stop()
 
-    tenant = carregar_tenant_admin(access_token)
+    tenant = carga["tenant"]
     if not tenant:
         st.warning("Você ainda não tem um perfil/agenda criada.")
         st.info("Criando automaticamente...")
@@ -2196,10 +3660,7 @@ def tela_admin():
         st.success("Agenda criada! Recarregando...")
         st.rerun()
 
-    tenant = carregar_tenant_admin(access_token)
-    if not tenant:
-        st.error("Não consegui carregar o tenant deste usuário.")
-        st.stop()
+    st.session_state.admin_tenant = (chave_token, str(tenant.get("id")))
 
     paid_until = parse_date_iso(tenant.get("paid_until"))
     dias = dias_restantes(paid_until)
@@ -2318,260 +3779,15 @@ def tela_admin():
             st.caption(f"Venceu em **{paid_until.strftime('%d/%m/%Y')}**.")
         st.stop()
 
-    atualizar_finalizados_admin(access_token, tenant_id)
-
-    st.divider()
-    st.subheader("📋 Agendamentos / Reservas")
-
-    # ============================================================
-    # ✅ AJUSTE DO DATAFRAME: tempo relativo + status inline
-    # ============================================================
-    def tempo_relativo(dt_value):
-        """
-        Recebe created_at (str ISO ou datetime) e retorna:
-        agora | há X min | há X h | há X dias
-        """
-        if not dt_value:
-            return ""
-
-        dt = dt_value
-        if isinstance(dt, str):
-            dt = parse_dt(dt)
-
-        if not dt:
-            return ""
-
-        # garante timezone
-        if dt.tzinfo is None:
-            dt = dt.replace(tzinfo=timezone.utc)
-
-        # converte pra Brasil
-        dt_local = dt.astimezone(LOCAL_TZ)
-        diff = agora_local() - dt_local
-        secs = int(diff.total_seconds())
-
-        if secs < 0:
-            # se vier algo "no futuro" por timezone/clock, não quebra
-            secs = abs(secs)
-
-        if secs < 60:
-            return "agora"
-        if secs < 3600:
-            return f"há {secs // 60} min"
-        if secs < 86400:
-            return f"há {secs // 3600} h"
-        return f"há {secs // 86400} dias"
-
-    def status_inline_com_tempo(status_norm: str, created_at_value):
-        label = STATUS_LABELS.get(status_norm, status_norm)
-        rel = tempo_relativo(created_at_value)
-        if rel:
-            return f"{label} • {rel}"
-        return f"{label}"
-
-    df_admin = listar_agendamentos_admin(access_token, tenant_id)
-    if df_admin.empty:
-        st.info("Nenhum agendamento encontrado.")
+    if tid_finalizados == tenant_id:
+        # já rodou no bootstrap / na carga paralela (se estourou o orçamento, termina em segundo plano)
+        atualizados = carga.get("finalizados", 0)
     else:
-        # parse Data_dt
-        df_admin["Data_dt"] = pd.to_datetime(df_admin["Data"], errors="coerce")
-
-        # settings para calcular preços
-        settings = get_tenant_settings_admin(access_token, tenant_id)
-        services_map = settings_get_services(settings)
-        deposit_cfg = settings_get_deposit(settings)
-        deposit_on = bool(deposit_cfg.get("enabled", True)) and float(deposit_cfg.get("value", 0)) > 0
-
-        def total_from_text(texto_servico: str) -> float:
-            servs = texto_para_lista_servicos(texto_servico)
-            return calcular_total_servicos(servs, services_map)
-
-        df_admin["Preço do serviço"] = df_admin["Serviço(s)"].apply(total_from_text).astype(float)
-        df_admin["Status_norm"] = df_admin["Status"].apply(norm_status)
-        df_admin["status_ord"] = df_admin["Status_norm"].apply(lambda s: STATUS_SORT.get(s, 99))
-
-        # ✅ NOVO: status com tempo relativo (usa a coluna "Criado em" original)
-        # obs: "Criado em" já vem do rename dentro de listar_agendamentos_admin()
-        if "Criado em" in df_admin.columns:
-            df_admin["Status"] = df_admin.apply(
-                lambda r: status_inline_com_tempo(r["Status_norm"], r["Criado em"]),
-                axis=1
-            )
-        else:
-            # fallback: mantém status label normal
-            df_admin["Status"] = df_admin["Status_norm"].apply(lambda s: STATUS_LABELS.get(s, s))
-
-        # --------- filtros ---------
-        colp1, colp2, colp3 = st.columns([1, 1, 1])
-        with colp1:
-            periodo = st.selectbox("Período", ["Tudo", "Mês", "Ano"], index=0)
-
-        anos_disponiveis = sorted([int(y) for y in df_admin["Data_dt"].dropna().dt.year.unique().tolist()])
-        ano_padrao = anos_disponiveis[-1] if anos_disponiveis else date.today().year
-
-        with colp2:
-            ano_sel = st.selectbox(
-                "Ano",
-                anos_disponiveis if anos_disponiveis else [ano_padrao],
-                index=(len(anos_disponiveis) - 1) if anos_disponiveis else 0,
-            )
-
-        with colp3:
-            mes_sel = st.selectbox("Mês", list(range(1, 13)), index=date.today().month - 1)
-
-        df_filtrado = df_admin.copy()
-        if periodo == "Mês":
-            df_filtrado = df_filtrado[
-                (df_filtrado["Data_dt"].dt.year == int(ano_sel))
-                & (df_filtrado["Data_dt"].dt.month == int(mes_sel))
-            ]
-        elif periodo == "Ano":
-            df_filtrado = df_filtrado[df_filtrado["Data_dt"].dt.year == int(ano_sel)]
-
-        filtrar_status = st.checkbox("Filtrar por status", value=True)
-        if filtrar_status:
-            escolhas = ["Todos"] + [STATUS_LABELS[s] for s in STATUS_ALL]
-            sel = st.multiselect("Status", escolhas, default=["Todos"])
-            if "Todos" not in sel:
-                label_to_norm = {STATUS_LABELS[s]: s for s in STATUS_ALL}
-                wanted = [label_to_norm[x] for x in sel if x in label_to_norm]
-                if wanted:
-                    df_filtrado = df_filtrado[df_filtrado["Status_norm"].isin(wanted)]
-
-        # --------- KPIs úteis ---------
-        total_gerado = float(df_filtrado["Preço do serviço"].sum()) if not df_filtrado.empty else 0.0
-        total_sinais = float(df_filtrado["Sinal"].sum()) if not df_filtrado.empty else 0.0
-        qtd = int(len(df_filtrado))
-
-        recebido = (
-            float(df_filtrado[df_filtrado["Status_norm"].isin(["pago", "finalizado"])]["Preço do serviço"].sum())
-            if not df_filtrado.empty else 0.0
-        )
-        a_receber = (
-            float(df_filtrado[df_filtrado["Status_norm"].isin(["pendente"])]["Preço do serviço"].sum())
-            if not df_filtrado.empty else 0.0
-        )
-        cancelados_qtd = int((df_filtrado["Status_norm"] == "cancelado").sum()) if not df_filtrado.empty else 0
-
-        m1, m2, m3, m4 = st.columns(4)
-        m1.metric("Quantidade", f"{qtd}")
-        m2.metric("Recebido", fmt_brl(recebido))
-        m3.metric("A receber", fmt_brl(a_receber))
-        m4.metric("Cancelados", f"{cancelados_qtd}")
-
-        if deposit_on:
-            ex1, ex2 = st.columns(2)
-            ex1.metric("Total serviços (gerado)", fmt_brl(total_gerado))
-            ex2.metric("Total sinais", fmt_brl(total_sinais))
-        else:
-            st.metric("Total serviços (gerado)", fmt_brl(total_gerado))
-
-        # --------- tabela (mais legível) ---------
-        df_show = df_filtrado.sort_values(["Data_dt", "Horário", "status_ord"], ascending=[True, True, True]).copy()
-
-        # ✅ remove colunas técnicas + remove "Criado em" (não serve mais)
-        drop_cols = [c for c in ["Data_dt", "Status_norm", "status_ord"] if c in df_show.columns]
-        df_show = df_show.drop(columns=drop_cols, errors="ignore")
-
-        if "Criado em" in df_show.columns:
-            df_show = df_show.drop(columns=["Criado em"], errors="ignore")
-
-        if not deposit_on and "Sinal" in df_show.columns:
-            df_show = df_show.drop(columns=["Sinal"], errors="ignore")
-
-        # formatação BRL
-        df_show["Preço do serviço"] = df_show["Preço do serviço"].apply(lambda v: fmt_brl(float(v)))
-        if "Sinal" in df_show.columns:
-            df_show["Sinal"] = df_show["Sinal"].apply(lambda v: fmt_brl(float(v)))
-
-        st.dataframe(
-            df_show.drop(columns=["id"], errors="ignore"),
-            use_container_width=True,
-            height=360
-        )
-
-        # ====================================================
-        # AÇÕES RÁPIDAS
-        # ====================================================
-        # AÇÕES RÁPIDAS
-        # ====================================================
-        st.divider()
-        st.subheader("⚡ Ações rápidas")
-
-        # ✅ legenda para evitar confusão (cancelar vs excluir)
-        st.caption("❌ **Cancelar** mantém o registro no histórico • 🗑️ **Excluir** remove definitivamente.")
-
-        def fmt_ag(ag_id: int) -> str:
-            row = df_admin[df_admin.id == ag_id]
-            if row.empty:
-                return str(ag_id)
-            r = row.iloc[0]
-            # aqui mantemos o label simples no select (sem o "há X"),
-            # pra não ficar mudando enquanto você usa o selectbox
-            return f"{r['Cliente']} • {r['Data']} {r['Horário']} • {STATUS_LABELS.get(r['Status_norm'], r['Status_norm'])}"
-
-        def resumo_ag(ag_id: int) -> str:
-            """Resumo fixo para usar em mensagens de sucesso/erro."""
-            row = df_admin[df_admin.id == ag_id]
-            if row.empty:
-                return f"ID {ag_id}"
-            r = row.iloc[0]
-            return f"{r['Cliente']} • {r['Data']} {r['Horário']}"
-
-        colA, colB = st.columns(2)
-
-        with colA:
-            st.subheader("✅ Marcar como PAGO")
-            pendentes_ids = df_admin[df_admin["Status_norm"] == "pendente"]["id"].tolist()
-            ids_para_pagar = pendentes_ids if pendentes_ids else df_admin["id"].tolist()
-
-            ag_pagar = st.selectbox(
-                "Selecione o agendamento",
-                ids_para_pagar,
-                format_func=fmt_ag,
-                key="pagar_select",
-            )
-
-            if st.button("Marcar como PAGO", type="primary", use_container_width=True):
-                marcar_status_admin(access_token, tenant_id, int(ag_pagar), "pago")
-                st.success(f"✅ Marcado como **PAGO**: {resumo_ag(int(ag_pagar))}")
-                st.rerun()
-
-        with colB:
-            st.subheader("❌ Marcar como CANCELADO")
-            ids_cancel = df_admin[df_admin["Status_norm"] != "cancelado"]["id"].tolist() or df_admin["id"].tolist()
-
-            ag_cancel = st.selectbox(
-                "Selecione o agendamento",
-                ids_cancel,
-                format_func=fmt_ag,
-                key="cancel_select",
-            )
-
-            if st.button("Marcar como CANCELADO", use_container_width=True):
-                marcar_status_admin(access_token, tenant_id, int(ag_cancel), "cancelado")
-                st.success(f"❌ Marcado como **CANCELADO**: {resumo_ag(int(ag_cancel))}")
-                st.rerun()
-
-        st.subheader("🗑️ Excluir agendamento")
-        ag_excluir = st.selectbox(
-            "Selecione para excluir",
-            df_admin["id"],
-            format_func=fmt_ag,
-            key="excluir_select_unique",
-        )
-
-        # ✅ confirmação obrigatória (protege contra erro irreversível)
-        confirm_delete = st.checkbox(
-            "Confirmo que desejo excluir definitivamente este agendamento",
-            value=False,
-            key="confirm_delete_checkbox",
-        )
+        atualizados = atualizar_finalizados_admin(access_token, tenant_id)
+    if atualizados:
+        invalidar_cache_agendamentos()
 
-        if st.button("Excluir agendamento", use_container_width=True, disabled=not confirm_delete):
-            excluir_agendamento_admin(access_token, tenant_id, int(ag_excluir))
-            st.success(f"🗑️ **Excluído definitivamente**: {resumo_ag(int(ag_excluir))}")
-            st.rerun()
+    bloco_agendamentos(access_token, tenant_id)
 
     st.divider()
     if st.button("🚀 Assinar plano", type="primary", use_container_width=True):
@@ -2604,6 +3820,9 @@ def tela_admin():
             st.error("Falha ao iniciar assinatura.")
             st.code(str(e))
 
+    if st.query_params.get("debug") == "1":
+        painel_debug()
+
     # ===== Rodapé fixo "Sair" (sempre no final da tela) =====
     st.markdown("""
     <div class="footer-logout">
@@ -2616,10 +3835,17 @@ def tela_admin():
 # ROUTER
 # ============================================================
 
+def rodar_tela(tela):
+    # st.stop()/st.rerun() saem por exceção: a duração é registrada mesmo assim
+    try:
+        tela()
+    finally:
+        agenda_metricas.observar_execucao(tela.__name__, agenda_medicao.atual().decorrido_seg())
+
 if st.query_params.get("reset") == "1":
-    tela_reset_senha()
+    rodar_tela(tela_reset_senha)
     st.stop()
 elif IS_PUBLIC:
-    tela_publica()
+    rodar_tela(tela_publica)
 else:
-    tela_admin()
+    rodar_tela(tela_admin)
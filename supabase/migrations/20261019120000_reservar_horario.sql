@@ -0,0 +1,107 @@
+-- ============================================================
+-- Reserva atômica de horário ("hold slot")
+--
+-- Substitui o "consulta ocupados -> insere" do cliente por uma única chamada:
+-- trava (tenant, data, horário) com advisory lock da transação, confere se já
+-- existe agendamento que bloqueia o horário e insere o pendente. Duas pessoas
+-- clicando no mesmo horário ao mesmo tempo: uma recebe ok, a outra slot_taken.
+--
+-- Os nomes dos parâmetros são os mesmos do payload de URL_RESERVAR, então dá
+-- para apontar URL_RESERVAR direto para
+--   {SUPABASE_URL}/rest/v1/rpc/reservar_horario
+-- (ou a edge function pode chamar esta RPC).
+-- ============================================================
+
+-- Minutos que um 'pendente' segura o horário (mesmo papel do TEMPO_EXPIRACAO_MIN
+-- do app; <= 0 = pendente nunca expira).
+create or replace function public.agenda_expiracao_min()
+returns integer
+language sql
+immutable
+as $$ select 60 $$;
+
+-- Mesma regra de horarios_ocupados_publico(): cancelado não ocupa, pago/finalizado
+-- ocupam, pendente ocupa até expirar.
+create or replace function public.agenda_bloqueia(status text, created_at timestamptz)
+returns boolean
+language sql
+stable
+as $$
+  select case coalesce(nullif(lower(trim(status)), ''), 'pendente')
+    when 'pago' then true
+    when 'finalizado' then true
+    when 'pendente' then
+      public.agenda_expiracao_min() <= 0
+      or created_at is null
+      or created_at >= now() - make_interval(mins => public.agenda_expiracao_min())
+    else false
+  end
+$$;
+
+create or replace function public.reservar_horario(
+  tenant_id text,
+  cliente text,
+  data date,
+  horario text,
+  servico text,
+  valor numeric
+)
+returns jsonb
+language plpgsql
+security definer
+set search_path = public
+as $$
+declare
+  t public.tenants%rowtype;
+  novo public.agendamentos%rowtype;
+begin
+  select * into t from public.tenants where id::text = reservar_horario.tenant_id;
+  if not found then
+    return jsonb_build_object('ok', false, 'error', 'tenant_not_found');
+  end if;
+
+  if t.ativo is false
+     or t.paid_until is null
+     or t.paid_until < current_date
+     or coalesce(t.billing_status, 'active') not in ('active', 'trial') then
+    return jsonb_build_object('ok', false, 'error', 'tenant_blocked');
+  end if;
+
+  if coalesce(trim(reservar_horario.cliente), '') = '' or coalesce(trim(reservar_horario.horario), '') = '' then
+    return jsonb_build_object('ok', false, 'error', 'invalid_payload');
+  end if;
+
+  -- serializa só quem disputa o mesmo horário
+  perform pg_advisory_xact_lock(
+    hashtext(t.id::text || '|' || reservar_horario.data::text || '|' || reservar_horario.horario)
+  );
+
+  if exists (
+    select 1
+    from public.agendamentos a
+    where a.tenant_id = t.id
+      and a.data = reservar_horario.data
+      and a.horario = reservar_horario.horario
+      and public.agenda_bloqueia(a.status, a.created_at)
+  ) then
+    return jsonb_build_object('ok', false, 'error', 'slot_taken');
+  end if;
+
+  insert into public.agendamentos (tenant_id, cliente, data, horario, servico, status, valor)
+  values (
+    t.id,
+    trim(reservar_horario.cliente),
+    reservar_horario.data,
+    trim(reservar_horario.horario),
+    reservar_horario.servico,
+    'pendente',
+    coalesce(reservar_horario.valor, 0)
+  )
+  returning * into novo;
+
+  return jsonb_build_object('ok', true, 'agendamento', to_jsonb(novo));
+end
+$$;
+
+revoke all on function public.reservar_horario(text, text, date, text, text, numeric) from public;
+grant execute on function public.reservar_horario(text, text, date, text, text, numeric) to anon, authenticated;
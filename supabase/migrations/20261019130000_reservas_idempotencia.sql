@@ -0,0 +1,128 @@
+-- ============================================================
+-- Idempotência da reserva
+--
+-- O app manda `idempotency_key` (uuid5 do conteúdo da reserva) junto com o
+-- payload de URL_RESERVAR. Uma reserva bem-sucedida fica registrada por
+-- agenda_idempotencia_min() minutos; reenviar a mesma chave nesse período
+-- devolve a resposta original (com "replay": true) em vez de criar outro
+-- pendente. Isso torna seguro o retry automático depois de timeout.
+-- ============================================================
+
+create table if not exists public.reservas_idempotencia (
+  tenant_id text not null,
+  chave text not null,
+  resposta jsonb not null,
+  criado_em timestamptz not null default now(),
+  primary key (tenant_id, chave)
+);
+
+create index if not exists reservas_idempotencia_criado_em_idx
+  on public.reservas_idempotencia (criado_em);
+
+-- só a RPC (security definer) mexe nessa tabela
+alter table public.reservas_idempotencia enable row level security;
+
+create or replace function public.agenda_idempotencia_min()
+returns integer
+language sql
+immutable
+as $$ select 30 $$;
+
+drop function if exists public.reservar_horario(text, text, date, text, text, numeric);
+
+create or replace function public.reservar_horario(
+  tenant_id text,
+  cliente text,
+  data date,
+  horario text,
+  servico text,
+  valor numeric,
+  idempotency_key text default null
+)
+returns jsonb
+language plpgsql
+security definer
+set search_path = public
+as $$
+declare
+  t public.tenants%rowtype;
+  novo public.agendamentos%rowtype;
+  v_chave text := nullif(trim(coalesce(reservar_horario.idempotency_key, '')), '');
+  anterior jsonb;
+  v_out jsonb;
+begin
+  select * into t from public.tenants where id::text = reservar_horario.tenant_id;
+  if not found then
+    return jsonb_build_object('ok', false, 'error', 'tenant_not_found');
+  end if;
+
+  if v_chave is not null then
+    -- retries simultâneos da mesma chave esperam o primeiro terminar
+    perform pg_advisory_xact_lock(hashtext('idem|' || t.id::text || '|' || v_chave));
+
+    select r.resposta into anterior
+    from public.reservas_idempotencia r
+    where r.tenant_id = t.id::text
+      and r.chave = v_chave
+      and r.criado_em >= now() - make_interval(mins => public.agenda_idempotencia_min());
+    if found then
+      return anterior || jsonb_build_object('replay', true);
+    end if;
+  end if;
+
+  if t.ativo is false
+     or t.paid_until is null
+     or t.paid_until < current_date
+     or coalesce(t.billing_status, 'active') not in ('active', 'trial') then
+    return jsonb_build_object('ok', false, 'error', 'tenant_blocked');
+  end if;
+
+  if coalesce(trim(reservar_horario.cliente), '') = '' or coalesce(trim(reservar_horario.horario), '') = '' then
+    return jsonb_build_object('ok', false, 'error', 'invalid_payload');
+  end if;
+
+  perform pg_advisory_xact_lock(
+    hashtext(t.id::text || '|' || reservar_horario.data::text || '|' || reservar_horario.horario)
+  );
+
+  if exists (
+    select 1
+    from public.agendamentos a
+    where a.tenant_id = t.id
+      and a.data = reservar_horario.data
+      and a.horario = reservar_horario.horario
+      and public.agenda_bloqueia(a.status, a.created_at)
+  ) then
+    return jsonb_build_object('ok', false, 'error', 'slot_taken');
+  end if;
+
+  insert into public.agendamentos (tenant_id, cliente, data, horario, servico, status, valor)
+  values (
+    t.id,
+    trim(reservar_horario.cliente),
+    reservar_horario.data,
+    trim(reservar_horario.horario),
+    reservar_horario.servico,
+    'pendente',
+    coalesce(reservar_horario.valor, 0)
+  )
+  returning * into novo;
+
+  v_out := jsonb_build_object('ok', true, 'agendamento', to_jsonb(novo));
+
+  if v_chave is not null then
+    delete from public.reservas_idempotencia
+    where criado_em < now() - make_interval(mins => public.agenda_idempotencia_min());
+
+    insert into public.reservas_idempotencia (tenant_id, chave, resposta)
+    values (t.id::text, v_chave, v_out)
+    on conflict on constraint reservas_idempotencia_pkey do update
+      set resposta = excluded.resposta, criado_em = excluded.criado_em;
+  end if;
+
+  return v_out;
+end
+$$;
+
+revoke all on function public.reservar_horario(text, text, date, text, text, numeric, text) from public;
+grant execute on function public.reservar_horario(text, text, date, text, text, numeric, text) to anon, authenticated;
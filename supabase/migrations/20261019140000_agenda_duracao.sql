@@ -0,0 +1,160 @@
+-- ============================================================
+-- Agendamento com duração
+--
+-- tenants.settings:
+--   "service_durations": {"Tatuagem (pequena)": 180, ...}  (minutos)
+--   "buffer_min": 10                                       (intervalo após cada atendimento)
+-- Um agendamento ocupa [horario, horario + duração + buffer). Serviço sem
+-- duração ocupa 1 minuto (só o horário de início), igual ao app.
+-- ============================================================
+
+create or replace function public.agenda_hhmm_min(h text)
+returns integer
+language sql
+immutable
+as $$
+  select case
+    when h ~ '^\s*\d{1,2}:\d{2}' then
+      split_part(trim(h), ':', 1)::int * 60 + substr(split_part(trim(h), ':', 2), 1, 2)::int
+    else null
+  end
+$$;
+
+-- duração (min) de "A + B" + buffer do tenant
+create or replace function public.agenda_duracao(settings jsonb, servico text)
+returns integer
+language sql
+immutable
+as $$
+  select greatest(
+           coalesce((
+             select sum(greatest(coalesce((settings -> 'service_durations' ->> trim(s))::int, 0), 0))
+             from unnest(string_to_array(coalesce(servico, ''), '+')) as s
+             where trim(s) <> ''
+           ), 0),
+           1
+         )
+       + greatest(coalesce((settings ->> 'buffer_min')::int, 0), 0)
+$$;
+
+-- Mesmo formato da edge function de URL_HORARIOS ({"rows": [...]}), já com o
+-- serviço de cada linha para o app calcular a duração. URL_HORARIOS pode
+-- apontar para {SUPABASE_URL}/rest/v1/rpc/horarios_ocupados.
+create or replace function public.horarios_ocupados(tenant_id text, data date)
+returns jsonb
+language sql
+stable
+security definer
+set search_path = public
+as $$
+  select jsonb_build_object('rows', coalesce(jsonb_agg(jsonb_build_object(
+           'horario', a.horario,
+           'servico', a.servico,
+           'status', a.status,
+           'created_at', a.created_at
+         ) order by a.horario), '[]'::jsonb))
+  from public.agendamentos a
+  where a.tenant_id::text = horarios_ocupados.tenant_id
+    and a.data = horarios_ocupados.data
+    and public.agenda_bloqueia(a.status, a.created_at)
+$$;
+
+revoke all on function public.horarios_ocupados(text, date) from public;
+grant execute on function public.horarios_ocupados(text, date) to anon, authenticated;
+
+create or replace function public.reservar_horario(
+  tenant_id text,
+  cliente text,
+  data date,
+  horario text,
+  servico text,
+  valor numeric,
+  idempotency_key text default null
+)
+returns jsonb
+language plpgsql
+security definer
+set search_path = public
+as $$
+declare
+  t public.tenants%rowtype;
+  novo public.agendamentos%rowtype;
+  v_chave text := nullif(trim(coalesce(reservar_horario.idempotency_key, '')), '');
+  anterior jsonb;
+  v_out jsonb;
+  v_ini integer;
+  v_fim integer;
+begin
+  select * into t from public.tenants where id::text = reservar_horario.tenant_id;
+  if not found then
+    return jsonb_build_object('ok', false, 'error', 'tenant_not_found');
+  end if;
+
+  if v_chave is not null then
+    perform pg_advisory_xact_lock(hashtext('idem|' || t.id::text || '|' || v_chave));
+
+    select r.resposta into anterior
+    from public.reservas_idempotencia r
+    where r.tenant_id = t.id::text
+      and r.chave = v_chave
+      and r.criado_em >= now() - make_interval(mins => public.agenda_idempotencia_min());
+    if found then
+      return anterior || jsonb_build_object('replay', true);
+    end if;
+  end if;
+
+  if t.ativo is false
+     or t.paid_until is null
+     or t.paid_until < current_date
+     or coalesce(t.billing_status, 'active') not in ('active', 'trial') then
+    return jsonb_build_object('ok', false, 'error', 'tenant_blocked');
+  end if;
+
+  v_ini := public.agenda_hhmm_min(reservar_horario.horario);
+  if coalesce(trim(reservar_horario.cliente), '') = '' or v_ini is null then
+    return jsonb_build_object('ok', false, 'error', 'invalid_payload');
+  end if;
+  v_fim := v_ini + public.agenda_duracao(t.settings, reservar_horario.servico);
+
+  -- com duração, horários diferentes podem colidir: serializa o dia do tenant
+  perform pg_advisory_xact_lock(hashtext(t.id::text || '|' || reservar_horario.data::text));
+
+  if exists (
+    select 1
+    from public.agendamentos a
+    where a.tenant_id = t.id
+      and a.data = reservar_horario.data
+      and public.agenda_bloqueia(a.status, a.created_at)
+      and public.agenda_hhmm_min(a.horario) < v_fim
+      and public.agenda_hhmm_min(a.horario) + public.agenda_duracao(t.settings, a.servico) > v_ini
+  ) then
+    return jsonb_build_object('ok', false, 'error', 'slot_taken');
+  end if;
+
+  insert into public.agendamentos (tenant_id, cliente, data, horario, servico, status, valor)
+  values (
+    t.id,
+    trim(reservar_horario.cliente),
+    reservar_horario.data,
+    trim(reservar_horario.horario),
+    reservar_horario.servico,
+    'pendente',
+    coalesce(reservar_horario.valor, 0)
+  )
+  returning * into novo;
+
+  v_out := jsonb_build_object('ok', true, 'agendamento', to_jsonb(novo));
+
+  if v_chave is not null then
+    delete from public.reservas_idempotencia
+    where criado_em < now() - make_interval(mins => public.agenda_idempotencia_min());
+
+    insert into public.reservas_idempotencia (tenant_id, chave, resposta)
+    values (t.id::text, v_chave, v_out)
+    on conflict on constraint reservas_idempotencia_pkey do update
+      set resposta = excluded.resposta, criado_em = excluded.criado_em;
+  end if;
+
+  return v_out;
+end
+$$;
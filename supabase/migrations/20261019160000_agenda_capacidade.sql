@@ -0,0 +1,176 @@
+-- ============================================================
+-- Capacidade por horário
+--
+-- tenants.settings:
+--   "slot_capacity": 3   (clientes ao mesmo tempo; padrão 1)
+-- Com profissionais cadastrados a capacidade vale por profissional.
+-- reservar_horario passa a aceitar até N agendamentos cruzando o horário
+-- pedido (mesma contagem que o app usa para mostrar as vagas).
+--
+-- ocupacao_dia: a ocupação do dia numa consulta só, agrupada por horário
+-- (e serviço/recurso, que definem a duração e de quem é a vaga). Mesmo
+-- formato {"rows": [...]} de URL_HORARIOS, com "qtd" em cada linha.
+-- ============================================================
+
+create or replace function public.agenda_capacidade(settings jsonb)
+returns integer
+language sql
+immutable
+as $$
+  select greatest(coalesce((settings ->> 'slot_capacity')::int, 1), 1)
+$$;
+
+create or replace function public.ocupacao_dia(tenant_id text, data date)
+returns jsonb
+language sql
+stable
+security definer
+set search_path = public
+as $$
+  select jsonb_build_object('rows', coalesce(jsonb_agg(jsonb_build_object(
+           'horario', o.horario,
+           'servico', o.servico,
+           'recurso_id', o.recurso_id,
+           'qtd', o.qtd
+         ) order by o.horario), '[]'::jsonb))
+  from (
+    select a.horario, a.servico, a.recurso_id, count(*) as qtd
+    from public.agendamentos a
+    where a.tenant_id::text = ocupacao_dia.tenant_id
+      and a.data = ocupacao_dia.data
+      and public.agenda_bloqueia(a.status, a.created_at)
+    group by a.horario, a.servico, a.recurso_id
+  ) o
+$$;
+
+revoke all on function public.ocupacao_dia(text, date) from public;
+grant execute on function public.ocupacao_dia(text, date) to anon, authenticated;
+
+create or replace function public.reservar_horario(
+  tenant_id text,
+  cliente text,
+  data date,
+  horario text,
+  servico text,
+  valor numeric,
+  idempotency_key text default null,
+  recurso_id text default null
+)
+returns jsonb
+language plpgsql
+security definer
+set search_path = public
+as $$
+declare
+  t public.tenants%rowtype;
+  novo public.agendamentos%rowtype;
+  v_chave text := nullif(trim(coalesce(reservar_horario.idempotency_key, '')), '');
+  v_pedido text := nullif(trim(coalesce(reservar_horario.recurso_id, '')), '');
+  anterior jsonb;
+  v_out jsonb;
+  v_ini integer;
+  v_fim integer;
+  v_recursos text[];
+  v_padrao text;
+  v_candidatos text[];
+  v_rec text;
+  v_escolhido text;
+  v_cap integer;
+begin
+  select * into t from public.tenants where id::text = reservar_horario.tenant_id;
+  if not found then
+    return jsonb_build_object('ok', false, 'error', 'tenant_not_found');
+  end if;
+
+  if v_chave is not null then
+    perform pg_advisory_xact_lock(hashtext('idem|' || t.id::text || '|' || v_chave));
+
+    select r.resposta into anterior
+    from public.reservas_idempotencia r
+    where r.tenant_id = t.id::text
+      and r.chave = v_chave
+      and r.criado_em >= now() - make_interval(mins => public.agenda_idempotencia_min());
+    if found then
+      return anterior || jsonb_build_object('replay', true);
+    end if;
+  end if;
+
+  if t.ativo is false
+     or t.paid_until is null
+     or t.paid_until < current_date
+     or coalesce(t.billing_status, 'active') not in ('active', 'trial') then
+    return jsonb_build_object('ok', false, 'error', 'tenant_blocked');
+  end if;
+
+  v_ini := public.agenda_hhmm_min(reservar_horario.horario);
+  if coalesce(trim(reservar_horario.cliente), '') = '' or v_ini is null then
+    return jsonb_build_object('ok', false, 'error', 'invalid_payload');
+  end if;
+  v_fim := v_ini + public.agenda_duracao(t.settings, reservar_horario.servico);
+
+  v_cap := public.agenda_capacidade(t.settings);
+  v_recursos := public.agenda_recursos_ativos(t.settings);
+  v_padrao := v_recursos[1];
+  if v_pedido is not null then
+    if not (v_pedido = any (v_recursos)) then
+      return jsonb_build_object('ok', false, 'error', 'resource_not_found');
+    end if;
+    v_candidatos := array[v_pedido];
+  elsif cardinality(v_recursos) > 0 then
+    v_candidatos := v_recursos;
+  else
+    -- agenda única: um "recurso" nulo que colide com tudo
+    v_candidatos := array[null::text];
+  end if;
+
+  -- com duração, horários diferentes podem colidir: serializa o dia do tenant
+  perform pg_advisory_xact_lock(hashtext(t.id::text || '|' || reservar_horario.data::text));
+
+  foreach v_rec in array v_candidatos loop
+    if (
+      select count(*)
+      from public.agendamentos a
+      where a.tenant_id = t.id
+        and a.data = reservar_horario.data
+        and public.agenda_bloqueia(a.status, a.created_at)
+        and (v_rec is null or coalesce(a.recurso_id, v_padrao) = v_rec)
+        and public.agenda_hhmm_min(a.horario) < v_fim
+        and public.agenda_hhmm_min(a.horario) + public.agenda_duracao(t.settings, a.servico) > v_ini
+    ) < v_cap then
+      v_escolhido := coalesce(v_rec, '');
+      exit;
+    end if;
+  end loop;
+
+  if v_escolhido is null then
+    return jsonb_build_object('ok', false, 'error', 'slot_taken');
+  end if;
+
+  insert into public.agendamentos (tenant_id, cliente, data, horario, servico, status, valor, recurso_id)
+  values (
+    t.id,
+    trim(reservar_horario.cliente),
+    reservar_horario.data,
+    trim(reservar_horario.horario),
+    reservar_horario.servico,
+    'pendente',
+    coalesce(reservar_horario.valor, 0),
+    nullif(v_escolhido, '')
+  )
+  returning * into novo;
+
+  v_out := jsonb_build_object('ok', true, 'agendamento', to_jsonb(novo));
+
+  if v_chave is not null then
+    delete from public.reservas_idempotencia
+    where criado_em < now() - make_interval(mins => public.agenda_idempotencia_min());
+
+    insert into public.reservas_idempotencia (tenant_id, chave, resposta)
+    values (t.id::text, v_chave, v_out)
+    on conflict on constraint reservas_idempotencia_pkey do update
+      set resposta = excluded.resposta, criado_em = excluded.criado_em;
+  end if;
+
+  return v_out;
+end
+$$;
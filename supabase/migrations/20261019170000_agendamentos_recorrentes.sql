@@ -0,0 +1,235 @@
+-- ============================================================
+-- Agendamentos recorrentes (clientes fixos)
+--
+-- Uma linha por regra (semanal / quinzenal / mensal, com fim opcional e
+-- datas puladas em `excecoes`); as ocorrências não são gravadas.
+-- agenda_ocupacao(tenant, data) junta os agendamentos que bloqueiam o dia
+-- com as regras que caem nele, e é a base de ocupacao_dia e da checagem de
+-- conflito do reservar_horario. Mesma regra do app (agenda_disponibilidade):
+-- "mensal" repete no mesmo dia do mês, ou no último dia se o mês for curto.
+-- ============================================================
+
+create table if not exists public.agendamentos_recorrentes (
+  id bigint generated by default as identity primary key,
+  tenant_id uuid not null references public.tenants(id) on delete cascade,
+  cliente text not null,
+  servico text not null default '',
+  horario text not null,
+  recurso_id text,
+  valor numeric not null default 0,
+  freq text not null default 'semanal' check (freq in ('semanal', 'quinzenal', 'mensal')),
+  inicio date not null,
+  fim date,
+  excecoes date[] not null default '{}',
+  ativo boolean not null default true,
+  created_at timestamptz not null default now()
+);
+
+create index if not exists agendamentos_recorrentes_tenant_idx
+  on public.agendamentos_recorrentes (tenant_id) where ativo;
+
+alter table public.agendamentos_recorrentes enable row level security;
+
+drop policy if exists agendamentos_recorrentes_dono on public.agendamentos_recorrentes;
+create policy agendamentos_recorrentes_dono on public.agendamentos_recorrentes
+  for all to authenticated
+  using (exists (select 1 from public.tenants t where t.id = tenant_id and t.owner_user_id = auth.uid()))
+  with check (exists (select 1 from public.tenants t where t.id = tenant_id and t.owner_user_id = auth.uid()));
+
+grant select, insert, update, delete on public.agendamentos_recorrentes to authenticated;
+
+create or replace function public.agenda_recorrente_ocorre(
+  freq text,
+  inicio date,
+  fim date,
+  excecoes date[],
+  d date
+)
+returns boolean
+language sql
+immutable
+as $$
+  select d >= inicio
+     and (fim is null or d <= fim)
+     and not (d = any (coalesce(excecoes, '{}')))
+     and case freq
+           when 'semanal' then (d - inicio) % 7 = 0
+           when 'quinzenal' then (d - inicio) % 14 = 0
+           when 'mensal' then extract(day from d) = least(
+             extract(day from inicio),
+             extract(day from (date_trunc('month', d) + interval '1 month - 1 day'))
+           )
+           else false
+         end
+$$;
+
+-- o que ocupa a agenda do tenant no dia: avulsos que bloqueiam + recorrentes
+create or replace function public.agenda_ocupacao(p_tenant uuid, p_data date)
+returns table (horario text, servico text, recurso_id text)
+language sql
+stable
+security definer
+set search_path = public
+as $$
+  select a.horario, a.servico, a.recurso_id
+  from public.agendamentos a
+  where a.tenant_id = p_tenant
+    and a.data = p_data
+    and public.agenda_bloqueia(a.status, a.created_at)
+  union all
+  select r.horario, r.servico, r.recurso_id
+  from public.agendamentos_recorrentes r
+  where r.tenant_id = p_tenant
+    and r.ativo
+    and public.agenda_recorrente_ocorre(r.freq, r.inicio, r.fim, r.excecoes, p_data)
+$$;
+
+revoke all on function public.agenda_ocupacao(uuid, date) from public;
+
+create or replace function public.ocupacao_dia(tenant_id text, data date)
+returns jsonb
+language sql
+stable
+security definer
+set search_path = public
+as $$
+  select jsonb_build_object('rows', coalesce(jsonb_agg(jsonb_build_object(
+           'horario', o.horario,
+           'servico', o.servico,
+           'recurso_id', o.recurso_id,
+           'qtd', o.qtd
+         ) order by o.horario), '[]'::jsonb))
+  from (
+    select a.horario, a.servico, a.recurso_id, count(*) as qtd
+    from public.tenants t
+    cross join lateral public.agenda_ocupacao(t.id, ocupacao_dia.data) a
+    where t.id::text = ocupacao_dia.tenant_id
+    group by a.horario, a.servico, a.recurso_id
+  ) o
+$$;
+
+create or replace function public.reservar_horario(
+  tenant_id text,
+  cliente text,
+  data date,
+  horario text,
+  servico text,
+  valor numeric,
+  idempotency_key text default null,
+  recurso_id text default null
+)
+returns jsonb
+language plpgsql
+security definer
+set search_path = public
+as $$
+declare
+  t public.tenants%rowtype;
+  novo public.agendamentos%rowtype;
+  v_chave text := nullif(trim(coalesce(reservar_horario.idempotency_key, '')), '');
+  v_pedido text := nullif(trim(coalesce(reservar_horario.recurso_id, '')), '');
+  anterior jsonb;
+  v_out jsonb;
+  v_ini integer;
+  v_fim integer;
+  v_recursos text[];
+  v_padrao text;
+  v_candidatos text[];
+  v_rec text;
+  v_escolhido text;
+  v_cap integer;
+begin
+  select * into t from public.tenants where id::text = reservar_horario.tenant_id;
+  if not found then
+    return jsonb_build_object('ok', false, 'error', 'tenant_not_found');
+  end if;
+
+  if v_chave is not null then
+    perform pg_advisory_xact_lock(hashtext('idem|' || t.id::text || '|' || v_chave));
+
+    select r.resposta into anterior
+    from public.reservas_idempotencia r
+    where r.tenant_id = t.id::text
+      and r.chave = v_chave
+      and r.criado_em >= now() - make_interval(mins => public.agenda_idempotencia_min());
+    if found then
+      return anterior || jsonb_build_object('replay', true);
+    end if;
+  end if;
+
+  if t.ativo is false
+     or t.paid_until is null
+     or t.paid_until < current_date
+     or coalesce(t.billing_status, 'active') not in ('active', 'trial') then
+    return jsonb_build_object('ok', false, 'error', 'tenant_blocked');
+  end if;
+
+  v_ini := public.agenda_hhmm_min(reservar_horario.horario);
+  if coalesce(trim(reservar_horario.cliente), '') = '' or v_ini is null then
+    return jsonb_build_object('ok', false, 'error', 'invalid_payload');
+  end if;
+  v_fim := v_ini + public.agenda_duracao(t.settings, reservar_horario.servico);
+
+  v_cap := public.agenda_capacidade(t.settings);
+  v_recursos := public.agenda_recursos_ativos(t.settings);
+  v_padrao := v_recursos[1];
+  if v_pedido is not null then
+    if not (v_pedido = any (v_recursos)) then
+      return jsonb_build_object('ok', false, 'error', 'resource_not_found');
+    end if;
+    v_candidatos := array[v_pedido];
+  elsif cardinality(v_recursos) > 0 then
+    v_candidatos := v_recursos;
+  else
+    -- agenda única: um "recurso" nulo que colide com tudo
+    v_candidatos := array[null::text];
+  end if;
+
+  -- com duração, horários diferentes podem colidir: serializa o dia do tenant
+  perform pg_advisory_xact_lock(hashtext(t.id::text || '|' || reservar_horario.data::text));
+
+  foreach v_rec in array v_candidatos loop
+    if (
+      select count(*)
+      from public.agenda_ocupacao(t.id, reservar_horario.data) a
+      where (v_rec is null or coalesce(a.recurso_id, v_padrao) = v_rec)
+        and public.agenda_hhmm_min(a.horario) < v_fim
+        and public.agenda_hhmm_min(a.horario) + public.agenda_duracao(t.settings, a.servico) > v_ini
+    ) < v_cap then
+      v_escolhido := coalesce(v_rec, '');
+      exit;
+    end if;
+  end loop;
+
+  if v_escolhido is null then
+    return jsonb_build_object('ok', false, 'error', 'slot_taken');
+  end if;
+
+  insert into public.agendamentos (tenant_id, cliente, data, horario, servico, status, valor, recurso_id)
+  values (
+    t.id,
+    trim(reservar_horario.cliente),
+    reservar_horario.data,
+    trim(reservar_horario.horario),
+    reservar_horario.servico,
+    'pendente',
+    coalesce(reservar_horario.valor, 0),
+    nullif(v_escolhido, '')
+  )
+  returning * into novo;
+
+  v_out := jsonb_build_object('ok', true, 'agendamento', to_jsonb(novo));
+
+  if v_chave is not null then
+    delete from public.reservas_idempotencia
+    where criado_em < now() - make_interval(mins => public.agenda_idempotencia_min());
+
+    insert into public.reservas_idempotencia (tenant_id, chave, resposta)
+    values (t.id::text, v_chave, v_out)
+    on conflict on constraint reservas_idempotencia_pkey do update
+      set resposta = excluded.resposta, criado_em = excluded.criado_em;
+  end if;
+
+  return v_out;
+end
+$$;
@@ -0,0 +1,234 @@
+-- ============================================================
+-- Lista de espera + fila de vagas liberadas
+--
+-- Cliente sem horário entra na lista do dia (entrar_lista_espera, anon).
+-- Cada vaga que abre vira um evento em agenda_eventos:
+--   * 'cancelado' / 'excluido': trigger em agendamentos
+--   * 'expirado': pendente que passou de agenda_expiracao_min(), enfileirado
+--     pelo próprio processar_lista_espera (uma vez por agendamento)
+-- processar_lista_espera consome só os eventos pendentes do tenant
+-- (for update skip locked: duas sessões do admin não pegam o mesmo evento),
+-- oferece a vaga ao primeiro da fila daquele dia e devolve as ofertas para o
+-- app montar o link de WhatsApp. Nenhuma varredura das listas inteiras.
+-- ============================================================
+
+create table if not exists public.lista_espera (
+  id bigint generated by default as identity primary key,
+  tenant_id uuid not null references public.tenants(id) on delete cascade,
+  data date not null,
+  cliente text not null,
+  whatsapp text not null,
+  servico text not null default '',
+  recurso_id text,
+  status text not null default 'aguardando'
+    check (status in ('aguardando', 'oferecido', 'avisado', 'cancelado')),
+  horario_ofertado text,
+  oferecido_em timestamptz,
+  created_at timestamptz not null default now()
+);
+
+create index if not exists lista_espera_fila_idx
+  on public.lista_espera (tenant_id, data, created_at) where status = 'aguardando';
+
+create table if not exists public.agenda_eventos (
+  id bigint generated by default as identity primary key,
+  tenant_id uuid not null references public.tenants(id) on delete cascade,
+  agendamento_id bigint,
+  tipo text not null check (tipo in ('cancelado', 'excluido', 'expirado')),
+  data date not null,
+  horario text not null,
+  recurso_id text,
+  criado_em timestamptz not null default now(),
+  processado_em timestamptz
+);
+
+create index if not exists agenda_eventos_pendentes_idx
+  on public.agenda_eventos (tenant_id, id) where processado_em is null;
+
+create unique index if not exists agenda_eventos_expirado_uidx
+  on public.agenda_eventos (agendamento_id) where tipo = 'expirado';
+
+alter table public.lista_espera enable row level security;
+alter table public.agenda_eventos enable row level security;
+
+drop policy if exists lista_espera_dono on public.lista_espera;
+create policy lista_espera_dono on public.lista_espera
+  for all to authenticated
+  using (exists (select 1 from public.tenants t where t.id = tenant_id and t.owner_user_id = auth.uid()))
+  with check (exists (select 1 from public.tenants t where t.id = tenant_id and t.owner_user_id = auth.uid()));
+
+grant select, update, delete on public.lista_espera to authenticated;
+
+-- ---------- produtor: cancelamento / exclusão ----------
+create or replace function public.agenda_evento_vaga()
+returns trigger
+language plpgsql
+security definer
+set search_path = public
+as $$
+begin
+  if tg_op = 'UPDATE' then
+    -- pendente já expirado não libera nada de novo (o 'expirado' cuida dele)
+    if new.status = 'cancelado' and old.status is distinct from 'cancelado' and new.data >= current_date
+       and public.agenda_bloqueia(old.status, old.created_at) then
+      insert into public.agenda_eventos (tenant_id, agendamento_id, tipo, data, horario, recurso_id)
+      values (new.tenant_id, new.id, 'cancelado', new.data, new.horario, new.recurso_id);
+    end if;
+    return new;
+  end if;
+
+  if old.status is distinct from 'cancelado' and old.data >= current_date
+     and public.agenda_bloqueia(old.status, old.created_at) then
+    insert into public.agenda_eventos (tenant_id, agendamento_id, tipo, data, horario, recurso_id)
+    values (old.tenant_id, old.id, 'excluido', old.data, old.horario, old.recurso_id);
+  end if;
+  return old;
+end
+$$;
+
+drop trigger if exists agendamentos_evento_vaga on public.agendamentos;
+create trigger agendamentos_evento_vaga
+  after update of status or delete on public.agendamentos
+  for each row execute function public.agenda_evento_vaga();
+
+-- ---------- entrada (página pública) ----------
+create or replace function public.entrar_lista_espera(
+  tenant_id text,
+  data date,
+  cliente text,
+  whatsapp text,
+  servico text default '',
+  recurso_id text default null
+)
+returns jsonb
+language plpgsql
+security definer
+set search_path = public
+as $$
+declare
+  t public.tenants%rowtype;
+  v_fone text := regexp_replace(coalesce(entrar_lista_espera.whatsapp, ''), '\D', '', 'g');
+  v_pos integer;
+begin
+  select * into t from public.tenants where id::text = entrar_lista_espera.tenant_id;
+  if not found then
+    return jsonb_build_object('ok', false, 'error', 'tenant_not_found');
+  end if;
+
+  if coalesce(trim(entrar_lista_espera.cliente), '') = ''
+     or length(v_fone) < 10
+     or entrar_lista_espera.data is null
+     or entrar_lista_espera.data < current_date then
+    return jsonb_build_object('ok', false, 'error', 'invalid_payload');
+  end if;
+
+  -- mesma pessoa no mesmo dia: não duplica
+  if not exists (
+    select 1 from public.lista_espera e
+    where e.tenant_id = t.id
+      and e.data = entrar_lista_espera.data
+      and e.whatsapp = v_fone
+      and e.status = 'aguardando'
+  ) then
+    insert into public.lista_espera (tenant_id, data, cliente, whatsapp, servico, recurso_id)
+    values (
+      t.id,
+      entrar_lista_espera.data,
+      trim(entrar_lista_espera.cliente),
+      v_fone,
+      coalesce(entrar_lista_espera.servico, ''),
+      nullif(trim(coalesce(entrar_lista_espera.recurso_id, '')), '')
+    );
+  end if;
+
+  select count(*) into v_pos
+  from public.lista_espera e
+  where e.tenant_id = t.id
+    and e.data = entrar_lista_espera.data
+    and e.status = 'aguardando'
+    and e.created_at <= (
+      select max(x.created_at) from public.lista_espera x
+      where x.tenant_id = t.id and x.data = entrar_lista_espera.data
+        and x.whatsapp = v_fone and x.status = 'aguardando'
+    );
+
+  return jsonb_build_object('ok', true, 'posicao', v_pos);
+end
+$$;
+
+revoke all on function public.entrar_lista_espera(text, date, text, text, text, text) from public;
+grant execute on function public.entrar_lista_espera(text, date, text, text, text, text) to anon, authenticated;
+
+-- ---------- consumidor (painel do dono) ----------
+create or replace function public.processar_lista_espera(tenant_id text, limite integer default 20)
+returns jsonb
+language plpgsql
+security definer
+set search_path = public
+as $$
+declare
+  t public.tenants%rowtype;
+  ev public.agenda_eventos%rowtype;
+  esp public.lista_espera%rowtype;
+  v_ofertas jsonb := '[]'::jsonb;
+begin
+  select * into t from public.tenants where id::text = processar_lista_espera.tenant_id;
+  if not found or t.owner_user_id is distinct from auth.uid() then
+    return jsonb_build_object('ok', false, 'error', 'forbidden');
+  end if;
+
+  -- pendentes que expiraram desde a última rodada (uma vez cada, pelo índice único)
+  insert into public.agenda_eventos (tenant_id, agendamento_id, tipo, data, horario, recurso_id)
+  select a.tenant_id, a.id, 'expirado', a.data, a.horario, a.recurso_id
+  from public.agendamentos a
+  where a.tenant_id = t.id
+    and a.data >= current_date
+    and a.status = 'pendente'
+    and not public.agenda_bloqueia(a.status, a.created_at)
+  on conflict do nothing;
+
+  for ev in
+    select * from public.agenda_eventos e
+    where e.tenant_id = t.id and e.processado_em is null
+    order by e.id
+    limit greatest(coalesce(processar_lista_espera.limite, 20), 1)
+    for update skip locked
+  loop
+    update public.agenda_eventos set processado_em = now() where id = ev.id;
+
+    if ev.data < current_date then
+      continue;
+    end if;
+
+    select * into esp from public.lista_espera e
+    where e.tenant_id = t.id
+      and e.data = ev.data
+      and e.status = 'aguardando'
+      and (e.recurso_id is null or ev.recurso_id is null or e.recurso_id = ev.recurso_id)
+    order by e.created_at, e.id
+    limit 1
+    for update skip locked;
+
+    if found then
+      update public.lista_espera
+      set status = 'oferecido', horario_ofertado = ev.horario, oferecido_em = now()
+      where id = esp.id;
+
+      v_ofertas := v_ofertas || jsonb_build_object(
+        'espera_id', esp.id,
+        'cliente', esp.cliente,
+        'whatsapp', esp.whatsapp,
+        'servico', esp.servico,
+        'data', ev.data,
+        'horario', ev.horario,
+        'motivo', ev.tipo
+      );
+    end if;
+  end loop;
+
+  return jsonb_build_object('ok', true, 'ofertas', v_ofertas);
+end
+$$;
+
+revoke all on function public.processar_lista_espera(text, integer) from public;
+grant execute on function public.processar_lista_espera(text, integer) to authenticated;
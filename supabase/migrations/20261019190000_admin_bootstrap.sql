@@ -0,0 +1,118 @@
+-- ============================================================
+-- admin_bootstrap: tudo que o painel precisa numa chamada só
+--
+-- Devolve usuário, tenant, settings, profile (criado no primeiro acesso),
+-- assinatura da agenda (kpis.total / kpis.ultimo_criado — a mesma do
+-- fingerprint do app), a primeira página de agendamentos e os clientes fixos.
+-- Antes de ler, faz a virada 'pago' -> 'finalizado' dos horários que já
+-- passaram no fuso do app. Sem tenant, devolve só usuário e profile (o app
+-- segue para a criação automática).
+-- ============================================================
+
+create or replace function public.admin_bootstrap(
+  fuso text default 'America/Sao_Paulo',
+  limite integer default 500
+)
+returns jsonb
+language plpgsql
+security definer
+set search_path = public
+as $$
+declare
+  v_uid uuid := auth.uid();
+  v_email text := coalesce(auth.jwt() ->> 'email', '');
+  v_agora timestamp;
+  t public.tenants%rowtype;
+  v_profile jsonb;
+  v_finalizados integer := 0;
+  v_total integer;
+  v_ultimo timestamptz;
+  v_agendamentos jsonb;
+  v_recorrentes jsonb;
+begin
+  if v_uid is null then
+    return jsonb_build_object('ok', false, 'error', 'forbidden');
+  end if;
+
+  begin
+    v_agora := now() at time zone coalesce(nullif(admin_bootstrap.fuso, ''), 'America/Sao_Paulo');
+  exception when others then
+    v_agora := now() at time zone 'America/Sao_Paulo';
+  end;
+
+  insert into public.profiles (id, email, nome, whatsapp, pix_chave, pix_nome, pix_cidade)
+  values (v_uid, v_email, '', '', '', '', '')
+  on conflict (id) do nothing;
+
+  select jsonb_build_object(
+           'id', p.id, 'email', p.email, 'nome', p.nome, 'whatsapp', p.whatsapp,
+           'pix_chave', p.pix_chave, 'pix_nome', p.pix_nome, 'pix_cidade', p.pix_cidade
+         )
+  into v_profile
+  from public.profiles p
+  where p.id = v_uid;
+
+  select * into t from public.tenants where owner_user_id = v_uid limit 1;
+  if not found then
+    return jsonb_build_object(
+      'ok', true,
+      'user', jsonb_build_object('id', v_uid, 'email', v_email),
+      'profile', v_profile,
+      'tenant', null
+    );
+  end if;
+
+  update public.agendamentos a
+  set status = 'finalizado'
+  where a.tenant_id = t.id
+    and a.status = 'pago'
+    and a.data <= v_agora::date
+    and a.horario ~ '^\d{1,2}:\d{2}$'
+    and (a.data + a.horario::time) < v_agora;
+  get diagnostics v_finalizados = row_count;
+
+  select count(*), max(a.created_at) into v_total, v_ultimo
+  from public.agendamentos a
+  where a.tenant_id = t.id;
+
+  select coalesce(jsonb_agg(to_jsonb(x) order by x.data, x.horario), '[]'::jsonb)
+  into v_agendamentos
+  from (
+    select a.id, a.cliente, a.data, a.horario, a.servico, a.status, a.valor,
+           a.created_at, a.tenant_id, a.recurso_id
+    from public.agendamentos a
+    where a.tenant_id = t.id
+    order by a.data, a.horario
+    limit greatest(coalesce(admin_bootstrap.limite, 500), 1)
+  ) x;
+
+  select coalesce(jsonb_agg(to_jsonb(r) order by r.inicio), '[]'::jsonb)
+  into v_recorrentes
+  from (
+    select r.id, r.cliente, r.servico, r.horario, r.recurso_id, r.valor, r.freq,
+           r.inicio, r.fim, r.excecoes, r.ativo
+    from public.agendamentos_recorrentes r
+    where r.tenant_id = t.id
+  ) r;
+
+  return jsonb_build_object(
+    'ok', true,
+    'user', jsonb_build_object('id', v_uid, 'email', v_email),
+    'profile', v_profile,
+    'tenant', jsonb_build_object(
+      'id', t.id, 'nome', t.nome, 'ativo', t.ativo, 'paid_until', t.paid_until,
+      'billing_status', t.billing_status, 'whatsapp_numero', t.whatsapp_numero,
+      'pix_chave', t.pix_chave, 'pix_nome', t.pix_nome, 'pix_cidade', t.pix_cidade,
+      'whatsapp', t.whatsapp, 'owner_user_id', t.owner_user_id
+    ),
+    'settings', case when jsonb_typeof(t.settings) = 'object' then t.settings else '{}'::jsonb end,
+    'finalizados', v_finalizados,
+    'kpis', jsonb_build_object('total', v_total, 'ultimo_criado', v_ultimo),
+    'agendamentos', v_agendamentos,
+    'recorrentes', v_recorrentes
+  );
+end
+$$;
+
+revoke all on function public.admin_bootstrap(text, integer) from public;
+grant execute on function public.admin_bootstrap(text, integer) to authenticated;
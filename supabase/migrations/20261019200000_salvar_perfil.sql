@@ -0,0 +1,68 @@
+-- ============================================================
+-- salvar_perfil: profile + WhatsApp do tenant numa transação só
+--
+-- `dados` traz só os campos a mudar (nome, whatsapp, pix_chave, pix_nome,
+-- pix_cidade); os ausentes ficam como estão. O WhatsApp vai junto para
+-- tenants.whatsapp_numero / tenants.whatsapp, então profile e tenant não
+-- ficam diferentes se uma das escritas falhar. Devolve as duas linhas.
+-- ============================================================
+
+create or replace function public.salvar_perfil(tenant_id text, dados jsonb)
+returns jsonb
+language plpgsql
+security definer
+set search_path = public
+as $$
+declare
+  v_uid uuid := auth.uid();
+  v_dados jsonb := coalesce(salvar_perfil.dados, '{}'::jsonb);
+  t public.tenants%rowtype;
+  p public.profiles%rowtype;
+begin
+  select * into t from public.tenants where id::text = salvar_perfil.tenant_id;
+  if not found or v_uid is null or t.owner_user_id is distinct from v_uid then
+    return jsonb_build_object('ok', false, 'error', 'forbidden');
+  end if;
+
+  if jsonb_typeof(v_dados) <> 'object' then
+    return jsonb_build_object('ok', false, 'error', 'invalid_payload');
+  end if;
+
+  insert into public.profiles (id, email, nome, whatsapp, pix_chave, pix_nome, pix_cidade)
+  values (v_uid, coalesce(auth.jwt() ->> 'email', ''), '', '', '', '', '')
+  on conflict (id) do nothing;
+
+  update public.profiles pr
+  set nome = coalesce(trim(v_dados ->> 'nome'), pr.nome),
+      whatsapp = coalesce(trim(v_dados ->> 'whatsapp'), pr.whatsapp),
+      pix_chave = coalesce(trim(v_dados ->> 'pix_chave'), pr.pix_chave),
+      pix_nome = coalesce(trim(v_dados ->> 'pix_nome'), pr.pix_nome),
+      pix_cidade = coalesce(trim(v_dados ->> 'pix_cidade'), pr.pix_cidade)
+  where pr.id = v_uid
+  returning * into p;
+
+  if v_dados ? 'whatsapp' then
+    update public.tenants tn
+    set whatsapp_numero = p.whatsapp, whatsapp = p.whatsapp
+    where tn.id = t.id
+    returning * into t;
+  end if;
+
+  return jsonb_build_object(
+    'ok', true,
+    'profile', jsonb_build_object(
+      'id', p.id, 'email', p.email, 'nome', p.nome, 'whatsapp', p.whatsapp,
+      'pix_chave', p.pix_chave, 'pix_nome', p.pix_nome, 'pix_cidade', p.pix_cidade
+    ),
+    'tenant', jsonb_build_object(
+      'id', t.id, 'nome', t.nome, 'ativo', t.ativo, 'paid_until', t.paid_until,
+      'billing_status', t.billing_status, 'whatsapp_numero', t.whatsapp_numero,
+      'pix_chave', t.pix_chave, 'pix_nome', t.pix_nome, 'pix_cidade', t.pix_cidade,
+      'whatsapp', t.whatsapp, 'owner_user_id', t.owner_user_id
+    )
+  );
+end
+$$;
+
+revoke all on function public.salvar_perfil(text, jsonb) from public;
+grant execute on function public.salvar_perfil(text, jsonb) to authenticated;
@@ -0,0 +1,188 @@
+-- ============================================================
+-- Settings por patch, com versão
+--
+-- atualizar_settings aplica só as chaves de primeiro nível enviadas em
+-- `patch` (valor null = remove a chave) em vez de regravar o JSON inteiro.
+-- tenants.settings_versao sobe a cada escrita e settings_versoes guarda, por
+-- chave, a versão em que ela mudou por último. Quem manda `versao` (a que leu)
+-- só é recusado ('conflict') se alguma das chaves do patch mudou depois dela:
+-- dois painéis/abas mexendo em chaves diferentes se juntam, na mesma chave o
+-- segundo fica sabendo em vez de apagar o primeiro.
+-- ============================================================
+
+alter table public.tenants add column if not exists settings_versao bigint not null default 0;
+alter table public.tenants add column if not exists settings_versoes jsonb not null default '{}'::jsonb;
+
+create or replace function public.atualizar_settings(
+  tenant_id text,
+  patch jsonb,
+  versao bigint default null
+)
+returns jsonb
+language plpgsql
+security definer
+set search_path = public
+as $$
+declare
+  t public.tenants%rowtype;
+  v_settings jsonb;
+  v_conflitos jsonb;
+  v_nova bigint;
+begin
+  select * into t from public.tenants
+  where id::text = atualizar_settings.tenant_id
+  for update;
+  if not found or auth.uid() is null or t.owner_user_id is distinct from auth.uid() then
+    return jsonb_build_object('ok', false, 'error', 'forbidden');
+  end if;
+
+  if jsonb_typeof(atualizar_settings.patch) is distinct from 'object' then
+    return jsonb_build_object('ok', false, 'error', 'invalid_payload');
+  end if;
+
+  if atualizar_settings.versao is not null then
+    select coalesce(jsonb_agg(k order by k), '[]'::jsonb) into v_conflitos
+    from jsonb_object_keys(atualizar_settings.patch) k
+    where coalesce((t.settings_versoes ->> k)::bigint, 0) > atualizar_settings.versao;
+
+    if jsonb_array_length(v_conflitos) > 0 then
+      return jsonb_build_object(
+        'ok', false,
+        'error', 'conflict',
+        'chaves', v_conflitos,
+        'versao', t.settings_versao
+      );
+    end if;
+  end if;
+
+  v_settings := case when jsonb_typeof(t.settings) = 'object' then t.settings else '{}'::jsonb end;
+  select v_settings
+           - coalesce(array_agg(p.key) filter (where jsonb_typeof(p.value) = 'null'), '{}')
+           || coalesce(jsonb_object_agg(p.key, p.value) filter (where jsonb_typeof(p.value) <> 'null'), '{}'::jsonb)
+  into v_settings
+  from jsonb_each(atualizar_settings.patch) p;
+
+  v_nova := t.settings_versao + 1;
+  update public.tenants tn
+  set settings = v_settings,
+      settings_versao = v_nova,
+      settings_versoes = tn.settings_versoes
+        || coalesce((select jsonb_object_agg(k, v_nova) from jsonb_object_keys(atualizar_settings.patch) k), '{}'::jsonb)
+  where tn.id = t.id;
+
+  return jsonb_build_object('ok', true, 'versao', v_nova, 'settings', v_settings);
+end
+$$;
+
+revoke all on function public.atualizar_settings(text, jsonb, bigint) from public;
+grant execute on function public.atualizar_settings(text, jsonb, bigint) to authenticated;
+
+-- admin_bootstrap passa a devolver a versão junto com os settings
+create or replace function public.admin_bootstrap(
+  fuso text default 'America/Sao_Paulo',
+  limite integer default 500
+)
+returns jsonb
+language plpgsql
+security definer
+set search_path = public
+as $$
+declare
+  v_uid uuid := auth.uid();
+  v_email text := coalesce(auth.jwt() ->> 'email', '');
+  v_agora timestamp;
+  t public.tenants%rowtype;
+  v_profile jsonb;
+  v_finalizados integer := 0;
+  v_total integer;
+  v_ultimo timestamptz;
+  v_agendamentos jsonb;
+  v_recorrentes jsonb;
+begin
+  if v_uid is null then
+    return jsonb_build_object('ok', false, 'error', 'forbidden');
+  end if;
+
+  begin
+    v_agora := now() at time zone coalesce(nullif(admin_bootstrap.fuso, ''), 'America/Sao_Paulo');
+  exception when others then
+    v_agora := now() at time zone 'America/Sao_Paulo';
+  end;
+
+  insert into public.profiles (id, email, nome, whatsapp, pix_chave, pix_nome, pix_cidade)
+  values (v_uid, v_email, '', '', '', '', '')
+  on conflict (id) do nothing;
+
+  select jsonb_build_object(
+           'id', p.id, 'email', p.email, 'nome', p.nome, 'whatsapp', p.whatsapp,
+           'pix_chave', p.pix_chave, 'pix_nome', p.pix_nome, 'pix_cidade', p.pix_cidade
+         )
+  into v_profile
+  from public.profiles p
+  where p.id = v_uid;
+
+  select * into t from public.tenants where owner_user_id = v_uid limit 1;
+  if not found then
+    return jsonb_build_object(
+      'ok', true,
+      'user', jsonb_build_object('id', v_uid, 'email', v_email),
+      'profile', v_profile,
+      'tenant', null
+    );
+  end if;
+
+  update public.agendamentos a
+  set status = 'finalizado'
+  where a.tenant_id = t.id
+    and a.status = 'pago'
+    and a.data <= v_agora::date
+    and a.horario ~ '^\d{1,2}:\d{2}$'
+    and (a.data + a.horario::time) < v_agora;
+  get diagnostics v_finalizados = row_count;
+
+  select count(*), max(a.created_at) into v_total, v_ultimo
+  from public.agendamentos a
+  where a.tenant_id = t.id;
+
+  select coalesce(jsonb_agg(to_jsonb(x) order by x.data, x.horario), '[]'::jsonb)
+  into v_agendamentos
+  from (
+    select a.id, a.cliente, a.data, a.horario, a.servico, a.status, a.valor,
+           a.created_at, a.tenant_id, a.recurso_id
+    from public.agendamentos a
+    where a.tenant_id = t.id
+    order by a.data, a.horario
+    limit greatest(coalesce(admin_bootstrap.limite, 500), 1)
+  ) x;
+
+  select coalesce(jsonb_agg(to_jsonb(r) order by r.inicio), '[]'::jsonb)
+  into v_recorrentes
+  from (
+    select r.id, r.cliente, r.servico, r.horario, r.recurso_id, r.valor, r.freq,
+           r.inicio, r.fim, r.excecoes, r.ativo
+    from public.agendamentos_recorrentes r
+    where r.tenant_id = t.id
+  ) r;
+
+  return jsonb_build_object(
+    'ok', true,
+    'user', jsonb_build_object('id', v_uid, 'email', v_email),
+    'profile', v_profile,
+    'tenant', jsonb_build_object(
+      'id', t.id, 'nome', t.nome, 'ativo', t.ativo, 'paid_until', t.paid_until,
+      'billing_status', t.billing_status, 'whatsapp_numero', t.whatsapp_numero,
+      'pix_chave', t.pix_chave, 'pix_nome', t.pix_nome, 'pix_cidade', t.pix_cidade,
+      'whatsapp', t.whatsapp, 'owner_user_id', t.owner_user_id
+    ),
+    'settings', case when jsonb_typeof(t.settings) = 'object' then t.settings else '{}'::jsonb end,
+    'settings_versao', t.settings_versao,
+    'finalizados', v_finalizados,
+    'kpis', jsonb_build_object('total', v_total, 'ultimo_criado', v_ultimo),
+    'agendamentos', v_agendamentos,
+    'recorrentes', v_recorrentes
+  );
+end
+$$;
+
+revoke all on function public.admin_bootstrap(text, integer) from public;
+grant execute on function public.admin_bootstrap(text, integer) to authenticated;
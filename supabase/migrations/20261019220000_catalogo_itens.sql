@@ -0,0 +1,168 @@
+-- ============================================================
+-- Catálogo em tabela própria (catalogo_itens)
+--
+-- Os itens saem de settings->'catalog'->'items' (que crescia a cada upload e
+-- ia junto em toda leitura de settings e no payload público do tenant); em
+-- settings fica só catalog.enabled. Os itens são lidos só quando o catálogo
+-- aparece, paginados por posicao:
+--   * dono: tabela direto (RLS);
+--   * público: catalogo_publico(tenant, de, limite), que respeita o enabled.
+-- Novo item entra no fim (trigger); reordenar é mover_item_catalogo, que troca
+-- a posição com o vizinho (dois updates numa transação).
+-- ============================================================
+
+create table if not exists public.catalogo_itens (
+  id bigint generated by default as identity primary key,
+  tenant_id uuid not null references public.tenants(id) on delete cascade,
+  posicao integer not null,
+  tipo text not null default 'image' check (tipo in ('image', 'pdf')),
+  path text not null,
+  url text not null,
+  legenda text not null default '',
+  variantes jsonb not null default '{}'::jsonb,
+  largura integer,
+  altura integer,
+  created_at timestamptz not null default now(),
+  unique (tenant_id, path)
+);
+
+create index if not exists catalogo_itens_ordem_idx
+  on public.catalogo_itens (tenant_id, posicao, id);
+
+alter table public.catalogo_itens enable row level security;
+
+drop policy if exists catalogo_itens_dono on public.catalogo_itens;
+create policy catalogo_itens_dono on public.catalogo_itens
+  for all to authenticated
+  using (exists (select 1 from public.tenants t where t.id = tenant_id and t.owner_user_id = auth.uid()))
+  with check (exists (select 1 from public.tenants t where t.id = tenant_id and t.owner_user_id = auth.uid()));
+
+grant select, insert, update, delete on public.catalogo_itens to authenticated;
+
+-- ---------- posição: novo item vai para o fim ----------
+create or replace function public.catalogo_posicao_fim()
+returns trigger
+language plpgsql
+as $$
+begin
+  if new.posicao is null then
+    select coalesce(max(c.posicao), 0) + 1 into new.posicao
+    from public.catalogo_itens c
+    where c.tenant_id = new.tenant_id;
+  end if;
+  return new;
+end
+$$;
+
+drop trigger if exists catalogo_itens_posicao on public.catalogo_itens;
+create trigger catalogo_itens_posicao
+  before insert on public.catalogo_itens
+  for each row execute function public.catalogo_posicao_fim();
+
+-- ---------- dados antigos: settings.catalog.items -> tabela ----------
+insert into public.catalogo_itens (tenant_id, posicao, tipo, path, url, legenda)
+select t.id,
+       i.ord::integer,
+       case when lower(coalesce(i.item ->> 'type', '')) = 'pdf' then 'pdf' else 'image' end,
+       trim(i.item ->> 'path'),
+       trim(i.item ->> 'url'),
+       trim(coalesce(i.item ->> 'caption', ''))
+from public.tenants t
+cross join lateral jsonb_array_elements(
+  case when jsonb_typeof(t.settings -> 'catalog' -> 'items') = 'array'
+       then t.settings -> 'catalog' -> 'items' else '[]'::jsonb end
+) with ordinality as i(item, ord)
+where jsonb_typeof(i.item) = 'object'
+  and coalesce(trim(i.item ->> 'path'), '') <> ''
+  and coalesce(trim(i.item ->> 'url'), '') <> ''
+on conflict (tenant_id, path) do nothing;
+
+update public.tenants
+set settings = jsonb_set(settings, '{catalog}', (settings -> 'catalog') - 'items')
+where jsonb_typeof(settings -> 'catalog') = 'object'
+  and settings -> 'catalog' ? 'items';
+
+-- ---------- reordenar (dono) ----------
+create or replace function public.mover_item_catalogo(item_id bigint, direcao integer)
+returns jsonb
+language plpgsql
+security definer
+set search_path = public
+as $$
+declare
+  it public.catalogo_itens%rowtype;
+  viz public.catalogo_itens%rowtype;
+begin
+  select c.* into it
+  from public.catalogo_itens c
+  join public.tenants t on t.id = c.tenant_id
+  where c.id = mover_item_catalogo.item_id
+    and t.owner_user_id = auth.uid()
+  for update of c;
+  if not found then
+    return jsonb_build_object('ok', false, 'error', 'forbidden');
+  end if;
+
+  if coalesce(mover_item_catalogo.direcao, 0) < 0 then
+    select * into viz from public.catalogo_itens c
+    where c.tenant_id = it.tenant_id and (c.posicao, c.id) < (it.posicao, it.id)
+    order by c.posicao desc, c.id desc
+    limit 1
+    for update;
+  else
+    select * into viz from public.catalogo_itens c
+    where c.tenant_id = it.tenant_id and (c.posicao, c.id) > (it.posicao, it.id)
+    order by c.posicao, c.id
+    limit 1
+    for update;
+  end if;
+  if not found then
+    return jsonb_build_object('ok', true, 'movido', false);
+  end if;
+
+  -- posições repetidas (uploads simultâneos) viram distintas na troca
+  if viz.posicao = it.posicao then
+    viz.posicao := it.posicao + sign(mover_item_catalogo.direcao)::integer;
+  end if;
+  update public.catalogo_itens set posicao = viz.posicao where id = it.id;
+  update public.catalogo_itens set posicao = it.posicao where id = viz.id;
+  return jsonb_build_object('ok', true, 'movido', true);
+end
+$$;
+
+revoke all on function public.mover_item_catalogo(bigint, integer) from public;
+grant execute on function public.mover_item_catalogo(bigint, integer) to authenticated;
+
+-- ---------- leitura pública paginada ----------
+create or replace function public.catalogo_publico(tenant_id text, de integer default 0, limite integer default 24)
+returns jsonb
+language sql
+stable
+security definer
+set search_path = public
+as $$
+  with t as (
+    select t.id
+    from public.tenants t
+    where t.id::text = catalogo_publico.tenant_id
+      and coalesce((t.settings -> 'catalog' ->> 'enabled')::boolean, true)
+  )
+  select jsonb_build_object(
+    'ok', true,
+    'total', (select count(*) from public.catalogo_itens c where c.tenant_id = (select id from t)),
+    'itens', coalesce((
+      select jsonb_agg(to_jsonb(x) order by x.posicao, x.id)
+      from (
+        select c.id, c.posicao, c.tipo, c.path, c.url, c.legenda, c.variantes, c.largura, c.altura
+        from public.catalogo_itens c
+        where c.tenant_id = (select id from t)
+        order by c.posicao, c.id
+        offset greatest(coalesce(catalogo_publico.de, 0), 0)
+        limit least(greatest(coalesce(catalogo_publico.limite, 24), 1), 100)
+      ) x
+    ), '[]'::jsonb)
+  )
+$$;
+
+revoke all on function public.catalogo_publico(text, integer, integer) from public;
+grant execute on function public.catalogo_publico(text, integer, integer) to anon, authenticated;
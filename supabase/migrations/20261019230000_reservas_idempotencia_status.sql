@@ -0,0 +1,175 @@
+-- ============================================================
+-- Idempotência da reserva presa ao agendamento
+--
+-- A chave agora é um uuid4 gerado pelo cliente por intenção de reserva (a
+-- página guarda no session_state, o widget no JS), não mais o uuid5 do
+-- conteúdo: aquela colidia entre clientes com o mesmo nome e horário e podia
+-- ser calculada por qualquer um.
+--
+-- O replay só devolve a reserva enquanto ela ainda vale: o agendamento
+-- ligado à chave precisa estar pendente (e ainda segurando o horário) ou
+-- pago, e o pedido tem que ser o mesmo (cliente, data, horário). Cancelado,
+-- expirado ou apagado: a chave é descartada e a reserva é feita de novo.
+-- A resposta devolvida traz o agendamento como está agora.
+-- ============================================================
+
+alter table public.reservas_idempotencia
+  add column if not exists agendamento_id bigint;
+
+-- chaves antigas (uuid5 do conteúdo) não têm agendamento: não valem mais
+delete from public.reservas_idempotencia where agendamento_id is null;
+
+create or replace function public.agenda_idempotencia_replay(
+  p_tenant text,
+  p_chave text,
+  p_cliente text,
+  p_data date,
+  p_horario text
+)
+returns jsonb
+language sql
+stable
+security definer
+set search_path = public
+as $$
+  select jsonb_build_object('ok', true, 'agendamento', to_jsonb(a), 'replay', true)
+  from public.reservas_idempotencia r
+  join public.agendamentos a on a.id = r.agendamento_id
+  where r.tenant_id = p_tenant
+    and r.chave = p_chave
+    and r.criado_em >= now() - make_interval(mins => public.agenda_idempotencia_min())
+    and a.tenant_id::text = p_tenant
+    and coalesce(nullif(lower(trim(a.status)), ''), 'pendente') in ('pendente', 'pago')
+    and public.agenda_bloqueia(a.status, a.created_at)
+    and lower(trim(a.cliente)) = lower(trim(p_cliente))
+    and a.data = p_data
+    and trim(a.horario) = trim(p_horario)
+$$;
+
+revoke all on function public.agenda_idempotencia_replay(text, text, text, date, text) from public;
+
+create or replace function public.reservar_horario(
+  tenant_id text,
+  cliente text,
+  data date,
+  horario text,
+  servico text,
+  valor numeric,
+  idempotency_key text default null,
+  recurso_id text default null
+)
+returns jsonb
+language plpgsql
+security definer
+set search_path = public
+as $$
+declare
+  t public.tenants%rowtype;
+  novo public.agendamentos%rowtype;
+  v_chave text := nullif(trim(coalesce(reservar_horario.idempotency_key, '')), '');
+  v_pedido text := nullif(trim(coalesce(reservar_horario.recurso_id, '')), '');
+  anterior jsonb;
+  v_out jsonb;
+  v_ini integer;
+  v_fim integer;
+  v_recursos text[];
+  v_padrao text;
+  v_candidatos text[];
+  v_rec text;
+  v_escolhido text;
+  v_cap integer;
+begin
+  select * into t from public.tenants where id::text = reservar_horario.tenant_id;
+  if not found then
+    return jsonb_build_object('ok', false, 'error', 'tenant_not_found');
+  end if;
+
+  if v_chave is not null then
+    perform pg_advisory_xact_lock(hashtext('idem|' || t.id::text || '|' || v_chave));
+
+    anterior := public.agenda_idempotencia_replay(
+      t.id::text, v_chave, reservar_horario.cliente, reservar_horario.data, reservar_horario.horario
+    );
+    if anterior is not null then
+      return anterior;
+    end if;
+  end if;
+
+  if t.ativo is false
+     or t.paid_until is null
+     or t.paid_until < current_date
+     or coalesce(t.billing_status, 'active') not in ('active', 'trial') then
+    return jsonb_build_object('ok', false, 'error', 'tenant_blocked');
+  end if;
+
+  v_ini := public.agenda_hhmm_min(reservar_horario.horario);
+  if coalesce(trim(reservar_horario.cliente), '') = '' or v_ini is null then
+    return jsonb_build_object('ok', false, 'error', 'invalid_payload');
+  end if;
+  v_fim := v_ini + public.agenda_duracao(t.settings, reservar_horario.servico);
+
+  v_cap := public.agenda_capacidade(t.settings);
+  v_recursos := public.agenda_recursos_ativos(t.settings);
+  v_padrao := v_recursos[1];
+  if v_pedido is not null then
+    if not (v_pedido = any (v_recursos)) then
+      return jsonb_build_object('ok', false, 'error', 'resource_not_found');
+    end if;
+    v_candidatos := array[v_pedido];
+  elsif cardinality(v_recursos) > 0 then
+    v_candidatos := v_recursos;
+  else
+    -- agenda única: um "recurso" nulo que colide com tudo
+    v_candidatos := array[null::text];
+  end if;
+
+  -- com duração, horários diferentes podem colidir: serializa o dia do tenant
+  perform pg_advisory_xact_lock(hashtext(t.id::text || '|' || reservar_horario.data::text));
+
+  foreach v_rec in array v_candidatos loop
+    if (
+      select count(*)
+      from public.agenda_ocupacao(t.id, reservar_horario.data) a
+      where (v_rec is null or coalesce(a.recurso_id, v_padrao) = v_rec)
+        and public.agenda_hhmm_min(a.horario) < v_fim
+        and public.agenda_hhmm_min(a.horario) + public.agenda_duracao(t.settings, a.servico) > v_ini
+    ) < v_cap then
+      v_escolhido := coalesce(v_rec, '');
+      exit;
+    end if;
+  end loop;
+
+  if v_escolhido is null then
+    return jsonb_build_object('ok', false, 'error', 'slot_taken');
+  end if;
+
+  insert into public.agendamentos (tenant_id, cliente, data, horario, servico, status, valor, recurso_id)
+  values (
+    t.id,
+    trim(reservar_horario.cliente),
+    reservar_horario.data,
+    trim(reservar_horario.horario),
+    reservar_horario.servico,
+    'pendente',
+    coalesce(reservar_horario.valor, 0),
+    nullif(v_escolhido, '')
+  )
+  returning * into novo;
+
+  v_out := jsonb_build_object('ok', true, 'agendamento', to_jsonb(novo));
+
+  if v_chave is not null then
+    delete from public.reservas_idempotencia
+    where criado_em < now() - make_interval(mins => public.agenda_idempotencia_min());
+
+    insert into public.reservas_idempotencia (tenant_id, chave, resposta, agendamento_id)
+    values (t.id::text, v_chave, v_out, novo.id)
+    on conflict on constraint reservas_idempotencia_pkey do update
+      set resposta = excluded.resposta,
+          agendamento_id = excluded.agendamento_id,
+          criado_em = excluded.criado_em;
+  end if;
+
+  return v_out;
+end
+$$;
@@ -0,0 +1,446 @@
+-- ============================================================
+-- Expediente dentro do reservar_horario
+--
+-- A página e a API só oferecem horários do calendário do tenant
+-- (agenda_disponibilidade.CalendarioSlots), mas quem chama URL_RESERVAR
+-- direto podia reservar fora do expediente, numa folga ou num feriado
+-- fechado. agenda_horario_aberto(settings, data, inicio, duracao) aplica a
+-- mesma regra no banco, lendo os mesmos settings:
+--   1. exceção por data (date_exceptions.itens): a mais curta vence, e no
+--      empate a última da lista; faixas vazias = fechado;
+--   2. feriado nacional com date_exceptions.fechar_feriados = fechado;
+--   3. semana: working_rules (faixas + step) quando ativo, senão a lista
+--      working_hours (padrão: seg-sáb 09:00, 10:00, 15:00).
+-- Nas faixas o início tem que ser um slot (início da faixa + k * step) e o
+-- atendimento (sem o intervalo) tem que terminar até o fim da faixa.
+-- Fora disso a reserva volta {"ok": false, "error": "outside_hours"}.
+--
+-- feriados_nacionais é a mesma tabela do feriados_br.csv do app: ao
+-- atualizar um, atualizar o outro.
+-- ============================================================
+
+create table if not exists public.feriados_nacionais (
+  data date primary key,
+  nome text not null
+);
+
+alter table public.feriados_nacionais enable row level security;
+
+insert into public.feriados_nacionais (data, nome) values
+  ('2024-01-01', 'Confraternização Universal'),
+  ('2024-03-29', 'Paixão de Cristo'),
+  ('2024-04-21', 'Tiradentes'),
+  ('2024-05-01', 'Dia do Trabalho'),
+  ('2024-09-07', 'Independência do Brasil'),
+  ('2024-10-12', 'Nossa Senhora Aparecida'),
+  ('2024-11-02', 'Finados'),
+  ('2024-11-15', 'Proclamação da República'),
+  ('2024-11-20', 'Dia Nacional de Zumbi e da Consciência Negra'),
+  ('2024-12-25', 'Natal'),
+  ('2025-01-01', 'Confraternização Universal'),
+  ('2025-04-18', 'Paixão de Cristo'),
+  ('2025-04-21', 'Tiradentes'),
+  ('2025-05-01', 'Dia do Trabalho'),
+  ('2025-09-07', 'Independência do Brasil'),
+  ('2025-10-12', 'Nossa Senhora Aparecida'),
+  ('2025-11-02', 'Finados'),
+  ('2025-11-15', 'Proclamação da República'),
+  ('2025-11-20', 'Dia Nacional de Zumbi e da Consciência Negra'),
+  ('2025-12-25', 'Natal'),
+  ('2026-01-01', 'Confraternização Universal'),
+  ('2026-04-03', 'Paixão de Cristo'),
+  ('2026-04-21', 'Tiradentes'),
+  ('2026-05-01', 'Dia do Trabalho'),
+  ('2026-09-07', 'Independência do Brasil'),
+  ('2026-10-12', 'Nossa Senhora Aparecida'),
+  ('2026-11-02', 'Finados'),
+  ('2026-11-15', 'Proclamação da República'),
+  ('2026-11-20', 'Dia Nacional de Zumbi e da Consciência Negra'),
+  ('2026-12-25', 'Natal'),
+  ('2027-01-01', 'Confraternização Universal'),
+  ('2027-03-26', 'Paixão de Cristo'),
+  ('2027-04-21', 'Tiradentes'),
+  ('2027-05-01', 'Dia do Trabalho'),
+  ('2027-09-07', 'Independência do Brasil'),
+  ('2027-10-12', 'Nossa Senhora Aparecida'),
+  ('2027-11-02', 'Finados'),
+  ('2027-11-15', 'Proclamação da República'),
+  ('2027-11-20', 'Dia Nacional de Zumbi e da Consciência Negra'),
+  ('2027-12-25', 'Natal'),
+  ('2028-01-01', 'Confraternização Universal'),
+  ('2028-04-14', 'Paixão de Cristo'),
+  ('2028-04-21', 'Tiradentes'),
+  ('2028-05-01', 'Dia do Trabalho'),
+  ('2028-09-07', 'Independência do Brasil'),
+  ('2028-10-12', 'Nossa Senhora Aparecida'),
+  ('2028-11-02', 'Finados'),
+  ('2028-11-15', 'Proclamação da República'),
+  ('2028-11-20', 'Dia Nacional de Zumbi e da Consciência Negra'),
+  ('2028-12-25', 'Natal'),
+  ('2029-01-01', 'Confraternização Universal'),
+  ('2029-03-30', 'Paixão de Cristo'),
+  ('2029-04-21', 'Tiradentes'),
+  ('2029-05-01', 'Dia do Trabalho'),
+  ('2029-09-07', 'Independência do Brasil'),
+  ('2029-10-12', 'Nossa Senhora Aparecida'),
+  ('2029-11-02', 'Finados'),
+  ('2029-11-15', 'Proclamação da República'),
+  ('2029-11-20', 'Dia Nacional de Zumbi e da Consciência Negra'),
+  ('2029-12-25', 'Natal'),
+  ('2030-01-01', 'Confraternização Universal'),
+  ('2030-04-19', 'Paixão de Cristo'),
+  ('2030-04-21', 'Tiradentes'),
+  ('2030-05-01', 'Dia do Trabalho'),
+  ('2030-09-07', 'Independência do Brasil'),
+  ('2030-10-12', 'Nossa Senhora Aparecida'),
+  ('2030-11-02', 'Finados'),
+  ('2030-11-15', 'Proclamação da República'),
+  ('2030-11-20', 'Dia Nacional de Zumbi e da Consciência Negra'),
+  ('2030-12-25', 'Natal'),
+  ('2031-01-01', 'Confraternização Universal'),
+  ('2031-04-11', 'Paixão de Cristo'),
+  ('2031-04-21', 'Tiradentes'),
+  ('2031-05-01', 'Dia do Trabalho'),
+  ('2031-09-07', 'Independência do Brasil'),
+  ('2031-10-12', 'Nossa Senhora Aparecida'),
+  ('2031-11-02', 'Finados'),
+  ('2031-11-15', 'Proclamação da República'),
+  ('2031-11-20', 'Dia Nacional de Zumbi e da Consciência Negra'),
+  ('2031-12-25', 'Natal'),
+  ('2032-01-01', 'Confraternização Universal'),
+  ('2032-03-26', 'Paixão de Cristo'),
+  ('2032-04-21', 'Tiradentes'),
+  ('2032-05-01', 'Dia do Trabalho'),
+  ('2032-09-07', 'Independência do Brasil'),
+  ('2032-10-12', 'Nossa Senhora Aparecida'),
+  ('2032-11-02', 'Finados'),
+  ('2032-11-15', 'Proclamação da República'),
+  ('2032-11-20', 'Dia Nacional de Zumbi e da Consciência Negra'),
+  ('2032-12-25', 'Natal'),
+  ('2033-01-01', 'Confraternização Universal'),
+  ('2033-04-15', 'Paixão de Cristo'),
+  ('2033-04-21', 'Tiradentes'),
+  ('2033-05-01', 'Dia do Trabalho'),
+  ('2033-09-07', 'Independência do Brasil'),
+  ('2033-10-12', 'Nossa Senhora Aparecida'),
+  ('2033-11-02', 'Finados'),
+  ('2033-11-15', 'Proclamação da República'),
+  ('2033-11-20', 'Dia Nacional de Zumbi e da Consciência Negra'),
+  ('2033-12-25', 'Natal'),
+  ('2034-01-01', 'Confraternização Universal'),
+  ('2034-04-07', 'Paixão de Cristo'),
+  ('2034-04-21', 'Tiradentes'),
+  ('2034-05-01', 'Dia do Trabalho'),
+  ('2034-09-07', 'Independência do Brasil'),
+  ('2034-10-12', 'Nossa Senhora Aparecida'),
+  ('2034-11-02', 'Finados'),
+  ('2034-11-15', 'Proclamação da República'),
+  ('2034-11-20', 'Dia Nacional de Zumbi e da Consciência Negra'),
+  ('2034-12-25', 'Natal'),
+  ('2035-01-01', 'Confraternização Universal'),
+  ('2035-03-23', 'Paixão de Cristo'),
+  ('2035-04-21', 'Tiradentes'),
+  ('2035-05-01', 'Dia do Trabalho'),
+  ('2035-09-07', 'Independência do Brasil'),
+  ('2035-10-12', 'Nossa Senhora Aparecida'),
+  ('2035-11-02', 'Finados'),
+  ('2035-11-15', 'Proclamação da República'),
+  ('2035-11-20', 'Dia Nacional de Zumbi e da Consciência Negra'),
+  ('2035-12-25', 'Natal'),
+  ('2036-01-01', 'Confraternização Universal'),
+  ('2036-04-11', 'Paixão de Cristo'),
+  ('2036-04-21', 'Tiradentes'),
+  ('2036-05-01', 'Dia do Trabalho'),
+  ('2036-09-07', 'Independência do Brasil'),
+  ('2036-10-12', 'Nossa Senhora Aparecida'),
+  ('2036-11-02', 'Finados'),
+  ('2036-11-15', 'Proclamação da República'),
+  ('2036-11-20', 'Dia Nacional de Zumbi e da Consciência Negra'),
+  ('2036-12-25', 'Natal'),
+  ('2037-01-01', 'Confraternização Universal'),
+  ('2037-04-03', 'Paixão de Cristo'),
+  ('2037-04-21', 'Tiradentes'),
+  ('2037-05-01', 'Dia do Trabalho'),
+  ('2037-09-07', 'Independência do Brasil'),
+  ('2037-10-12', 'Nossa Senhora Aparecida'),
+  ('2037-11-02', 'Finados'),
+  ('2037-11-15', 'Proclamação da República'),
+  ('2037-11-20', 'Dia Nacional de Zumbi e da Consciência Negra'),
+  ('2037-12-25', 'Natal'),
+  ('2038-01-01', 'Confraternização Universal'),
+  ('2038-04-21', 'Tiradentes'),
+  ('2038-04-23', 'Paixão de Cristo'),
+  ('2038-05-01', 'Dia do Trabalho'),
+  ('2038-09-07', 'Independência do Brasil'),
+  ('2038-10-12', 'Nossa Senhora Aparecida'),
+  ('2038-11-02', 'Finados'),
+  ('2038-11-15', 'Proclamação da República'),
+  ('2038-11-20', 'Dia Nacional de Zumbi e da Consciência Negra'),
+  ('2038-12-25', 'Natal'),
+  ('2039-01-01', 'Confraternização Universal'),
+  ('2039-04-08', 'Paixão de Cristo'),
+  ('2039-04-21', 'Tiradentes'),
+  ('2039-05-01', 'Dia do Trabalho'),
+  ('2039-09-07', 'Independência do Brasil'),
+  ('2039-10-12', 'Nossa Senhora Aparecida'),
+  ('2039-11-02', 'Finados'),
+  ('2039-11-15', 'Proclamação da República'),
+  ('2039-11-20', 'Dia Nacional de Zumbi e da Consciência Negra'),
+  ('2039-12-25', 'Natal'),
+  ('2040-01-01', 'Confraternização Universal'),
+  ('2040-03-30', 'Paixão de Cristo'),
+  ('2040-04-21', 'Tiradentes'),
+  ('2040-05-01', 'Dia do Trabalho'),
+  ('2040-09-07', 'Independência do Brasil'),
+  ('2040-10-12', 'Nossa Senhora Aparecida'),
+  ('2040-11-02', 'Finados'),
+  ('2040-11-15', 'Proclamação da República'),
+  ('2040-11-20', 'Dia Nacional de Zumbi e da Consciência Negra'),
+  ('2040-12-25', 'Natal')
+on conflict (data) do update set nome = excluded.nome;
+
+-- 'YYYY-MM-DD' -> date (null se inválida, sem derrubar a reserva)
+create or replace function public.agenda_data_iso(v text)
+returns date
+language plpgsql
+immutable
+as $$
+begin
+  if v is null or v !~ '^\d{4}-\d{2}-\d{2}$' then
+    return null;
+  end if;
+  return v::date;
+exception when others then
+  return null;
+end
+$$;
+
+-- [["09:00","12:00"], ...] -> faixas válidas em minutos (mesmo critério de faixas_validas)
+create or replace function public.agenda_faixas(faixas jsonb)
+returns table (ini integer, fim integer)
+language sql
+immutable
+as $$
+  select x.a, x.b
+  from (
+    select public.agenda_hhmm_min(f ->> 0) as a, public.agenda_hhmm_min(f ->> 1) as b
+    from jsonb_array_elements(case when jsonb_typeof(faixas) = 'array' then faixas else '[]'::jsonb end) as f
+    where jsonb_typeof(f) = 'array'
+  ) x
+  where x.a is not null and x.b is not null and x.a < 1440 and x.b < 1440 and x.b > x.a
+$$;
+
+create or replace function public.agenda_horario_aberto(settings jsonb, d date, inicio integer, duracao integer)
+returns boolean
+language plpgsql
+stable
+set search_path = public
+as $$
+declare
+  v_regras jsonb := settings -> 'working_rules';
+  v_exc jsonb := settings -> 'date_exceptions';
+  v_ativas boolean := jsonb_typeof(v_regras) = 'object' and (v_regras -> 'enabled') = 'true'::jsonb;
+  v_step integer := 30;
+  v_dur integer := greatest(coalesce(duracao, 1), 1);
+  v_wd text := (extract(isodow from d)::int - 1)::text;
+  v_faixas jsonb;
+  v_lista jsonb;
+begin
+  if inicio is null or d is null then
+    return false;
+  end if;
+  if v_ativas and coalesce(v_regras ->> 'step', '') ~ '^\d+$' then
+    v_step := greatest(5, (v_regras ->> 'step')::int);
+  end if;
+
+  -- 1. exceção por data
+  if jsonb_typeof(v_exc) = 'object' and jsonb_typeof(v_exc -> 'itens') = 'array' then
+    select x.faixas into v_faixas
+    from (
+      select coalesce(e.it -> 'faixas', '[]'::jsonb) as faixas,
+             least(p.de, p.ate) as de,
+             least(abs(p.ate - p.de) + 1, 400) as dias,
+             e.ord
+      from jsonb_array_elements(v_exc -> 'itens') with ordinality as e(it, ord)
+      cross join lateral (
+        select public.agenda_data_iso(e.it ->> 'de') as de,
+               coalesce(public.agenda_data_iso(e.it ->> 'ate'), public.agenda_data_iso(e.it ->> 'de')) as ate
+      ) p
+      where jsonb_typeof(e.it) = 'object' and p.de is not null
+    ) x
+    where d >= x.de and d < x.de + x.dias
+    order by x.dias, x.ord desc
+    limit 1;
+    if found then
+      return exists (
+        select 1 from public.agenda_faixas(v_faixas) f
+        where inicio >= f.ini and (inicio - f.ini) % v_step = 0
+          and inicio + v_step <= f.fim and inicio + v_dur <= f.fim
+      );
+    end if;
+  end if;
+
+  -- 2. feriado
+  if jsonb_typeof(v_exc) = 'object' and (v_exc -> 'fechar_feriados') = 'true'::jsonb
+     and exists (select 1 from public.feriados_nacionais fn where fn.data = d) then
+    return false;
+  end if;
+
+  -- 3. semana
+  if v_ativas then
+    return exists (
+      select 1 from public.agenda_faixas(v_regras -> 'days' -> v_wd) f
+      where inicio >= f.ini and (inicio - f.ini) % v_step = 0
+        and inicio + v_step <= f.fim and inicio + v_dur <= f.fim
+    );
+  end if;
+
+  if jsonb_typeof(settings -> 'working_hours') = 'object' and (settings -> 'working_hours') ? v_wd then
+    v_lista := settings -> 'working_hours' -> v_wd;
+  else
+    v_lista := case when v_wd = '6' then '[]' else '["09:00", "10:00", "15:00"]' end::jsonb;
+  end if;
+  return jsonb_typeof(v_lista) = 'array'
+     and inicio + v_dur <= 1440
+     and exists (
+       select 1 from jsonb_array_elements_text(v_lista) as h
+       where public.agenda_hhmm_min(h) = inicio
+     );
+end
+$$;
+
+create or replace function public.reservar_horario(
+  tenant_id text,
+  cliente text,
+  data date,
+  horario text,
+  servico text,
+  valor numeric,
+  idempotency_key text default null,
+  recurso_id text default null
+)
+returns jsonb
+language plpgsql
+security definer
+set search_path = public
+as $$
+declare
+  t public.tenants%rowtype;
+  novo public.agendamentos%rowtype;
+  v_chave text := nullif(trim(coalesce(reservar_horario.idempotency_key, '')), '');
+  v_pedido text := nullif(trim(coalesce(reservar_horario.recurso_id, '')), '');
+  anterior jsonb;
+  v_out jsonb;
+  v_ini integer;
+  v_fim integer;
+  v_recursos text[];
+  v_padrao text;
+  v_candidatos text[];
+  v_rec text;
+  v_escolhido text;
+  v_cap integer;
+begin
+  select * into t from public.tenants where id::text = reservar_horario.tenant_id;
+  if not found then
+    return jsonb_build_object('ok', false, 'error', 'tenant_not_found');
+  end if;
+
+  if v_chave is not null then
+    perform pg_advisory_xact_lock(hashtext('idem|' || t.id::text || '|' || v_chave));
+
+    anterior := public.agenda_idempotencia_replay(
+      t.id::text, v_chave, reservar_horario.cliente, reservar_horario.data, reservar_horario.horario
+    );
+    if anterior is not null then
+      return anterior;
+    end if;
+  end if;
+
+  if t.ativo is false
+     or t.paid_until is null
+     or t.paid_until < current_date
+     or coalesce(t.billing_status, 'active') not in ('active', 'trial') then
+    return jsonb_build_object('ok', false, 'error', 'tenant_blocked');
+  end if;
+
+  v_ini := public.agenda_hhmm_min(reservar_horario.horario);
+  if coalesce(trim(reservar_horario.cliente), '') = '' or v_ini is null then
+    return jsonb_build_object('ok', false, 'error', 'invalid_payload');
+  end if;
+  v_fim := v_ini + public.agenda_duracao(t.settings, reservar_horario.servico);
+
+  -- mesmo calendário da página (o intervalo entre atendimentos não precisa caber na faixa)
+  if not public.agenda_horario_aberto(
+    t.settings,
+    reservar_horario.data,
+    v_ini,
+    v_fim - v_ini - greatest(coalesce((t.settings ->> 'buffer_min')::int, 0), 0)
+  ) then
+    return jsonb_build_object('ok', false, 'error', 'outside_hours');
+  end if;
+
+  v_cap := public.agenda_capacidade(t.settings);
+  v_recursos := public.agenda_recursos_ativos(t.settings);
+  v_padrao := v_recursos[1];
+  if v_pedido is not null then
+    if not (v_pedido = any (v_recursos)) then
+      return jsonb_build_object('ok', false, 'error', 'resource_not_found');
+    end if;
+    v_candidatos := array[v_pedido];
+  elsif cardinality(v_recursos) > 0 then
+    v_candidatos := v_recursos;
+  else
+    -- agenda única: um "recurso" nulo que colide com tudo
+    v_candidatos := array[null::text];
+  end if;
+
+  -- com duração, horários diferentes podem colidir: serializa o dia do tenant
+  perform pg_advisory_xact_lock(hashtext(t.id::text || '|' || reservar_horario.data::text));
+
+  foreach v_rec in array v_candidatos loop
+    if (
+      select count(*)
+      from public.agenda_ocupacao(t.id, reservar_horario.data) a
+      where (v_rec is null or coalesce(a.recurso_id, v_padrao) = v_rec)
+        and public.agenda_hhmm_min(a.horario) < v_fim
+        and public.agenda_hhmm_min(a.horario) + public.agenda_duracao(t.settings, a.servico) > v_ini
+    ) < v_cap then
+      v_escolhido := coalesce(v_rec, '');
+      exit;
+    end if;
+  end loop;
+
+  if v_escolhido is null then
+    return jsonb_build_object('ok', false, 'error', 'slot_taken');
+  end if;
+
+  insert into public.agendamentos (tenant_id, cliente, data, horario, servico, status, valor, recurso_id)
+  values (
+    t.id,
+    trim(reservar_horario.cliente),
+    reservar_horario.data,
+    trim(reservar_horario.horario),
+    reservar_horario.servico,
+    'pendente',
+    coalesce(reservar_horario.valor, 0),
+    nullif(v_escolhido, '')
+  )
+  returning * into novo;
+
+  v_out := jsonb_build_object('ok', true, 'agendamento', to_jsonb(novo));
+
+  if v_chave is not null then
+    delete from public.reservas_idempotencia
+    where criado_em < now() - make_interval(mins => public.agenda_idempotencia_min());
+
+    insert into public.reservas_idempotencia (tenant_id, chave, resposta, agendamento_id)
+    values (t.id::text, v_chave, v_out, novo.id)
+    on conflict on constraint reservas_idempotencia_pkey do update
+      set resposta = excluded.resposta,
+          agendamento_id = excluded.agendamento_id,
+          criado_em = excluded.criado_em;
+  end if;
+
+  return v_out;
+end
+$$;